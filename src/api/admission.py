@@ -0,0 +1,155 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from src.config import settings
+from src.utils.logger import app_logger
+from src.utils.metrics import metrics_registry
+
+QUEUE_WAIT = metrics_registry.histogram(
+    "neurodesk_admission_queue_wait_seconds",
+    "Espera en cola hasta obtener un slot de ejecución de /chat",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+REJECTED = metrics_registry.counter(
+    "neurodesk_admission_rejected_total",
+    "Peticiones rechazadas con 429 por el control de admisión",
+    ("reason",)
+)
+
+
+class AdmissionRejected(Exception):
+    """Se traduce a 429 + Retry-After en main.py."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class AdmissionController:
+    """
+    Control de admisión para /chat:
+    1. Token bucket por usuario (ráfaga + ritmo sostenido): un usuario no puede acaparar el servicio.
+    2. Límite global de concurrencia: el exceso espera en cola hasta un deadline; si vence, 429.
+    3. Cola acotada: con la cola llena se rechaza al instante (fail fast, sin acumular sockets).
+    Todo corre en el event loop: no hace falta lock.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst: int,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        max_tracked_users: int,
+    ):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_tracked_users = max_tracked_users
+
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _take_token(self, user_id: str):
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = _Bucket(float(self.burst), now)
+            # LRU: acotamos la memoria aunque lleguen miles de user_id distintos
+            while len(self._buckets) > self.max_tracked_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        if bucket.tokens < 1.0:
+            REJECTED.inc("user_rate")
+            raise AdmissionRejected("user_rate_limited", (1.0 - bucket.tokens) / self.rate)
+        bucket.tokens -= 1.0
+
+    def _refund_token(self, user_id: str):
+        bucket = self._buckets.get(user_id)
+        if bucket is not None:
+            bucket.tokens = min(self.burst, bucket.tokens + 1.0)
+
+    async def acquire(self, user_id: str):
+        """
+        Reserva cupo del usuario + slot global. Lanza AdmissionRejected si no es posible.
+        Devuelve la función que libera el slot (idempotente: el streaming la llama desde dos sitios).
+        """
+        self._take_token(user_id)
+
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self._refund_token(user_id)
+            REJECTED.inc("queue_full")
+            raise AdmissionRejected("server_busy", self.queue_timeout)
+
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._refund_token(user_id)
+            REJECTED.inc("queue_timeout")
+            app_logger.warning(f"🚦 Admisión: {user_id} superó {self.queue_timeout}s en cola")
+            raise AdmissionRejected("server_busy", self.queue_timeout)
+        finally:
+            self.waiting -= 1
+            QUEUE_WAIT.observe(time.perf_counter() - start)
+
+        self.in_flight += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+                self._slots.release()
+        return release
+
+    @asynccontextmanager
+    async def admit(self, user_id: str):
+        release = await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "tracked_users": len(self._buckets),
+        }
+
+
+admission = AdmissionController(
+    rate_per_minute=settings.ADMISSION_USER_RATE_PER_MIN,
+    burst=settings.ADMISSION_USER_BURST,
+    max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    max_tracked_users=settings.ADMISSION_MAX_TRACKED_USERS,
+)
+
+metrics_registry.gauge("neurodesk_admission_in_flight", "Peticiones de chat ejecutándose", lambda: admission.in_flight)
+metrics_registry.gauge("neurodesk_admission_waiting", "Peticiones de chat esperando slot", lambda: admission.waiting)
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from src.config import settings
+from src.utils.logger import app_logger
+from src.utils.metrics import metrics_registry
+
+IDEMPOTENCY_EVENTS = metrics_registry.counter(
+    "neurodesk_idempotency_total",
+    "Peticiones con Idempotency-Key por resultado (executed / coalesced / replayed / conflict / not_cached)",
+    ("outcome",)
+)
+
+
+class IdempotencyConflict(Exception):
+    """La misma Idempotency-Key llegó con un cuerpo distinto (se traduce a 422)."""
+
+
+def request_fingerprint(*parts: Any) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class IdempotencyCache:
+    """
+    Deduplicación de reintentos por Idempotency-Key (ámbito: usuario + clave):
+    - Duplicados concurrentes se enganchan a la misma tarea en curso (un solo LLM call / runbook).
+    - Respuestas completadas se guardan con TTL corto: el reintento devuelve la misma respuesta sin coste.
+    - Los errores no se cachean: ni excepciones ni respuestas marcadas con is_error (errores transitorios
+      que el orquestador devuelve como ChatResponse); un reintento tras un fallo vuelve a ejecutar.
+    La tarea corre desacoplada del request: si el cliente corta por timeout, el trabajo termina
+    igualmente y su reintento recibe el resultado.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._in_flight: Dict[str, Tuple[str, asyncio.Task]] = {}
+        self._done: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+
+    async def run(self, key: str, fingerprint: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Devuelve (resultado, es_repetición)."""
+        self._purge_expired()
+
+        cached = self._done.get(key)
+        if cached is not None:
+            _, cached_fp, result = cached
+            self._check_fingerprint(cached_fp, fingerprint)
+            IDEMPOTENCY_EVENTS.inc("replayed")
+            return result, True
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            running_fp, task = in_flight
+            self._check_fingerprint(running_fp, fingerprint)
+            IDEMPOTENCY_EVENTS.inc("coalesced")
+            app_logger.info(f"🔁 Idempotency-Key en curso, reintento enganchado: {key}")
+            return await asyncio.shield(task), True
+
+        task = asyncio.create_task(work())
+        self._in_flight[key] = (fingerprint, task)
+        task.add_done_callback(lambda t: self._on_done(key, fingerprint, t))
+        IDEMPOTENCY_EVENTS.inc("executed")
+        return await asyncio.shield(task), False
+
+    def _on_done(self, key: str, fingerprint: str, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if getattr(task.result(), "is_error", False):
+            IDEMPOTENCY_EVENTS.inc("not_cached")
+            return
+        self._done[key] = (time.monotonic() + self.ttl, fingerprint, task.result())
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        # Orden de inserción == orden de expiración (TTL fijo): basta con mirar la cabeza
+        while self._done:
+            key, (expires, _, _) = next(iter(self._done.items()))
+            if expires > now:
+                break
+            self._done.popitem(last=False)
+
+    @staticmethod
+    def _check_fingerprint(expected: str, actual: str):
+        if expected != actual:
+            IDEMPOTENCY_EVENTS.inc("conflict")
+            raise IdempotencyConflict("Idempotency-Key reutilizada con un cuerpo distinto")
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._in_flight), "cached": len(self._done)}
+
+
+idempotency_cache = IdempotencyCache(
+    ttl_seconds=settings.IDEMPOTENCY_TTL,
+    max_entries=settings.IDEMPOTENCY_MAX_ENTRIES,
+)
@@ -1,13 +1,27 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, Header, HTTPException, Request, Response, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from src.api.admission import AdmissionRejected, admission
+from src.api.idempotency import IdempotencyConflict, idempotency_cache, request_fingerprint
 from src.models.messages import ChatRequest, ChatResponse
 from src.services.chat_orchestrator import orchestrator
 from src.services.audit_ledger import audit_ledger
+from src.services.data_analyst import data_analyst
+from src.services.escalation_outbox import escalation_outbox
 from src.services.voice_handler import voice_handler
+from src.services.service_registry import services
+from src.services.http_transport import http_transport
+from src.services.job_manager import job_manager
+from src.services.ticket_store import ticket_store
 from src.utils.logger import app_logger
+from src.utils.metrics import metrics_registry
+import asyncio
 import shutil
 import os
+import json
 import uuid
+from typing import Optional
 
 app = FastAPI(
     title="NeuroDesk API",
@@ -24,6 +38,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    # 429 inmediato: el cliente sabe cuándo reintentar y no ocupamos un worker esperando
+    return JSONResponse(
+        {"detail": "Demasiadas solicitudes, intenta de nuevo en unos segundos.", "reason": exc.reason},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(IdempotencyConflict)
+async def idempotency_conflict_handler(request: Request, exc: IdempotencyConflict):
+    return JSONResponse({"detail": str(exc)}, status_code=422)
+
+@app.on_event("startup")
+async def startup_event():
+    # Los servicios se construyen en paralelo en segundo plano: el proceso acepta tráfico
+    # enseguida y /ready indica cuándo están calientes. Un request temprano construye bajo demanda.
+    app.state.warmup_task = asyncio.create_task(services.warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Drenar la cola de auditoría antes de salir (write-behind); si nunca se construyó, no hay nada que drenar
+    if services.is_built("audit_ledger"):
+        audit_ledger.close()
+    # El outbox es persistente: solo paramos el worker, lo pendiente se entrega al volver a arrancar
+    if services.is_built("escalation_outbox"):
+        escalation_outbox.close()
+    if services.is_built("data_analyst"):
+        data_analyst.close()
+    if services.is_built("ticket_store"):
+        ticket_store.close()
+    await http_transport.aclose()
+
 @app.get("/")
 async def root():
     return {
@@ -32,37 +79,241 @@ async def root():
         "version": "2.0.0 (Vector + OCR + Memory)"
     }
 
+@app.get("/ready")
+async def readiness():
+    """Readiness por dependencia (cold / warming / ready / degraded / failed). 503 hasta que las críticas estén listas."""
+    status = services.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _lookup_job(job_id: str) -> dict:
+    """Job de este worker o, si lo lanzó otro, su estado en Azure. 404 solo si Azure tampoco lo conoce."""
+    try:
+        if job_manager.get(job_id) is None and job_manager.backend is None:
+            await services.aget("orchestrator")  # construye el ITAgentPlugin, que hace de backend del job manager
+        state = await job_manager.lookup(job_id)
+    except Exception as e:
+        app_logger.warning(f"⚠️ No se pudo consultar el Job {job_id} en Azure: {e}")
+        raise HTTPException(status_code=503, detail="Estado del job no disponible temporalmente")
+    if state is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return state
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Estado de un job de Automation lanzado por el agente (p.ej. self_heal_restart)."""
+    return await _lookup_job(job_id)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Progreso de un job por Server-Sent Events: "status" en cada cambio y "done" al terminar
+    (con output y ticket). Comentarios keep-alive mientras no hay novedades.
+    Si el job lo lanzó otro worker, se sondea su estado en Azure (sin output ni ticket).
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        state = await _lookup_job(job_id)
+        return StreamingResponse(
+            _remote_job_stream(job_id, state),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    queue = job_manager.subscribe(job_id)
+
+    async def event_stream():
+        try:
+            if job.done.done():
+                yield _sse("done", job.to_dict())
+                return
+            yield _sse("status", job.to_dict())
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event, data)
+                if event == "done":
+                    break
+        finally:
+            job_manager.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _remote_job_stream(job_id: str, state: dict):
+    """SSE de un job de otro worker: sondeo del estado en Azure hasta que sea terminal."""
+    yield _sse("done" if state["finished"] else "status", state)
+    while not state["finished"]:
+        await asyncio.sleep(job_manager.max_delay)
+        try:
+            latest = await job_manager.lookup(job_id)
+        except Exception as e:
+            app_logger.warning(f"⚠️ Fallo sondeando el Job {job_id} en Azure: {e}")
+            yield ": keep-alive\n\n"
+            continue
+        if latest is None:
+            return
+        if latest["finished"]:
+            yield _sse("done", latest)
+            return
+        if latest["status"] != state["status"]:
+            yield _sse("status", latest)
+        else:
+            yield ": keep-alive\n\n"
+        state = latest
+
+@app.get("/transport/stats")
+async def transport_stats():
+    """Utilización de los pools HTTP compartidos (Azure SDK + OpenAI)."""
+    return http_transport.stats()
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """Estado del control de admisión (en curso, en cola, usuarios con bucket) y de la caché de idempotencia."""
+    return {**admission.stats(), "idempotency": idempotency_cache.stats()}
+
+@app.get("/sessions/stats")
+async def sessions_stats():
+    """Contabilidad de memoria conversacional (sesiones, bytes, expulsiones)."""
+    return (await services.aget("orchestrator")).session_stats()
+
+@app.get("/hr/status")
+async def hr_data_status():
+    """Versión, ETag y antigüedad del dataset HR servido, y resultado del último refresco."""
+    return (await services.aget("data_analyst")).data_status()
+
+@app.get("/hr/risk")
+def hr_workforce_risk(
+    group_by: str = "department",
+    department: Optional[str] = None,
+    manager: Optional[str] = None,
+    top: int = 10,
+    days: int = 7,
+):
+    """
+    Riesgo de burnout agregado por departamento o manager (vista de equipo con ?manager=...).
+    Síncrono a propósito: la consulta agregada a Cosmos es bloqueante y FastAPI lo ejecuta en el threadpool.
+    """
+    result = data_analyst.get_workforce_risk(
+        group_by=group_by, department=department, manager=manager, top=max(0, min(top, 100)), days=max(1, days)
+    )
+    if "error" in result:
+        status = 503 if result["error"] == "HR Database Offline" else (400 if result["error"].startswith("group_by") else 404)
+        raise HTTPException(status_code=status, detail=result["error"])
+    return result
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Métricas del proceso en formato texto de Prometheus:
+    latencia por etapa (safety, sentiment, intent, llm, herramientas, auditoría, voz, Cosmos, búsqueda)
+    y gauges de sesiones activas y profundidad de colas.
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(
+    request: ChatRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
+):
     """
     Endpoint principal de chat.
     Maneja texto, memoria conversacional y auditoría.
+    Con cabecera Idempotency-Key, los reintentos del cliente no repiten el turno.
     """
+    if not idempotency_key:
+        return await _run_chat(request)
+
+    # La huella se calcula ANTES de generar el conversation_id: un reintento sin id debe coincidir
+    fingerprint = request_fingerprint(request.message, request.conversation_id)
+    # Se resuelve antes de la admisión: un duplicado no consume cupo ni slot
+    result, replayed = await idempotency_cache.run(
+        f"{request.user_id}:{idempotency_key}", fingerprint, lambda: _run_chat(request)
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def _run_chat(request: ChatRequest) -> ChatResponse:
     # 1. Generar ID de conversación si no viene
     if not request.conversation_id:
         request.conversation_id = str(uuid.uuid4())
 
     app_logger.info(f"📩 Mensaje recibido. User: {request.user_id} | Session: {request.conversation_id}")
-    
-    try:
-        # 2. Procesar con el Orquestador (Cerebro)
-        # El orquestador ya maneja RAG, Tools y HR internamente
-        response = await orchestrator.process_message(request)
-        
-        # 3. Auditoría (Escribir en Cosmos DB)
-        # Esto ocurre en segundo plano (fire & forget) idealmente, aquí síncrono para seguridad
-        audit_ledger.log_transaction(
-            user_id=request.user_id,
-            request_text=request.message,
-            response_obj=response,
-            context_id=request.conversation_id
-        )
-        
-        return response
 
-    except Exception as e:
-        app_logger.error(f"💥 Error no controlado en API: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    # 2. Admisión: cupo del usuario + slot global (429 con Retry-After si no hay)
+    async with admission.admit(request.user_id):
+        try:
+            # 3. Procesar con el Orquestador (Cerebro)
+            # El orquestador ya maneja RAG, Tools y HR internamente
+            # En frío, la construcción de los servicios ocurre fuera del event loop (services.aget)
+            orchestrator_service = await services.aget("orchestrator")
+            response = await orchestrator_service.process_message(request)
+            
+            # 4. Auditoría (Escribir en Cosmos DB)
+            # Solo encola: el Ledger escribe en segundo plano por lotes (write-behind)
+            (await services.aget("audit_ledger")).log_transaction(
+                user_id=request.user_id,
+                request_text=request.message,
+                response_obj=response,
+                context_id=request.conversation_id
+            )
+            
+            return response
+
+        except Exception as e:
+            app_logger.error(f"💥 Error no controlado en API: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Variante streaming de /chat (Server-Sent Events).
+    Emite tokens a medida que llegan, eventos de progreso de herramientas
+    y un frame final "done" con el mismo ChatResponse que /chat.
+    """
+    if not request.conversation_id:
+        request.conversation_id = str(uuid.uuid4())
+
+    app_logger.info(f"📩 Mensaje (stream) recibido. User: {request.user_id} | Session: {request.conversation_id}")
+
+    # La admisión se decide antes de abrir el stream (el 429 debe ser una respuesta normal).
+    # El slot se libera al terminar el generador o, si nunca llegó a iterarse, en la tarea de fondo.
+    release = await admission.acquire(request.user_id)
+
+    async def event_stream():
+        try:
+            orchestrator_service = await services.aget("orchestrator")
+            async for event, data in orchestrator_service.process_message_stream(request):
+                if event == "done":
+                    data["conversation_id"] = request.conversation_id
+                    (await services.aget("audit_ledger")).log_transaction(
+                        user_id=request.user_id,
+                        request_text=request.message,
+                        response_obj=ChatResponse(**data),
+                        context_id=request.conversation_id
+                    )
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            app_logger.error(f"💥 Error no controlado en stream: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        finally:
+            release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release)
+    )
 
 @app.post("/chat/voice")
 async def voice_chat_endpoint(
@@ -74,6 +325,9 @@ async def voice_chat_endpoint(
     Recibe audio (.wav), transcribe, procesa y responde con audio + texto.
     """
     temp_filename = f"temp_{uuid.uuid4()}.wav"
+
+    # Misma admisión que /chat (STT + LLM + TTS ocupan un slot)
+    release = await admission.acquire(user_id)
     
     try:
         # 1. Guardar archivo temporalmente
@@ -81,7 +335,8 @@ async def voice_chat_endpoint(
             shutil.copyfileobj(file.file, buffer)
 
         # 2. STT: Audio -> Texto
-        transcribed_text = await voice_handler.transcribe_audio(temp_filename)
+        voice = await services.aget("voice_handler")
+        transcribed_text = await voice.transcribe_audio(temp_filename)
         app_logger.info(f"🗣️ Audio transcrito: {transcribed_text}")
 
         if not transcribed_text or "No pude entender" in transcribed_text:
@@ -99,10 +354,10 @@ async def voice_chat_endpoint(
         )
 
         # 4. Procesar (Igual que endpoint de texto)
-        chat_res = await orchestrator.process_message(chat_req)
+        chat_res = await (await services.aget("orchestrator")).process_message(chat_req)
         
-        # 5. Auditoría
-        audit_ledger.log_transaction(
+        # 5. Auditoría (encolada, no bloquea)
+        (await services.aget("audit_ledger")).log_transaction(
             user_id=user_id,
             request_text=f"[VOICE] {transcribed_text}",
             response_obj=chat_res,
@@ -110,7 +365,7 @@ async def voice_chat_endpoint(
         )
 
         # 6. TTS: Respuesta Texto -> Audio
-        audio_response_b64 = await voice_handler.text_to_speech(chat_res.response)
+        audio_response_b64 = await voice.text_to_speech(chat_res.response)
 
         return {
             "response": chat_res.response,
@@ -126,6 +381,7 @@ async def voice_chat_endpoint(
         app_logger.error(f"❌ Error en voice endpoint: {e}")
         return {"error": str(e)}
     finally:
+        release()
         # Limpieza
         if os.path.exists(temp_filename):
             os.remove(temp_filename)
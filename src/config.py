@@ -18,12 +18,14 @@ class Settings:
     HR_DATA_PATH: Path = DATA_DIR / "hr_data_enriched.csv"
     TICKETS_DATA_PATH: Path = DATA_DIR / "synthetic_tickets.csv"
     POLICIES_PATH: Path = DATA_DIR / "policies.txt"
+    INTENT_PATTERNS_PATH: Path = Path(os.getenv("INTENT_PATTERNS_PATH", str(DATA_DIR / "intent_patterns.json")))
 
     # --- AZURE OPENAI ---
     AOAI_ENDPOINT: str = os.getenv("AZURE_OPENAI_ENDPOINT", "")
     AOAI_KEY: str = os.getenv("AZURE_OPENAI_API_KEY", "")
     AOAI_DEPLOYMENT: str = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-5-chat")
     AOAI_EMBEDDING: str = os.getenv("AZURE_OPENAI_EMBEDDING_NAME", "text-embedding-3-small")
+    AOAI_API_VERSION: str = os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01")
     
     # --- AZURE AI SEARCH (RAG) ---
     SEARCH_ENDPOINT: str = os.getenv("AZURE_SEARCH_ENDPOINT", "")
@@ -39,6 +41,19 @@ class Settings:
     COSMOS_DB_NAME: str = "NeuroDeskDB"
     COSMOS_CONTAINER_LOGS: str = "AuditLogs"
     COSMOS_CONTAINER_TICKETS: str = "Tickets"
+    COSMOS_CONTAINER_SESSIONS: str = "Sessions"
+
+    # Contadores de tickets por usuario/día (perfil de riesgo sin consultar Cosmos)
+    TICKET_COUNTERS_RETENTION_DAYS: int = int(os.getenv("TICKET_COUNTERS_RETENTION_DAYS", "30"))
+    # Cada cuánto se leen del change feed los tickets escritos por otras instancias (0 = solo al arrancar)
+    TICKET_COUNTERS_SYNC_INTERVAL: float = float(os.getenv("TICKET_COUNTERS_SYNC_INTERVAL", "60"))
+
+    # --- AUDITORÍA (Write-Behind) ---
+    AUDIT_QUEUE_MAX: int = int(os.getenv("AUDIT_QUEUE_MAX", "5000"))
+    AUDIT_BATCH_SIZE: int = int(os.getenv("AUDIT_BATCH_SIZE", "50"))
+    AUDIT_FLUSH_INTERVAL: float = float(os.getenv("AUDIT_FLUSH_INTERVAL", "2.0"))
+    AUDIT_MAX_RETRIES: int = int(os.getenv("AUDIT_MAX_RETRIES", "4"))
+    AUDIT_SPILL_PATH: Path = Path(os.getenv("AUDIT_SPILL_PATH", str(BASE_DIR / "logs" / "audit_spill.jsonl")))
 
     # --- AZURE CONTENT SAFETY ---
     SAFETY_ENDPOINT: str = os.getenv("CONTENT_SAFETY_ENDPOINT", "")
@@ -50,6 +65,80 @@ class Settings:
     LANGUAGE_ENDPOINT: str = os.getenv("AZURE_LANGUAGE_ENDPOINT", "")
     LANGUAGE_KEY: str = os.getenv("AZURE_LANGUAGE_KEY", "")
 
+    # --- MEMORIA CONVERSACIONAL (Sesiones) ---
+    SESSION_MAX_SESSIONS: int = int(os.getenv("SESSION_MAX_SESSIONS", "2000"))
+    SESSION_IDLE_TTL: float = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+    SESSION_MAX_MESSAGES: int = int(os.getenv("SESSION_MAX_MESSAGES", "80"))
+    SESSION_MAX_BYTES: int = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024)))
+    # Si se define, las sesiones expulsadas se guardan aquí y se rehidratan al volver
+    SESSION_SNAPSHOT_DIR: str = os.getenv("SESSION_SNAPSHOT_DIR", "")
+    # Estado compartido entre workers/nodos: "memory" (solo proceso), "sqlite" (mismo nodo) o "cosmos" (red)
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "memory")
+    SESSION_SQLITE_PATH: Path = Path(os.getenv("SESSION_SQLITE_PATH", str(BASE_DIR / "logs" / "sessions.db")))
+
+    # --- COMPACTACIÓN DEL PROMPT (Presupuesto de tokens) ---
+    HISTORY_TOKEN_BUDGET: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+    HISTORY_KEEP_RECENT_TURNS: int = int(os.getenv("HISTORY_KEEP_RECENT_TURNS", "3"))
+    HISTORY_TOOL_RESULT_MAX_CHARS: int = int(os.getenv("HISTORY_TOOL_RESULT_MAX_CHARS", "600"))
+    HISTORY_SUMMARY_MAX_TOKENS: int = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+
+    # --- ETAPAS PRE-LLM (Safety + Sentimiento) ---
+    PRECHECK_MAX_WORKERS: int = int(os.getenv("PRECHECK_MAX_WORKERS", "8"))
+
+    # --- JOBS DE AUTOMATION (sondeo asíncrono con backoff adaptativo) ---
+    JOBS_POLL_MIN_DELAY: float = float(os.getenv("JOBS_POLL_MIN_DELAY", "1.0"))
+    JOBS_POLL_MAX_DELAY: float = float(os.getenv("JOBS_POLL_MAX_DELAY", "10.0"))
+    JOBS_MAX_TRACKED: int = int(os.getenv("JOBS_MAX_TRACKED", "1000"))
+    # Ventana en la que un reinicio exitoso se reutiliza en lugar de lanzar otro (single-flight)
+    JOBS_COALESCE_COOLDOWN: float = float(os.getenv("JOBS_COALESCE_COOLDOWN", "300"))
+    # Logs de actividad: fresco hasta TTL, servido en stale (con refresco en segundo plano) hasta MAX_STALE
+    ACTIVITY_LOGS_CACHE_TTL: float = float(os.getenv("ACTIVITY_LOGS_CACHE_TTL", "120"))
+    ACTIVITY_LOGS_MAX_STALE: float = float(os.getenv("ACTIVITY_LOGS_MAX_STALE", "900"))
+
+    # --- DATASET HR (refresco en segundo plano con ETag) ---
+    HR_REFRESH_INTERVAL: float = float(os.getenv("HR_REFRESH_INTERVAL", "300"))
+    # Reintento más frecuente mientras no haya ningún snapshot cargado
+    HR_REFRESH_RETRY_INTERVAL: float = float(os.getenv("HR_REFRESH_RETRY_INTERVAL", "30"))
+    # Snapshot columnar local (.npy por columna, memmap al arrancar). Vacío = desactivado.
+    HR_SNAPSHOT_DIR: str = os.getenv("HR_SNAPSHOT_DIR", str(BASE_DIR / "logs" / "hr_snapshot"))
+
+    # --- OUTBOX DE ESCALADOS (Logic App, entrega garantizada) ---
+    OUTBOX_PATH: Path = Path(os.getenv("OUTBOX_PATH", str(BASE_DIR / "logs" / "escalation_outbox.db")))
+    OUTBOX_DEAD_LETTER_PATH: Path = Path(os.getenv("OUTBOX_DEAD_LETTER_PATH", str(BASE_DIR / "logs" / "escalation_dead_letter.jsonl")))
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+    OUTBOX_POLL_INTERVAL: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "2.0"))
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+    OUTBOX_MAX_BACKOFF: float = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+    OUTBOX_HTTP_TIMEOUT: float = float(os.getenv("OUTBOX_HTTP_TIMEOUT", "10"))
+    # Reserva de un lote por un worker (varios procesos comparten el fichero); debe cubrir un lote completo
+    OUTBOX_CLAIM_TTL: float = float(os.getenv("OUTBOX_CLAIM_TTL", "300"))
+
+    # --- CONTROL DE ADMISIÓN (/chat) ---
+    ADMISSION_USER_RATE_PER_MIN: float = float(os.getenv("ADMISSION_USER_RATE_PER_MIN", "20"))
+    ADMISSION_USER_BURST: int = int(os.getenv("ADMISSION_USER_BURST", "5"))
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5.0"))
+    ADMISSION_MAX_TRACKED_USERS: int = int(os.getenv("ADMISSION_MAX_TRACKED_USERS", "10000"))
+
+    # --- IDEMPOTENCIA (/chat, cabecera Idempotency-Key) ---
+    IDEMPOTENCY_TTL: float = float(os.getenv("IDEMPOTENCY_TTL", "300"))
+    IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "5000"))
+
+    # --- TRANSPORTE HTTP COMPARTIDO (pools keep-alive) ---
+    HTTP_POOL_CONNECTIONS: int = int(os.getenv("HTTP_POOL_CONNECTIONS", "16"))  # hosts con pool propio
+    HTTP_POOL_MAXSIZE: int = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))  # conexiones por host
+    HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "30"))
+    # Tokens AAD: se renuevan en segundo plano cuando les quedan menos de N segundos
+    AAD_TOKEN_REFRESH_MARGIN: float = float(os.getenv("AAD_TOKEN_REFRESH_MARGIN", "300"))
+
+    # --- ARRANQUE (servicios perezosos + warm-up en paralelo) ---
+    # Tiempo máximo que el warm-up espera antes de loguear los servicios pendientes (siguen calentándose)
+    SERVICE_WARMUP_TIMEOUT: float = float(os.getenv("SERVICE_WARMUP_TIMEOUT", "60"))
+    # Presupuesto de `import src.api.main` (segundos) para src/scripts/check_import_budget.py
+    IMPORT_BUDGET_SECONDS: float = float(os.getenv("IMPORT_BUDGET_SECONDS", "5.0"))
+
     # --- AZURE AUTOMATION ---
     SUBSCRIPTION_ID: str = os.getenv("AZURE_SUBSCRIPTION_ID", "")
     AUTOMATION_RG: str = os.getenv("AUTOMATION_RESOURCE_GROUP", "")
@@ -16,4 +16,6 @@ class ChatResponse(BaseModel):
     actions_taken: List[str] = []
     ui_component: Optional[Dict[str, Any]] = None 
     next_steps: List[str] = []
+    # Respuesta de error transitorio (IA / herramientas): el cliente puede reintentar y no se cachea por Idempotency-Key
+    is_error: bool = False
     timestamp: datetime = Field(default_factory=datetime.now)
\ No newline at end of file
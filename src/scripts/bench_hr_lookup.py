@@ -0,0 +1,104 @@
+"""
+Benchmark de búsqueda de empleados en DataAnalyst.
+Compara el filtrado histórico (máscara booleana sobre Email y luego EmpID + iloc[0])
+con HRSnapshot (índices hash construidos una vez + columnas en arrays) sobre un dataset sintético.
+
+Uso: python -m src.scripts.bench_hr_lookup [filas] [consultas]
+"""
+import sys
+import time
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+from src.services.hr_snapshot import HRSnapshot
+
+DEPARTMENTS = ["Production", "IT/IS", "Sales", "Admin Offices", "Software Engineering", "Executive Office"]
+POSITIONS = ["Production Technician I", "Production Technician II", "Area Sales Manager", "Database Admin", "Software Engineer"]
+MANAGERS = [f"Manager {i}" for i in range(200)]
+
+def synthetic_hr(rows: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ids = np.arange(100000, 100000 + rows)
+    return pd.DataFrame({
+        "Employee_Name": [f"Empleado {i}" for i in ids],
+        "EmpID": ids,
+        "Position": rng.choice(POSITIONS, rows),
+        "Department": rng.choice(DEPARTMENTS, rows),
+        "ManagerName": rng.choice(MANAGERS, rows),
+        "EmpSatisfaction": rng.integers(1, 6, rows).astype(float),
+        "SpecialProjectsCount": rng.integers(0, 9, rows),
+        "LastPerformanceReview_Date": "1/17/2019",
+        "Absences": rng.integers(0, 21, rows),
+        "Email": [f"Empleado.{i}@Empresa.com " for i in ids],
+        "Average_Monthly_Hours": rng.normal(175, 30, rows).round(1),
+    })
+
+def legacy_prepare(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df["EmpID"] = df["EmpID"].astype(str)
+    df["Email"] = df["Email"].str.lower().str.strip()
+    return df
+
+def legacy_lookup(df_hr: pd.DataFrame, user_identifier: str) -> dict:
+    """Copia del get_employee_metrics original (referencia)."""
+    user_identifier = str(user_identifier).lower().strip()
+    user = df_hr[df_hr["Email"] == user_identifier]
+    if user.empty:
+        user = df_hr[df_hr["EmpID"] == user_identifier]
+    if user.empty:
+        return {"error": "User Not Found"}
+    row = user.iloc[0]
+    return {
+        "name": row.get("Employee_Name", "N/A"),
+        "position": row.get("Position", "N/A"),
+        "department": row.get("Department", "N/A"),
+        "manager": row.get("ManagerName", "N/A"),
+        "satisfaction": float(row.get("EmpSatisfaction", 3.0)),
+        "projects": int(row.get("SpecialProjectsCount", 0)),
+        "monthly_hours": float(row.get("Average_Monthly_Hours", 160.0)),
+        "last_review": row.get("LastPerformanceReview_Date", "N/A"),
+        "absences": int(row.get("Absences", 0)),
+    }
+
+def indexed_lookup(snapshot: HRSnapshot, user_identifier: str) -> dict:
+    row = snapshot.find(user_identifier)
+    return {"error": "User Not Found"} if row is None else snapshot.record(row).to_metrics()
+
+def run(rows: int, queries: int):
+    print(f"\n--- ⏱️ BENCHMARK HR LOOKUP ({rows:,} filas) ---")
+    df = synthetic_hr(rows)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, rows, queries)
+    # Mezcla realista: la mitad por email (con mayúsculas/espacios), la mitad por EmpID, y algún desconocido
+    sample = [f"  EMPLEADO.{100000 + i}@empresa.com" if k % 2 else str(100000 + i) for k, i in enumerate(picks)]
+    sample.append("nadie@empresa.com")
+
+    start = time.perf_counter()
+    df_legacy = legacy_prepare(df)
+    legacy_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    snapshot = HRSnapshot.from_dataframe(df)
+    index_build = time.perf_counter() - start
+    print(f"Preparación  legacy (normalizar columnas): {legacy_build:6.2f} s | HRSnapshot (arrays + índices): {index_build:6.2f} s")
+
+    mismatches = [q for q in sample[:50] if legacy_lookup(df_legacy, q) != indexed_lookup(snapshot, q)]
+    print("✅ Resultados idénticos en la muestra." if not mismatches else f"⚠️ Diferencias: {mismatches[:5]}")
+
+    # El filtrado es O(n) por consulta: con 1M filas medimos pocas repeticiones
+    legacy_n = max(1, min(len(sample), 20 if rows >= 500_000 else 200))
+    legacy_t = timeit.timeit(lambda: [legacy_lookup(df_legacy, q) for q in sample[:legacy_n]], number=1) / legacy_n
+    indexed_t = timeit.timeit(lambda: [indexed_lookup(snapshot, q) for q in sample], number=5) / (5 * len(sample))
+
+    print(f"{'legacy (máscara booleana)':<28} {legacy_t * 1e6:12.1f} µs/consulta")
+    print(f"{'HRSnapshot (índice hash)':<28} {indexed_t * 1e6:12.1f} µs/consulta  (x{legacy_t / indexed_t:,.0f})")
+
+if __name__ == "__main__":
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 2000,
+    )
@@ -0,0 +1,82 @@
+"""
+Benchmark de arranque del dataset HR: CSV completo vs snapshot columnar local (memmap).
+Genera un CSV sintético con el esquema ancho de hr_data_enriched.csv y mide, en procesos limpios:
+  - legacy:   pd.read_csv de todas las columnas (dtypes object) + índices
+  - csv:      HRSnapshot.from_csv (solo columnas usadas, categóricas)
+  - snapshot: HRSnapshot.load desde .npy con memmap (lo que hace el arranque con caché por ETag)
+Reporta tiempo de carga, RSS tras cargar y 1000 consultas.
+
+Uso: python -m src.scripts.bench_hr_snapshot [filas]
+"""
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(ROOT))
+from src.scripts.bench_hr_lookup import synthetic_hr
+
+# Columnas del fichero real que get_employee_metrics no usa (se parsean igual en el camino legacy)
+EXTRA_COLUMNS = [
+    "MarriedID", "MaritalStatusID", "GenderID", "EmpStatusID", "DeptID", "PerfScoreID", "FromDiversityJobFairID",
+    "Salary", "Termd", "PositionID", "State", "Zip", "DOB", "Sex", "MaritalDesc", "CitizenDesc", "HispanicLatino",
+    "RaceDesc", "DateofHire", "DateofTermination", "TermReason", "EmploymentStatus", "ManagerID",
+    "RecruitmentSource", "PerformanceScore", "EngagementSurvey", "DaysLateLast30",
+]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import numpy as np, pandas as pd
+from src.services.hr_snapshot import HRSnapshot
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096 / 2**20
+
+mode, path, snap_dir = {mode!r}, {csv!r}, {snap!r}
+base = rss_mb()
+t0 = time.perf_counter()
+if mode == "legacy":
+    df = pd.read_csv(path)
+    df["EmpID"] = df["EmpID"].astype(str)
+    df["Email"] = df["Email"].str.lower().str.strip()
+    snapshot = HRSnapshot.from_dataframe(df)
+elif mode == "csv":
+    snapshot = HRSnapshot.from_csv(path)
+else:
+    from pathlib import Path
+    snapshot = HRSnapshot.load(Path(snap_dir))
+elapsed = time.perf_counter() - t0
+ids = np.random.default_rng(3).integers(100000, 100000 + len(snapshot), 1000)
+for i in ids:
+    snapshot.record(snapshot.find(str(i)))
+print("@@" + json.dumps({{"elapsed": elapsed, "rss_mb": rss_mb() - base}}))
+"""
+
+def probe(mode: str, csv: Path, snap: Path) -> dict:
+    code = PROBE.format(root=str(ROOT), mode=mode, csv=str(csv), snap=str(snap))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(next(l for l in out.splitlines() if l.startswith("@@"))[2:])
+
+def run(rows: int):
+    from src.services.hr_snapshot import HRSnapshot
+
+    print(f"\n--- ⏱️ BENCHMARK ARRANQUE HR ({rows:,} filas) ---")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv, snap = Path(tmp) / "hr.csv", Path(tmp) / "snapshot"
+        df = synthetic_hr(rows)
+        for i, name in enumerate(EXTRA_COLUMNS):
+            df[name] = f"valor-{i}"
+        df.to_csv(csv, index=False)
+        HRSnapshot.from_csv(csv, etag="bench").save(snap)
+        print(f"CSV {csv.stat().st_size / 2**20:.0f} MB | snapshot {sum(p.stat().st_size for p in snap.iterdir()) / 2**20:.0f} MB")
+
+        for mode, label in (("legacy", "CSV completo (legacy)"), ("csv", "CSV solo columnas usadas"), ("snapshot", "snapshot .npy (memmap)")):
+            r = probe(mode, csv, snap)
+            print(f"{label:<26} carga {r['elapsed']:7.2f} s | RSS +{r['rss_mb']:7.1f} MB")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,69 @@
+"""
+Micro-benchmark del motor de intenciones.
+Compara el coste por mensaje del detector histórico (~30 re.search + barrido de urgencia)
+con el IntentEngine precompilado (un único barrido).
+
+Uso: python -m src.scripts.bench_intent_engine [iteraciones]
+"""
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+from src.services.intent_engine import intent_engine
+
+SAMPLE_MESSAGES = [
+    "Hola, buenos días",
+    "El portal Nexo-Emprendedor está muy lento y no responde, necesito reiniciar urgente",
+    "¿Quién tocó la configuración? Quiero ver el historial de cambios de seguridad",
+    "Quiero hablar con un humano, el agente no me ayuda",
+    "Necesito subir una captura de pantalla como evidencia del error",
+    "¿Cuántos días me corresponden por mudanza según la política?",
+    "La app se quedó congelada otra vez, está caída desde las 9",
+    "Estoy agotado, llevo semanas con sobrecarga de proyectos y nadie responde mis tickets " * 3,
+]
+
+def legacy_detect(message: str) -> dict:
+    """Copia del _detect_critical_intent original (referencia)."""
+    message_lower = message.lower()
+    restart_patterns = [
+        r'\blento\b', r'\breiniciar\b', r'\bno funciona\b', r'\bbloqueado\b',
+        r'\bcongelado\b', r'\bcaído\b', r'\bhang\b', r'\bfreeze\b',
+        r'\bslow\b', r'\brestart\b', r'\bcaido\b', r'\bno responde\b'
+    ]
+    upload_patterns = [
+        r'\blogs\b', r'\bsubir\b', r'\barchivo\b', r'\bevidencia\b',
+        r'\bcaptura\b', r'\bscreenshot\b', r'\bupload\b', r'\bfoto\b'
+    ]
+    audit_patterns = [
+        r'\bauditoría\b', r'\bquién tocó\b', r'\bcambios\b', r'\bseguridad\b',
+        r'\bactividad\b', r'\bhistorial\b', r'\bquien hizo\b'
+    ]
+    human_patterns = [
+        r'\bhumano\b', r'\bpersona\b', r'\bagente\b', r'\boperador\b',
+        r'\bsupervisor\b', r'\bgerente\b', r'\bhablar con\b'
+    ]
+    return {
+        "needs_restart": any(re.search(p, message_lower) for p in restart_patterns),
+        "needs_upload": any(re.search(p, message_lower) for p in upload_patterns),
+        "needs_audit": any(re.search(p, message_lower) for p in audit_patterns),
+        "needs_human": any(re.search(p, message_lower) for p in human_patterns),
+        "urgency": "high" if any(w in message_lower for w in ["urgente", "crítico", "critico", "emergencia", "ya", "inmediato"]) else "normal"
+    }
+
+def run(iterations: int):
+    print(f"\n--- ⏱️ BENCHMARK INTENT ENGINE ({iterations} iteraciones x {len(SAMPLE_MESSAGES)} mensajes) ---")
+
+    mismatches = [m for m in SAMPLE_MESSAGES if legacy_detect(m) != intent_engine.detect(m)]
+    for m in mismatches:
+        print(f"⚠️ Diferencia (esperable en acentos / 'ya' como subcadena): {m[:60]!r}")
+        print(f"   legacy={legacy_detect(m)}\n   engine={intent_engine.detect(m)}")
+
+    total_msgs = iterations * len(SAMPLE_MESSAGES)
+    for name, fn in (("legacy (re.search x30)", legacy_detect), ("IntentEngine (1 barrido)", intent_engine.detect)):
+        elapsed = timeit.timeit(lambda: [fn(m) for m in SAMPLE_MESSAGES], number=iterations)
+        print(f"{name:<28} {elapsed / total_msgs * 1e6:8.2f} µs/mensaje")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,73 @@
+"""
+Benchmark del scoring de riesgo de burnout sobre toda la plantilla.
+Compara el camino histórico (un get_contextual_risk_profile por empleado: registro + ifs en Python,
+sin contar la consulta a Cosmos por persona) con el scoring vectorizado de risk_scoring
+(reglas sobre columnas NumPy + agregados por departamento y manager con bincount).
+
+Uso: python -m src.scripts.bench_risk_scoring [filas]
+"""
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+from src.scripts.bench_hr_lookup import synthetic_hr
+from src.services.hr_snapshot import HRSnapshot
+from src.services.risk_scoring import LEVELS, level_codes, rollup, score_arrays, score_employee
+
+def per_employee(snapshot: HRSnapshot, tickets: np.ndarray) -> dict:
+    """Equivalente a N llamadas a get_contextual_risk_profile + agregado en Python."""
+    groups = defaultdict(lambda: {"employees": 0, "score": 0, "critical": 0})
+    for row in range(len(snapshot)):
+        record = snapshot.record(row)
+        score, level, _ = score_employee(record.satisfaction, record.monthly_hours, int(tickets[row]))
+        group = groups[record.department]
+        group["employees"] += 1
+        group["score"] += score
+        group["critical"] += level == "CRITICAL"
+    return groups
+
+def vectorized(snapshot: HRSnapshot, tickets: np.ndarray) -> list:
+    c = snapshot.columns
+    scores = score_arrays(c["EmpSatisfaction"], c["Average_Monthly_Hours"], tickets)
+    levels = level_codes(scores)
+    departments = c["Department"]
+    return rollup(departments.codes, departments.categories, scores, levels, c["EmpSatisfaction"], c["Average_Monthly_Hours"])
+
+def run(rows: int):
+    print(f"\n--- ⏱️ BENCHMARK SCORING DE RIESGO ({rows:,} empleados) ---")
+    df = synthetic_hr(rows)
+    # Algo más de sobrecarga que el sintético base para que haya los tres niveles
+    df["Average_Monthly_Hours"] = df["Average_Monthly_Hours"] + 15
+    snapshot = HRSnapshot.from_dataframe(df)
+    tickets = np.random.default_rng(5).poisson(1.2, rows).astype(np.int32)
+
+    start = time.perf_counter()
+    legacy = per_employee(snapshot, tickets)
+    legacy_t = time.perf_counter() - start
+
+    vectorized(snapshot, tickets)  # calentamiento
+    runs = 10
+    start = time.perf_counter()
+    for _ in range(runs):
+        groups = vectorized(snapshot, tickets)
+    vector_t = (time.perf_counter() - start) / runs
+
+    same = all(
+        legacy[g["name"]]["employees"] == g["employees"]
+        and legacy[g["name"]]["critical"] == g["critical"]
+        and round(legacy[g["name"]]["score"] / g["employees"], 1) == g["avg_risk_score"]
+        for g in groups
+    ) and len(groups) == len(legacy)
+    print("✅ Agregados idénticos por departamento." if same else "⚠️ Los agregados no coinciden.")
+
+    levels = level_codes(score_arrays(snapshot.columns["EmpSatisfaction"], snapshot.columns["Average_Monthly_Hours"], tickets))
+    print("Niveles: " + ", ".join(f"{name} {n:,}" for name, n in zip(LEVELS, np.bincount(levels, minlength=len(LEVELS)))))
+    print(f"{'por empleado (Python)':<24} {legacy_t * 1e3:10.1f} ms  (+1 consulta Cosmos por empleado en producción)")
+    print(f"{'vectorizado (NumPy)':<24} {vector_t * 1e3:10.1f} ms  (x{legacy_t / vector_t:,.0f})")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,71 @@
+"""
+Guardián del tiempo de import (cold start).
+Importa `src.api.main` en un intérprete limpio y falla (exit 1) si:
+  - el import supera el presupuesto (IMPORT_BUDGET_SECONDS, por defecto 5s), o
+  - algún servicio se construyó durante el import (deben ser perezosos: ver service_registry).
+Con fallo, lista los módulos más lentos según `python -X importtime`.
+
+Uso: python -m src.scripts.check_import_budget [presupuesto_segundos]
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(ROOT))
+from src.config import settings
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import src.api.main
+elapsed = time.perf_counter() - t0
+from src.services.service_registry import services
+built = [n for n, s in services.status()["services"].items() if s["state"] != "cold"]
+print("@@" + json.dumps({"elapsed": elapsed, "built": built}))
+"""
+
+def run_probe() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    line = next(l for l in out.splitlines() if l.startswith("@@"))
+    return json.loads(line[2:])
+
+def slowest_imports(top: int = 10):
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.api.main"],
+        cwd=ROOT, capture_output=True, text=True
+    ).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # Formato: "import time: <propio us> | <acumulado us> | <módulo>"
+        self_us, cumulative_us, name = [p.strip() for p in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+def main(budget: float) -> int:
+    # El primer import calienta la caché de bytecode: medimos el segundo (arranque real de un contenedor ya construido)
+    run_probe()
+    result = run_probe()
+
+    print(f"⏱️ import src.api.main: {result['elapsed']:.2f}s (presupuesto {budget:.2f}s)")
+    failed = False
+    if result["built"]:
+        print(f"❌ Servicios construidos durante el import (deben ser perezosos): {result['built']}")
+        failed = True
+    if result["elapsed"] > budget:
+        print("❌ Presupuesto de import superado. Módulos más lentos (acumulado):")
+        for cumulative_us, self_us, name in slowest_imports():
+            print(f"   {cumulative_us / 1000:8.1f} ms  (propio {self_us / 1000:7.1f} ms)  {name}")
+        failed = True
+
+    if not failed:
+        print("✅ Import dentro del presupuesto y sin servicios construidos.")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(float(sys.argv[1]) if len(sys.argv) > 1 else settings.IMPORT_BUDGET_SECONDS))
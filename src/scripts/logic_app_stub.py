@@ -0,0 +1,74 @@
+"""
+Sustituto local de la Logic App de escalados, para probar el outbox sin Azure.
+Acepta POST en cualquier ruta, registra el payload y responde 202 (como el trigger HTTP real),
+con latencia y fallos configurables para ejercitar reintentos y dead-letter.
+
+Uso: python -m src.scripts.logic_app_stub [--port 7071] [--delay 0] [--fail-rate 0] [--fail-status 503]
+Luego: LOGIC_APP_URL=http://127.0.0.1:7071/escalate
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def build_handler(delay: float, fail_rate: float, fail_status: int):
+    received = {"ok": 0, "failed": 0}
+
+    class LogicAppStub(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+            if delay:
+                time.sleep(delay)
+
+            if random.random() < fail_rate:
+                received["failed"] += 1
+                self._reply(fail_status, {"error": "fallo simulado"})
+                print(f"❌ [{fail_status}] {body[:200].decode('utf-8', 'replace')}")
+                return
+
+            received["ok"] += 1
+            self._reply(202, {"accepted": True})
+            try:
+                payload = json.loads(body)
+                print(f"✅ [202] #{received['ok']} ticket={payload.get('ticket_id')} user={payload.get('user_id')} urgencia={payload.get('urgency')}")
+            except ValueError:
+                print(f"✅ [202] #{received['ok']} (cuerpo no JSON)")
+
+        def _reply(self, status: int, data: dict):
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("x-ms-request-id", f"stub-{random.randint(100000, 999999)}")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # ya imprimimos una línea por petición
+
+    return LogicAppStub
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Logic App local para probar el outbox de escalados")
+    parser.add_argument("--port", type=int, default=7071)
+    parser.add_argument("--delay", type=float, default=0.0, help="Latencia simulada por petición (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Proporción de peticiones que fallan (0-1)")
+    parser.add_argument("--fail-status", type=int, default=503, help="Código HTTP de los fallos simulados")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), build_handler(args.delay, args.fail_rate, args.fail_status))
+    server.daemon_threads = True
+    print(f"--- 🧪 LOGIC APP STUB en http://127.0.0.1:{args.port} (delay={args.delay}s, fail_rate={args.fail_rate}) ---")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,59 @@
+import json
+import os
+import threading
 import uuid
+from collections import deque, defaultdict
 from datetime import datetime
+from typing import Any, Deque, Dict, List
 from azure.cosmos import CosmosClient, PartitionKey
 from src.config import settings
 from src.utils.logger import app_logger
+from src.services.http_transport import http_transport
+from src.services.service_registry import services
+from src.utils.metrics import metrics_registry, time_stage
 
 class AuditLedger:
+    """
+    Ledger de auditoría con escritura diferida (write-behind).
+    Las peticiones solo encolan el registro; un hilo de fondo lo vuelca en Cosmos DB
+    por lotes agrupados por partición (/user_id).
+    Lo que no se pudo escribir (overflow, fallo definitivo, apagado) va al spill file y el worker
+    lo reencola al arrancar: las escrituras son upserts por id, así que reenviar un registro es inocuo.
+    """
+
     def __init__(self):
+        self.container = None
+
+        # Cola acotada + condición para despertar al worker
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._stopping = False
+        self._shutdown = threading.Event()  # interrumpe las esperas de reintento al apagar
+        self._in_flight: List[Dict[str, Any]] = []
+        self._worker = None
+
+        self.queue_max = settings.AUDIT_QUEUE_MAX
+        self.batch_size = settings.AUDIT_BATCH_SIZE
+        self.flush_interval = settings.AUDIT_FLUSH_INTERVAL
+        self.max_retries = settings.AUDIT_MAX_RETRIES
+        self.spill_path = settings.AUDIT_SPILL_PATH
+
+        self.stats = {"enqueued": 0, "written": 0, "spilled": 0, "retries": 0, "replayed": 0}
+        metrics_registry.gauge("neurodesk_audit_queue_depth", "Registros de auditoría pendientes de escribir", self.queue_depth)
+        metrics_registry.gauge("neurodesk_audit_spilled_records", "Registros de auditoría desviados al fichero de spill", lambda: self.stats["spilled"])
+
         if not settings.COSMOS_CONN_STR:
             app_logger.warning("⚠️ Cosmos DB no configurado. La auditoría no se guardará.")
-            self.container = None
             return
 
         try:
             # Cliente Cosmos DB
-            self.client = CosmosClient.from_connection_string(settings.COSMOS_CONN_STR)
+            self.client = CosmosClient.from_connection_string(
+                settings.COSMOS_CONN_STR, transport=http_transport.azure_transport()
+            )
             self.database = self.client.create_database_if_not_exists(id=settings.COSMOS_DB_NAME)
-            
+
             # Contenedor de Logs (Partition Key: /user_id para búsquedas rápidas por empleado)
             self.container = self.database.create_container_if_not_exists(
                 id=settings.COSMOS_CONTAINER_LOGS,
@@ -25,10 +63,14 @@ class AuditLedger:
         except Exception as e:
             app_logger.error(f"❌ Error conectando Audit Ledger: {e}")
             self.container = None
+            return
+
+        self._start_worker()
 
     def log_transaction(self, user_id: str, request_text: str, response_obj: object, context_id: str = None):
         """
-        Guarda una transacción inmutable en el Ledger.
+        Encola una transacción inmutable para el Ledger. No bloquea la respuesta:
+        la escritura real en Cosmos DB la hace el worker en segundo plano.
         """
         if not self.container: return
 
@@ -52,10 +94,158 @@ class AuditLedger:
             "audit_version": "2.0"
         }
 
+        self._enqueue(record)
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def close(self, timeout: float = 10.0):
+        """
+        Drena la cola al apagar la app: se espera al worker (que deja de reintentar) antes de volcar
+        a disco lo que no alcanzó a escribirse, incluido el lote que tuviera en curso.
+        """
+        if not self._worker: return
+
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._shutdown.set()
+        self._worker.join(timeout=timeout)
+
+        with self._cond:
+            pending = list(self._queue)
+            self._queue.clear()
+        if self._worker.is_alive():
+            # Bloqueado en una escritura: su lote también va a disco (si acaba escribiéndose, el replay es un upsert)
+            app_logger.warning("⚠️ Audit Ledger: timeout drenando la cola, volcando pendientes a disco.")
+            pending = list(self._in_flight) + pending
+        if pending:
+            self._spill(pending, reason="shutdown")
+        app_logger.info(f"📕 Audit Ledger cerrado. Stats: {self.stats}")
+
+    # --- Internos ---
+
+    def _enqueue(self, record: Dict[str, Any]):
+        with self._cond:
+            if self._stopping or len(self._queue) >= self.queue_max:
+                overflow = True
+            else:
+                overflow = False
+                self._queue.append(record)
+                self.stats["enqueued"] += 1
+                if len(self._queue) >= self.batch_size:
+                    self._cond.notify()
+
+        # Política de overflow: nunca bloqueamos, derramamos a disco (append-only)
+        if overflow:
+            self._spill([record], reason="overflow")
+
+    def _start_worker(self):
+        self._worker = threading.Thread(target=self._run_worker, name="audit-writer", daemon=True)
+        self._worker.start()
+
+    def _run_worker(self):
+        self._replay_spill()
+        while True:
+            with self._cond:
+                # Una sola espera: lote completo, apagado o, como mucho, un flush_interval con lo que haya
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._queue) >= self.batch_size, timeout=self.flush_interval
+                )
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                done = self._stopping and not self._queue
+                self._in_flight = batch
+
+            if batch:
+                self._flush(batch)
+                self._in_flight = []
+            if done:
+                return
+
+    def _replay_spill(self):
+        """
+        Reencola el spill file de ejecuciones anteriores. El fichero se renombra antes de leerlo (os.replace
+        es atómico): con varios workers compartiendo la ruta, cada registro lo reencola uno solo.
+        Se recogen también los ficheros de un replay que se cortó a medias.
+        """
+        claimed = self.spill_path.with_name(f"{self.spill_path.name}.replay-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        sources = [self.spill_path, *self.spill_path.parent.glob(f"{self.spill_path.name}.replay-*")]
+        replayed = 0
+        for source in sources:
+            try:
+                os.replace(source, claimed)
+            except OSError:
+                continue  # no existe o ya lo reclamó otro worker
+            try:
+                with open(claimed, encoding="utf-8") as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+                for record in records:
+                    record.pop("spill_reason", None)
+                    self._enqueue(record)
+                replayed += len(records)
+                claimed.unlink()
+            except Exception as e:
+                app_logger.error(f"❌ No se pudo reencolar el spill de auditoría {claimed}: {e}")
+                return
+        if replayed:
+            self.stats["replayed"] += replayed
+            app_logger.info(f"♻️ {replayed} registros de auditoría reencolados desde {self.spill_path}.")
+
+    def _flush(self, batch: List[Dict[str, Any]]):
+        # Agrupamos por partición para mantener las escrituras de un mismo usuario contiguas
+        partitions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for record in batch:
+            partitions[record["user_id"]].append(record)
+
+        for user_id, records in partitions.items():
+            self._write_partition(user_id, records)
+
+    def _write_partition(self, user_id: str, records: List[Dict[str, Any]]):
+        pending = records
+        delay = 0.5
+
+        for attempt in range(self.max_retries + 1):
+            failed = []
+            last_error = None
+            for record in pending:
+                try:
+                    # upsert => reintentos idempotentes (mismo id)
+                    with time_stage("audit_write"):
+                        self.container.upsert_item(body=record)
+                    self.stats["written"] += 1
+                except Exception as e:
+                    failed.append(record)
+                    last_error = e
+
+            if not failed:
+                app_logger.info(f"📝 {len(records)} transacciones auditadas en Cosmos DB (user {user_id}).")
+                return
+
+            pending = failed
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                app_logger.warning(f"⚠️ Fallo escribiendo Ledger ({len(failed)} registros), reintento en {delay:.1f}s: {last_error}")
+                if self._shutdown.wait(delay):
+                    # Apagando: sin más reintentos, el lote va al spill y se reenvía en el próximo arranque
+                    self._spill(pending, reason="shutdown")
+                    return
+                delay = min(delay * 2, 30.0)
+
+        app_logger.error(f"❌ Fallo definitivo al escribir en Ledger ({len(pending)} registros): {last_error}")
+        self._spill(pending, reason="write_failed")
+
+    def _spill(self, records: List[Dict[str, Any]], reason: str):
         try:
-            self.container.create_item(body=record)
-            app_logger.info(f"📝 Transacción auditada en Cosmos DB: {record['id']}")
+            with self._spill_lock:
+                self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps({"spill_reason": reason, **record}, ensure_ascii=False) + "\n")
+            self.stats["spilled"] += len(records)
+            app_logger.warning(f"💾 {len(records)} registros de auditoría derramados a {self.spill_path} ({reason}).")
         except Exception as e:
-            app_logger.error(f"❌ Fallo al escribir en Ledger: {e}")
+            app_logger.critical(f"💥 No se pudo derramar auditoría a disco: {e}")
 
-audit_ledger = AuditLedger()
\ No newline at end of file
+audit_ledger = services.register("audit_ledger", AuditLedger, ready_check=lambda s: s.container is not None)
@@ -1,36 +1,116 @@
 from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureChatPromptExecutionSettings
 from semantic_kernel.connectors.ai.function_choice_behavior import FunctionChoiceBehavior
-from semantic_kernel.contents import ChatHistory
+from semantic_kernel.contents import ChatHistory, AuthorRole, FunctionCallContent
 from semantic_kernel.exceptions import ServiceResponseException
-from semantic_kernel.functions import KernelArguments
-import re
-from typing import Dict
+from semantic_kernel.filters.functions.function_invocation_context import FunctionInvocationContext
+from semantic_kernel.functions import FunctionResult, KernelArguments
+from openai import AsyncAzureOpenAI
+import asyncio
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 
 from src.config import settings
 from src.services.safety_guard import safety_guard
 from src.services.sentiment_analyzer import sentiment_analyzer
 from src.models.messages import ChatRequest, ChatResponse
+from src.services.history_compactor import build_history_compactor
+from src.services.http_transport import http_transport
+from src.services.intent_engine import intent_engine
+from src.services.service_registry import services
+from src.services.session_store import build_session_store
+from src.services.turn_context import TurnContext, current_turn
 from src.utils.logger import app_logger
+from src.utils.metrics import metrics_registry, observe_stage, time_stage
 
 # Plugins
 from src.services.plugins.hr_plugin import HRAgentPlugin
 from src.services.plugins.it_plugin import ITAgentPlugin
 from src.services.plugins.policy_plugin import PolicyAgentPlugin
+from src.services.plugins.tool_result import ToolResult
+
+# Etiquetas de progreso para el modo streaming (eventos SSE "tool_start")
+TOOL_PROGRESS_LABELS = {
+    "ITAgent-self_heal_restart": "Ejecutando runbook de reinicio...",
+    "ITAgent-get_activity_logs": "Ejecutando runbook de auditoría...",
+    "ITAgent-generate_upload_link": "Generando enlace seguro de carga...",
+    "ITAgent-escalate_to_human": "Escalando a un agente humano...",
+    "HRAgent-analyze_workload_metrics": "Consultando métricas de RRHH...",
+    "PolicyAgent-check_corporate_policy": "Buscando en políticas corporativas...",
+}
+
+# Telemetría por herramienta (alimentada por el filtro de invocación)
+TOOL_DURATION = metrics_registry.histogram(
+    "neurodesk_tool_duration_seconds",
+    "Duración de cada invocación de herramienta (plugin-función)",
+    ("tool", "status"),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+TOOL_RESULT_BYTES = metrics_registry.histogram(
+    "neurodesk_tool_result_bytes",
+    "Tamaño del resultado devuelto por cada herramienta",
+    ("tool",),
+    buckets=(64, 256, 1024, 4096, 16384, 65536)
+)
+PROMPT_HISTORY_TOKENS = metrics_registry.histogram(
+    "neurodesk_prompt_history_tokens",
+    "Tokens del historial por turno: completo (full) y enviado al LLM tras compactar (sent)",
+    ("stage",),
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+)
+COMPACTION_TOKENS_SAVED = metrics_registry.histogram(
+    "neurodesk_compaction_tokens_saved",
+    "Tokens ahorrados por la compactación del historial en cada turno",
+    buckets=(0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+COMPACTION_EVENTS = metrics_registry.counter(
+    "neurodesk_compaction_events_total",
+    "Efectos de la compactación por turno (summary_used / summarized_turns / collapsed_tool_results)",
+    ("kind",)
+)
+
+def _hash_arguments(arguments) -> str:
+    # Huella estable de los argumentos: permite agrupar llamadas repetidas sin loguear datos personales
+    try:
+        payload = json.dumps(dict(arguments or {}), sort_keys=True, default=str)
+    except Exception:
+        payload = repr(arguments)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
 
 class ChatOrchestrator:
     def __init__(self):
         self.kernel = Kernel()
         
-        # Diccionario en memoria para mantener el historial de conversaciones
+        # Store de sesiones (LRU + TTL, acotado) para el historial de conversaciones
         # Key: conversation_id (o user_id si no hay conv_id), Value: ChatHistory
-        self._memories: Dict[str, ChatHistory] = {}
+        self._sessions = build_session_store()
+
+        # Compactación del prompt: presupuesto de tokens + resumen incremental por sesión
+        self._compactor = build_history_compactor()
+
+        # Pool acotado para los clientes síncronos de Azure (Content Safety, Language):
+        # sus round-trips no deben bloquear el event loop de uvicorn.
+        self._precheck_pool = ThreadPoolExecutor(
+            max_workers=settings.PRECHECK_MAX_WORKERS,
+            thread_name_prefix="precheck"
+        )
         
+        # Cliente OpenAI sobre el pool httpx compartido (mismo formato de URL que construye SK)
+        openai_client = AsyncAzureOpenAI(
+            base_url=f"{settings.AOAI_ENDPOINT.rstrip('/')}/openai/deployments/{settings.AOAI_DEPLOYMENT}",
+            api_version=settings.AOAI_API_VERSION,
+            api_key=settings.AOAI_KEY,
+            http_client=http_transport.async_httpx,
+        )
         chat_service = AzureChatCompletion(
             service_id="chat-gpt",
             deployment_name=settings.AOAI_DEPLOYMENT,
             endpoint=settings.AOAI_ENDPOINT,
             api_key=settings.AOAI_KEY,
+            async_client=openai_client,
         )
         self.kernel.add_service(chat_service)
         
@@ -39,50 +119,101 @@ class ChatOrchestrator:
         self.kernel.add_plugin(ITAgentPlugin(), plugin_name="ITAgent")
         self.kernel.add_plugin(PolicyAgentPlugin(), plugin_name="PolicyAgent")
 
+        # Gauges leídos en el scrape de /metrics
+        self._active_turns = 0
+        metrics_registry.gauge("neurodesk_active_sessions", "Sesiones conversacionales en memoria", lambda: self._sessions.stats()["sessions"])
+        metrics_registry.gauge("neurodesk_active_turns", "Turnos de chat en curso", lambda: self._active_turns)
+        metrics_registry.gauge("neurodesk_precheck_backlog", "Pre-chequeos (safety/sentiment) esperando hilo", self._precheck_pool._work_queue.qsize)
+
+        # Filtros de invocación (el último registrado es el más externo):
+        # telemetría (el más interno, mide solo la herramienta) + progreso + captura de payloads de UI
+        self.kernel.add_filter("function_invocation", self._tool_telemetry_filter)
+        self.kernel.add_filter("function_invocation", self._tool_progress_filter)
+        self.kernel.add_filter("function_invocation", self._tool_result_filter)
+
+    async def _tool_telemetry_filter(self, context: FunctionInvocationContext, next):
+        tool_name = context.function.fully_qualified_name
+        args_hash = _hash_arguments(context.arguments)
+        success = False
+        start = time.perf_counter()
+        try:
+            await next(context)
+            success = True
+        finally:
+            duration = time.perf_counter() - start
+            value = context.result.value if context.result else None
+            result_size = len(str(value).encode("utf-8")) if value is not None else 0
+            status = "ok" if success else "error"
+
+            TOOL_DURATION.observe(duration, tool_name, status)
+            TOOL_RESULT_BYTES.observe(result_size, tool_name)
+
+            record = {
+                "tool": tool_name,
+                "args_hash": args_hash,
+                "duration_ms": round(duration * 1000, 1),
+                "success": success,
+                "result_size": result_size,
+            }
+            turn = current_turn.get()
+            if turn:
+                turn.tool_calls.append(record)
+            app_logger.info(f"🔧 Tool {tool_name} [{status}] {record['duration_ms']} ms, {result_size} bytes (args {args_hash})")
+
+    async def _tool_progress_filter(self, context: FunctionInvocationContext, next):
+        turn = current_turn.get()
+        tool_name = context.function.fully_qualified_name
+
+        if turn:
+            turn.emit("tool_start", {
+                "tool": tool_name,
+                "label": TOOL_PROGRESS_LABELS.get(tool_name, f"Ejecutando {tool_name}...")
+            })
+            # Cedemos el loop para que el evento salga antes de ejecutar la herramienta
+            await asyncio.sleep(0)
+
+        status = "error"
+        try:
+            await next(context)
+            status = "ok"
+        finally:
+            if turn:
+                turn.emit("tool_end", {"tool": tool_name, "status": status})
+
+    async def _tool_result_filter(self, context: FunctionInvocationContext, next):
+        await next(context)
+
+        value = context.result.value if context.result else None
+        if not isinstance(value, ToolResult):
+            return
+
+        turn = current_turn.get()
+        if turn and value.system_data:
+            turn.ui_component = value.system_data
+            app_logger.info(f"🎨 UI Component capturado: {value.system_data.get('type')}")
+
+        # El LLM (y el historial) solo ven el texto; el payload estructurado no viaja
+        context.result = FunctionResult(
+            function=context.function.metadata,
+            value=value.text,
+            metadata=context.result.metadata
+        )
+
     def _detect_critical_intent(self, message: str) -> dict:
         """
         Detección heurística para logging y cálculo de riesgo, 
         pero NO para forzar al LLM (evita alucinaciones).
+        Un único barrido con el motor precompilado (ver intent_engine).
         """
-        message_lower = message.lower()
-        
-        restart_patterns = [
-            r'\blento\b', r'\breiniciar\b', r'\bno funciona\b', r'\bbloqueado\b',
-            r'\bcongelado\b', r'\bcaído\b', r'\bhang\b', r'\bfreeze\b', 
-            r'\bslow\b', r'\brestart\b', r'\bcaido\b', r'\bno responde\b'
-        ]
-        
-        upload_patterns = [
-            r'\blogs\b', r'\bsubir\b', r'\barchivo\b', r'\bevidencia\b',
-            r'\bcaptura\b', r'\bscreenshot\b', r'\bupload\b', r'\bfoto\b'
-        ]
-        
-        audit_patterns = [
-            r'\bauditoría\b', r'\bquién tocó\b', r'\bcambios\b', r'\bseguridad\b',
-            r'\bactividad\b', r'\bhistorial\b', r'\bquien hizo\b'
-        ]
-        
-        human_patterns = [
-            r'\bhumano\b', r'\bpersona\b', r'\bagente\b', r'\boperador\b',
-            r'\bsupervisor\b', r'\bgerente\b', r'\bhablar con\b'
-        ]
-        
-        detected_intent = {
-            "needs_restart": any(re.search(pattern, message_lower) for pattern in restart_patterns),
-            "needs_upload": any(re.search(pattern, message_lower) for pattern in upload_patterns),
-            "needs_audit": any(re.search(pattern, message_lower) for pattern in audit_patterns),
-            "needs_human": any(re.search(pattern, message_lower) for pattern in human_patterns),
-            "urgency": "high" if any(word in message_lower for word in ["urgente", "crítico", "critico", "emergencia", "ya", "inmediato"]) else "normal"
-        }
-        
-        return detected_intent
+        return intent_engine.detect(message)
 
     def _get_or_create_history(self, session_key: str, user_name: str) -> ChatHistory:
         """
         Recupera el historial existente o crea uno nuevo con el System Prompt.
         """
-        if session_key in self._memories:
-            return self._memories[session_key]
+        history = self._sessions.get(session_key)
+        if history is not None:
+            return history
         
         # Inicializar nuevo historial con System Prompt optimizado
         history = ChatHistory()
@@ -111,10 +242,62 @@ class ChatOrchestrator:
         """
         
         history.add_system_message(system_prompt)
-        self._memories[session_key] = history
+        self._sessions.put(session_key, history)
         return history
 
-    async def process_message(self, request: ChatRequest) -> ChatResponse:
+    def session_stats(self) -> Dict[str, int]:
+        return {**self._sessions.stats(), **self._compactor.stats()}
+
+    async def _prompt_view(self, session_key: str, history: ChatHistory, chat_service) -> ChatHistory:
+        """Vista compactada del historial para el LLM (el historial completo queda intacto)."""
+        with time_stage("compaction"):
+            view, report = await self._compactor.compact(session_key, history, chat_service)
+        self._observe_compaction(report)
+        return view
+
+    @staticmethod
+    def _observe_compaction(report: Dict[str, Any]):
+        PROMPT_HISTORY_TOKENS.observe(report["tokens_full"], "full")
+        PROMPT_HISTORY_TOKENS.observe(report["tokens_sent"], "sent")
+        COMPACTION_TOKENS_SAVED.observe(report["tokens_saved"])
+        if report["summarized_turns"]:
+            COMPACTION_EVENTS.inc("summary_used")
+            COMPACTION_EVENTS.inc("summarized_turns", amount=report["summarized_turns"])
+        if report["collapsed_tool_results"]:
+            COMPACTION_EVENTS.inc("collapsed_tool_results", amount=report["collapsed_tool_results"])
+
+    @staticmethod
+    def _observe_llm(start: float, turn: TurnContext):
+        # El auto function calling ejecuta las herramientas dentro de la llamada: las descontamos
+        tool_seconds = sum(call["duration_ms"] for call in turn.tool_calls) / 1000
+        observe_stage("llm", max(time.perf_counter() - start - tool_seconds, 0.0))
+
+    @staticmethod
+    def _merge_turn(history: ChatHistory, view: ChatHistory, view_len: int):
+        # SK añade a la vista las llamadas y resultados de herramientas del turno: los llevamos al historial real
+        for msg in view.messages[view_len:]:
+            history.add_message(msg)
+
+    async def _session_io(self, fn, *args):
+        # Backends compartidos (SQLite/Cosmos) hacen I/O bloqueante: fuera del event loop
+        if not self._sessions.blocking_io:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _execution_settings(self) -> AzureChatPromptExecutionSettings:
+        # Configuración de ejecución con Auto Function Calling
+        return AzureChatPromptExecutionSettings(
+            service_id="chat-gpt",
+            temperature=0.5, # Bajamos temperatura para ser más precisos con las herramientas
+            max_tokens=800,
+            function_choice_behavior=FunctionChoiceBehavior.Auto()
+        )
+
+    async def _prepare_turn(self, request: ChatRequest) -> Tuple[Optional[ChatResponse], Dict[str, Any]]:
+        """
+        Etapas previas al LLM (ruido, Sentinel, sentimiento, intención).
+        Devuelve (respuesta_temprana, estado_del_turno); si hay respuesta temprana, el turno termina ahí.
+        """
         app_logger.info(f"📨 Procesando mensaje de {request.user_id} (ConvID: {request.conversation_id})")
 
         # 1. Identificador de Sesión
@@ -123,11 +306,23 @@ class ChatOrchestrator:
 
         # 2. FILTRO DE RUIDO
         if len(request.message.strip()) < 2:
-             return ChatResponse(response="Hola, soy NeuroDesk. ¿En qué puedo ayudarte hoy?", is_safe=True)
+             return ChatResponse(response="Hola, soy NeuroDesk. ¿En qué puedo ayudarte hoy?", is_safe=True), {}
+
+        # 3. SENTINEL + SENTIMENT (en paralelo, fuera del event loop)
+        # Los atributos de los proxies se resuelven dentro del executor: en frío, construir el servicio
+        # (o esperar al warm-up) no debe bloquear el loop
+        loop = asyncio.get_running_loop()
+        safety_future = loop.run_in_executor(self._precheck_pool, lambda: safety_guard.is_safe(request.message))
+        sentiment_future = loop.run_in_executor(self._precheck_pool, lambda: sentiment_analyzer.analyze(request.message))
+
+        # 4. INTENT (Heurística): CPU pura y barata, corre en el loop mientras tanto
+        with time_stage("intent"):
+            intent = self._detect_critical_intent(request.message)
 
-        # 3. SENTINEL (Safety Guard)
-        safety = safety_guard.is_safe(request.message)
+        safety = await safety_future
         if not safety["safe"]:
+            # El sentimiento ya no hace falta: lo cancelamos (si aún no arrancó, ni se ejecuta)
+            sentiment_future.cancel()
             app_logger.warning(f"🛑 Bloqueo Sentinel: {safety['reason']}")
             return ChatResponse(
                 response=f"🛑 El mensaje ha sido bloqueado por protocolos de seguridad ética: {safety['reason']}",
@@ -135,115 +330,189 @@ class ChatOrchestrator:
                 sentiment="Negative",
                 risk_level="High",
                 actions_taken=["Bloqueado por Sentinel"]
-            )
+            ), {}
 
-        # 4. SENTIMENT & INTENT (Heurística)
-        sentiment_result = sentiment_analyzer.analyze(request.message)
+        sentiment_result = await sentiment_future
         user_sentiment = sentiment_result["sentiment"]
-        intent = self._detect_critical_intent(request.message)
         
         app_logger.info(f"❤️ Sentimiento: {user_sentiment} | 🎯 Intención Heurística: {intent}")
 
-        # 5. GESTIÓN DE MEMORIA Y ORQUESTACIÓN
-        chat_service = self.kernel.get_service("chat-gpt")
-        
+        # 5. GESTIÓN DE MEMORIA
         # Recuperar historial
-        history = self._get_or_create_history(session_key, request.user_id)
+        history = await self._session_io(self._get_or_create_history, session_key, request.user_id)
         
         # Añadir mensaje del usuario al historial
         history.add_user_message(request.message)
 
-        # Configuración de ejecución con Auto Function Calling
-        execution_settings = AzureChatPromptExecutionSettings(
-            service_id="chat-gpt",
-            temperature=0.5, # Bajamos temperatura para ser más precisos con las herramientas
-            max_tokens=800,
-            function_choice_behavior=FunctionChoiceBehavior.Auto()
+        return None, {"session_key": session_key, "history": history, "sentiment": user_sentiment, "intent": intent}
+
+    def _build_response(self, final_response: str, turn: TurnContext, intent: dict, user_sentiment: str) -> ChatResponse:
+        """
+        Post-proceso común a modo bloqueante y streaming: payload de UI, riesgo y acciones.
+        """
+        # Payload de UI (Rich UI): lo captura el filtro de herramientas para este turno, sin rescanear el historial
+        ui_data = turn.ui_component
+
+        # --- Lógica de Auditoría de Ejecución ---
+        # Evidencia real: lo que registró el filtro de telemetría en este turno (no el texto del LLM)
+        is_real_execution = any(call["success"] for call in turn.tool_calls)
+        
+        # Cálculo de Riesgo Post-Ejecución
+        calculated_risk = "Low"
+        actions_taken = ["Análisis Contextual"]
+        
+        if intent["urgency"] == "high":
+            calculated_risk = "Medium"
+
+        for call in turn.tool_calls:
+            if call["success"]:
+                actions_taken.append(f"Tool Execution: {call['tool']} ({call['duration_ms']:.0f} ms)")
+            else:
+                actions_taken.append(f"❌ Tool Failed: {call['tool']} ({call['duration_ms']:.0f} ms)")
+        
+        if not is_real_execution and (intent["needs_restart"] or intent["needs_human"]):
+            # Si necesitaba acción crítica y no hay evidencia de ejecución, subimos riesgo
+            calculated_risk = "High"
+            actions_taken.append("⚠️ Alerta: Posible inacción en solicitud crítica")
+
+        app_logger.info(f"📊 Respuesta generada. Riesgo: {calculated_risk}. Acciones: {actions_taken}")
+
+        return ChatResponse(
+            response=final_response,
+            is_safe=True,
+            sentiment=user_sentiment,
+            risk_level=calculated_risk,
+            actions_taken=actions_taken,
+            ui_component=ui_data,
+            next_steps=["Esperar feedback usuario"]
+        )
+
+    def _error_response(self, e: Exception) -> ChatResponse:
+        if isinstance(e, ServiceResponseException):
+            app_logger.error(f"❌ Error de servicio Azure OpenAI: {e}")
+            return ChatResponse(
+                response="Error temporal del servicio de IA. Mi memoria está intacta, pero no puedo procesar la respuesta ahora.",
+                is_safe=True,
+                risk_level="Medium",
+                is_error=True
+            )
+        app_logger.error(f"❌ Error crítico Orchestrator: {e}")
+        return ChatResponse(
+            response="Error interno del sistema al procesar la solicitud.",
+            is_safe=True,
+            risk_level="Unknown",
+            is_error=True
         )
 
+    async def process_message(self, request: ChatRequest) -> ChatResponse:
+        early_response, turn_state = await self._prepare_turn(request)
+        if early_response:
+            return early_response
+
+        history = turn_state["history"]
+        chat_service = self.kernel.get_service("chat-gpt")
+        turn = TurnContext()
+        turn_token = current_turn.set(turn)
+        self._active_turns += 1
+
         try:
-            # Invocar al LLM con el historial completo
+            # Invocar al LLM con la vista compactada del historial
+            view = await self._prompt_view(turn_state["session_key"], history, chat_service)
+            view_len = len(view.messages)
+            llm_start = time.perf_counter()
             result = await chat_service.get_chat_message_content(
-                chat_history=history,
-                settings=execution_settings,
+                chat_history=view,
+                settings=self._execution_settings(),
                 kernel=self.kernel 
             )
+            self._observe_llm(llm_start, turn)
+            self._merge_turn(history, view, view_len)
 
             # Añadir la respuesta del asistente al historial para el siguiente turno
             history.add_message(result)
-            
-            final_response = str(result)
-            ui_data = None
-
-            # LÓGICA DE EXTRACCIÓN DE PAYLOAD (Rich UI)
-            # Buscamos si en el historial reciente hay un output de herramienta con nuestro formato JSON
-            # Nota: Semantic Kernel guarda el resultado de las funciones en el chat history.
-            
-            # Iteramos los mensajes recientes en busca de "system_data"
-            for msg in reversed(history.messages):
-                if msg.role == "tool": # Mensajes que vienen de las herramientas
-                    try:
-                        import json
-                        content_str = str(msg.content)
-                        if "system_data" in content_str:
-                            data = json.loads(content_str)
-                            if "system_data" in data:
-                                ui_data = data["system_data"]
-                                app_logger.info(f"🎨 UI Component detectado: {ui_data['type']}")
-                                break
-                    except:
-                        continue
+            await self._session_io(self._sessions.put, turn_state["session_key"], history)
 
-            # --- Lógica de Auditoría de Ejecución ---
-            # Verificamos si Semantic Kernel reporta uso de herramientas en este turno
-            
-            execution_indicators = [
-                "he ejecutado", "he reiniciado", "he generado", "he consultado",
-                "proceso ejecutado", "ticket creado", "escalado realizado", "enlace generado",
-                "datos de rrhh", "análisis de carga"
-            ]
-            
-            is_real_execution = any(indicator in final_response.lower() for indicator in execution_indicators)
-            
-            # Cálculo de Riesgo Post-Ejecución
-            calculated_risk = "Low"
-            actions_taken = ["Análisis Contextual"]
-            
-            if intent["urgency"] == "high":
-                calculated_risk = "Medium"
-            
-            if is_real_execution:
-                actions_taken.append("Tool Execution (Semantic Kernel)")
-            elif intent["needs_restart"] or intent["needs_human"]:
-                # Si necesitaba acción crítica y no hay evidencia de ejecución, subimos riesgo
-                calculated_risk = "High"
-                actions_taken.append("⚠️ Alerta: Posible inacción en solicitud crítica")
-
-            app_logger.info(f"📊 Respuesta generada. Riesgo: {calculated_risk}. Acciones: {actions_taken}")
+            return self._build_response(str(result), turn, turn_state["intent"], turn_state["sentiment"])
 
-            return ChatResponse(
-                response=final_response,
-                is_safe=True,
-                sentiment=user_sentiment,
-                risk_level=calculated_risk,
-                actions_taken=actions_taken,
-                ui_component=ui_data,
-                next_steps=["Esperar feedback usuario"]
-            )
+        except Exception as e:
+            return self._error_response(e)
+        finally:
+            self._active_turns -= 1
+            current_turn.reset(turn_token)
 
-        except ServiceResponseException as e:
-            app_logger.error(f"❌ Error de servicio Azure OpenAI: {e}")
-            return ChatResponse(
-                response="Error temporal del servicio de IA. Mi memoria está intacta, pero no puedo procesar la respuesta ahora.",
-                is_safe=True,
-                risk_level="Medium"
-            )
+    async def process_message_stream(self, request: ChatRequest) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Variante streaming de process_message. Produce eventos (nombre, datos):
+        - "token":      fragmento de texto del asistente
+        - "tool_start"/"tool_end": progreso de herramientas (runbooks, RRHH, políticas)
+        - "done":       ChatResponse final (mismos metadatos que /chat)
+        """
+        early_response, turn_state = await self._prepare_turn(request)
+        if early_response:
+            yield "done", early_response.model_dump(mode="json")
+            return
+
+        history = turn_state["history"]
+        events: asyncio.Queue = asyncio.Queue()
+        turn = TurnContext(events=events)
+
+        # El LLM corre en su propia tarea: así los eventos de herramientas salen
+        # mientras la herramienta se ejecuta, no cuando termina el stream.
+        producer = asyncio.create_task(self._stream_llm(turn_state["session_key"], history, turn))
+        self._active_turns += 1
+
+        try:
+            while True:
+                event, data = await events.get()
+                if event == "llm_end":
+                    break
+                yield event, data
+
+            final_text = await producer
+            await self._session_io(self._sessions.put, turn_state["session_key"], history)
+            response = self._build_response(final_text, turn, turn_state["intent"], turn_state["sentiment"])
         except Exception as e:
-            app_logger.error(f"❌ Error crítico Orchestrator: {e}")
-            return ChatResponse(
-                response="Error interno del sistema al procesar la solicitud.",
-                is_safe=True,
-                risk_level="Unknown"
-            )
+            response = self._error_response(e)
+        finally:
+            self._active_turns -= 1
+            if not producer.done():
+                producer.cancel()
+
+        yield "done", response.model_dump(mode="json")
+
+    async def _stream_llm(self, session_key: str, history: ChatHistory, turn: TurnContext) -> str:
+        current_turn.set(turn)
+        chat_service = self.kernel.get_service("chat-gpt")
+        text_parts = []
+
+        try:
+            view = await self._prompt_view(session_key, history, chat_service)
+            view_len = len(view.messages)
+            llm_start = time.perf_counter()
+            async for messages in chat_service.get_streaming_chat_message_contents(
+                chat_history=view,
+                settings=self._execution_settings(),
+                kernel=self.kernel
+            ):
+                for msg in messages:
+                    if msg is None or msg.role != AuthorRole.ASSISTANT:
+                        continue
+                    if any(isinstance(item, FunctionCallContent) for item in msg.items):
+                        # El texto previo a una llamada a herramienta ya queda en el historial (lo añade SK)
+                        text_parts = []
+                        continue
+                    if msg.content:
+                        text_parts.append(msg.content)
+                        turn.emit("token", {"text": msg.content})
+
+            self._observe_llm(llm_start, turn)
+            self._merge_turn(history, view, view_len)
+            final_text = "".join(text_parts)
+            # Añadir la respuesta del asistente al historial para el siguiente turno
+            history.add_assistant_message(final_text)
+            return final_text
+        finally:
+            turn.emit("llm_end", {})
 
-orchestrator = ChatOrchestrator()
\ No newline at end of file
+# Construcción perezosa (warm-up en el arranque de la API)
+orchestrator = services.register("orchestrator", ChatOrchestrator)
\ No newline at end of file
@@ -0,0 +1,119 @@
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+from azure.core.credentials import AccessToken
+from src.config import settings
+from src.utils.logger import app_logger
+from src.utils.metrics import metrics_registry, time_stage
+
+TOKEN_REQUESTS = metrics_registry.counter(
+    "neurodesk_aad_token_requests_total",
+    "Peticiones de token AAD por resultado (hit / proactive_refresh / fetch)",
+    ("outcome",)
+)
+
+# Por debajo de este margen el token se considera caducado y se pide uno nuevo en línea
+MIN_VALIDITY_SECONDS = 30
+
+
+class CachedTokenCredential:
+    """
+    TokenCredential compartido con caché por scope y refresco proactivo.
+    - Token con vida de sobra: se devuelve sin ir a AAD.
+    - Dentro del margen de refresco: se devuelve el actual y se renueva en un hilo de fondo (uno por scope).
+    - Caducado (o casi): se pide en línea; las peticiones concurrentes esperan a una sola llamada.
+    Es compatible con los clientes del Azure SDK (expone get_token) y con llamadas REST manuales.
+    """
+
+    def __init__(self, credential_factory: Callable[[], object], refresh_margin: float):
+        self._factory = credential_factory
+        self.refresh_margin = refresh_margin
+        self._credential = None
+        self._tokens: Dict[Tuple[str, ...], AccessToken] = {}
+        self._locks: Dict[Tuple[str, ...], threading.Lock] = {}
+        self._refreshing: set = set()
+        self._guard = threading.Lock()
+
+    @property
+    def credential(self):
+        if self._credential is None:
+            with self._guard:
+                if self._credential is None:
+                    self._credential = self._factory()
+        return self._credential
+
+    def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        if kwargs.get("claims") or kwargs.get("tenant_id"):
+            # Retos CAE / multi-tenant: no se cachean
+            return self.credential.get_token(*scopes, **kwargs)
+
+        key = tuple(scopes)
+        token = self._tokens.get(key)
+        remaining = token.expires_on - time.time() if token else 0
+
+        if remaining > self.refresh_margin:
+            TOKEN_REQUESTS.inc("hit")
+            return token
+        if remaining > MIN_VALIDITY_SECONDS:
+            TOKEN_REQUESTS.inc("hit")
+            self._refresh_in_background(key)
+            return token
+        return self._fetch(key)
+
+    def prefetch(self, *scopes: str):
+        """Pide el token en segundo plano (p. ej. al construir el plugin) para que el primer turno no pague AAD."""
+        self._refresh_in_background(tuple(scopes))
+
+    def _lock_for(self, key: Tuple[str, ...]) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _fetch(self, key: Tuple[str, ...]) -> AccessToken:
+        with self._lock_for(key):
+            # Otro hilo pudo renovarlo mientras esperábamos el lock
+            token = self._tokens.get(key)
+            if token and token.expires_on - time.time() > MIN_VALIDITY_SECONDS:
+                TOKEN_REQUESTS.inc("hit")
+                return token
+            with time_stage("aad_token"):
+                token = self.credential.get_token(*key)
+            self._tokens[key] = token
+            TOKEN_REQUESTS.inc("fetch")
+            return token
+
+    def _refresh_in_background(self, key: Tuple[str, ...]):
+        with self._guard:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                with time_stage("aad_token"):
+                    token = self.credential.get_token(*key)
+                self._tokens[key] = token
+                TOKEN_REQUESTS.inc("proactive_refresh")
+            except Exception as e:
+                # El token actual sigue valiendo: el siguiente get_token lo reintentará
+                app_logger.warning(f"⚠️ Fallo renovando token AAD {key}: {e}")
+            finally:
+                with self._guard:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="aad-token-refresh", daemon=True).start()
+
+    def expires_in(self, *scopes: str) -> Optional[float]:
+        token = self._tokens.get(tuple(scopes))
+        return token.expires_on - time.time() if token else None
+
+    def close(self):
+        if self._credential is not None and hasattr(self._credential, "close"):
+            self._credential.close()
+
+
+def _default_credential():
+    from azure.identity import DefaultAzureCredential
+    return DefaultAzureCredential()
+
+
+azure_credential = CachedTokenCredential(_default_credential, refresh_margin=settings.AAD_TOKEN_REFRESH_MARGIN)
@@ -1,103 +1,183 @@
-import pandas as pd
 import io
 import sys
-from azure.identity import DefaultAzureCredential
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+import numpy as np
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError, ResourceNotModifiedError
 from azure.storage.blob import BlobServiceClient
 from src.config import settings
+from src.services.credentials import azure_credential
 from src.utils.logger import app_logger
+from src.services.hr_snapshot import HRSnapshot, SnapshotCache
+from src.services.http_transport import http_transport
+from src.services.risk_scoring import LEVELS, level_codes, rollup, score_arrays, score_employee, top_at_risk
+from src.services.service_registry import services
 from src.services.ticket_store import ticket_store
+from src.utils.metrics import metrics_registry, time_stage
+
+# Dimensiones de agregación del scoring de plantilla -> columna categórica del snapshot
+RISK_GROUPS = {"department": "Department", "manager": "ManagerName"}
 
 class DataAnalyst:
     def __init__(self):
-        self.df_hr = pd.DataFrame()
+        # Columnas en arrays + índices Email/EmpID (ver HRSnapshot); vacío hasta cargar.
+        # Se sustituye entero (una asignación de referencia): los lectores nunca ven un estado a medias.
+        self.snapshot = HRSnapshot.empty()
         self.container_name = "reference-data"
         self.blob_name = "hr_data_enriched.csv"
-        
-        # Carga estricta al iniciar. Si falla, la app no debe arrancar en falso.
-        self._load_hr_data_from_blob_strict()
 
-    def _load_hr_data_from_blob_strict(self):
+        self.version = 0
+        self.last_check_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.refresh_interval = settings.HR_REFRESH_INTERVAL
+        self.retry_interval = settings.HR_REFRESH_RETRY_INTERVAL
+        self._blob_client = None
+        self._stop = threading.Event()
+
+        # Snapshot columnar local por ETag: el arranque abre el último con memmap en lugar de descargar + parsear
+        self._cache = SnapshotCache(Path(settings.HR_SNAPSHOT_DIR)) if settings.HR_SNAPSHOT_DIR else None
+        self.source: Optional[str] = None
+        if self._cache:
+            local = self._cache.load_current()
+            if local is not None:
+                self._publish(local, source="local_cache")
+
+        # Primera comprobación en el warm-up (condicional si hay snapshot local: normalmente 304).
+        # Si falla, el refresco en segundo plano sigue reintentando.
+        self.refresh()
+
+        self._refresher = threading.Thread(target=self._run_refresher, name="hr-refresher", daemon=True)
+        self._refresher.start()
+
+    def _get_blob_client(self):
+        if self._blob_client is None:
+            storage_account_name = settings.STORAGE_ACCOUNT
+            if not storage_account_name:
+                raise RuntimeError("STORAGE_ACCOUNT_NAME no definido en variables de entorno")
+
+            # Construcción segura del endpoint
+            account_url = f"https://{storage_account_name}.blob.core.windows.net"
+            app_logger.info(f"☁️ Conectando a Azure Blob Storage: {account_url} ...")
+
+            # Autenticación Real (Managed Identity en Azure o Azure CLI en local), con token cacheado compartido
+            blob_service_client = BlobServiceClient(account_url, credential=azure_credential, transport=http_transport.azure_transport())
+            self._blob_client = blob_service_client.get_blob_client(container=self.container_name, blob=self.blob_name)
+        return self._blob_client
+
+    def refresh(self) -> bool:
         """
-        Descarga el CSV de referencia desde Azure Blob Storage.
+        Descarga condicional del CSV de referencia (If-None-Match con el ETag actual).
+        - 304: no hay cambios, no se descarga ni se parsea nada.
+        - 200: se parsea y se indexa en este hilo (fuera del request) y se publica con un swap atómico.
+        - Error: se conserva el último snapshot bueno.
         CRÍTICO: No hay fallback local. Requiere conexión real a Azure.
+        Devuelve True si se publicó un snapshot nuevo.
         """
-        storage_account_name = settings.STORAGE_ACCOUNT
+        current = self.snapshot
+        self.last_check_at = time.time()
+        try:
+            blob_client = self._get_blob_client()
+            with time_stage("hr_blob_download"):
+                if current.etag:
+                    download_stream = blob_client.download_blob(etag=current.etag, match_condition=MatchConditions.IfModified)
+                else:
+                    download_stream = blob_client.download_blob()
+                csv_data = download_stream.readall()
+        except ResourceNotModifiedError:
+            self.last_error = None
+            return False
+        except ResourceNotFoundError:
+            return self._refresh_failed(f"El archivo {self.blob_name} no existe en el contenedor {self.container_name}.")
+        except HttpResponseError as e:
+            if e.status_code == 304:
+                self.last_error = None
+                return False
+            return self._refresh_failed(str(e))
+        except Exception as e:
+            return self._refresh_failed(str(e))
 
-        if not storage_account_name:
-            app_logger.critical("❌ Data Analyst: STORAGE_ACCOUNT_NAME no definido en variables de entorno.")
-            return
+        try:
+            # Parsing con Pandas; los índices de búsqueda (Email normalizado, EmpID) se construyen una vez aquí
+            with time_stage("hr_parse"):
+                snapshot = HRSnapshot.from_csv(io.BytesIO(csv_data), etag=download_stream.properties.etag)
+        except Exception as e:
+            return self._refresh_failed(f"CSV de HR inválido: {e}")
+        del csv_data
 
-        # Construcción segura del endpoint
-        account_url = f"https://{storage_account_name}.blob.core.windows.net"
+        if self._cache:
+            try:
+                # Se publica la versión memmapeada: menos memoria residente y la misma que usará el próximo arranque
+                snapshot = self._cache.store(snapshot)
+            except Exception as e:
+                app_logger.warning(f"⚠️ No se pudo guardar el snapshot HR local: {e}")
 
-        try:
-            app_logger.info(f"☁️ Conectando a Azure Blob Storage: {account_url} ...")
-            
-            # Autenticación Real (Managed Identity en Azure o Azure CLI en local)
-            credential = DefaultAzureCredential()
-            blob_service_client = BlobServiceClient(account_url, credential=credential)
-            
-            blob_client = blob_service_client.get_blob_client(container=self.container_name, blob=self.blob_name)
-
-            if not blob_client.exists():
-                app_logger.critical(f"❌ El archivo {self.blob_name} no existe en el contenedor {self.container_name}.")
+        self._publish(snapshot, source="blob")
+        self.last_error = None
+        return True
+
+    def _publish(self, snapshot: HRSnapshot, source: str):
+        self.snapshot = snapshot
+        self.source = source
+        self.version += 1
+        origin = "CLOUD" if source == "blob" else "snapshot local"
+        app_logger.info(
+            f"✅ Data Analyst: Dataset HR v{self.version} cargado desde {origin} ({len(snapshot)} registros, ETag {snapshot.etag})."
+        )
+
+    def _refresh_failed(self, error: str) -> bool:
+        self.last_error = error
+        if len(self.snapshot):
+            app_logger.warning(f"⚠️ Data Analyst: refresco de HR fallido, se mantiene v{self.version}: {error}")
+        else:
+            app_logger.critical(f"🔥 ERROR CRÍTICO DE ACCESO A DATOS: {error}")
+        return False
+
+    def _run_refresher(self):
+        while True:
+            # Sin datos (fallo en el arranque) se reintenta más a menudo
+            interval = self.refresh_interval if len(self.snapshot) else self.retry_interval
+            if self._stop.wait(interval):
                 return
+            try:
+                self.refresh()
+            except Exception as e:
+                app_logger.error(f"❌ Error en el refresco de HR: {e}")
 
-            # Descarga a stream en memoria
-            download_stream = blob_client.download_blob()
-            csv_data = download_stream.readall()
-            
-            # Parsing con Pandas
-            self.df_hr = pd.read_csv(io.BytesIO(csv_data))
-            
-            # Normalización de datos para búsquedas
-            if 'EmpID' in self.df_hr.columns:
-                self.df_hr['EmpID'] = self.df_hr['EmpID'].astype(str)
-            if 'Email' in self.df_hr.columns:
-                self.df_hr['Email'] = self.df_hr['Email'].str.lower().str.strip()
-                
-            app_logger.info(f"✅ Data Analyst: Dataset HR cargado desde CLOUD ({len(self.df_hr)} registros).")
+    def close(self):
+        self._stop.set()
 
-        except Exception as e:
-            app_logger.critical(f"🔥 ERROR CRÍTICO DE ACCESO A DATOS: {e}")
-            # En producción esto debe detener el servicio o alertar, no continuar vacio.
-            self.df_hr = pd.DataFrame() 
+    def data_status(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {
+            "version": self.version,
+            "etag": snapshot.etag,
+            "source": self.source,
+            "rows": len(snapshot),
+            "loaded_at": datetime.utcfromtimestamp(snapshot.loaded_at).isoformat() if len(snapshot) else None,
+            "age_seconds": round(time.time() - snapshot.loaded_at, 1) if len(snapshot) else None,
+            "last_check_at": datetime.utcfromtimestamp(self.last_check_at).isoformat() if self.last_check_at else None,
+            "last_error": self.last_error,
+        }
 
     def get_employee_metrics(self, user_identifier: str) -> dict:
         """
-        Busca métricas específicas de un empleado en el DataFrame en memoria.
+        Busca métricas específicas de un empleado en memoria.
         Retorna un diccionario limpio para el consumo del Plugin.
         """
-        if self.df_hr.empty:
+        snapshot = self.snapshot
+        if not len(snapshot):
             return {"error": "HR Database Offline"}
 
-        user_identifier = str(user_identifier).lower().strip()
-        
-        # Búsqueda Vectorial (Email o ID)
-        # Prioridad 1: Email
-        user = self.df_hr[self.df_hr['Email'] == user_identifier]
-        
-        # Prioridad 2: ID
-        if user.empty:
-            user = self.df_hr[self.df_hr['EmpID'] == user_identifier]
-
-        if user.empty:
+        # Búsqueda O(1) por índice hash (prioridad 1: Email, prioridad 2: EmpID)
+        row = snapshot.find(user_identifier)
+        if row is None:
             return {"error": "User Not Found"}
 
-        # Extracción de datos (Fila 0)
-        row = user.iloc[0]
-        
-        return {
-            "name": row.get('Employee_Name', 'N/A'),
-            "position": row.get('Position', 'N/A'),
-            "department": row.get('Department', 'N/A'),
-            "manager": row.get('ManagerName', 'N/A'),
-            "satisfaction": float(row.get('EmpSatisfaction', 3.0)), # Cast seguro
-            "projects": int(row.get('SpecialProjectsCount', 0)),
-            "monthly_hours": float(row.get('Average_Monthly_Hours', 160.0)),
-            "last_review": row.get('LastPerformanceReview_Date', 'N/A'),
-            "absences": int(row.get('Absences', 0))
-        }
+        return snapshot.record(row).to_metrics()
 
     def get_contextual_risk_profile(self, user_identifier: str) -> dict:
         """
@@ -110,31 +190,17 @@ class DataAnalyst:
             return {"risk_level": "UNKNOWN", "reason": "Usuario no encontrado en HR"}
 
         # 2. Obtener datos vivos de IT (Cosmos DB)
-        # Buscamos tickets de los últimos 7 días
-        recent_tickets = ticket_store.get_recent_tickets(user_identifier, days=7)
-        ticket_count = len(recent_tickets)
-        
-        # 3. Cálculo de Riesgo Algorítmico
-        risk_score = 0
-        factors = []
-
-        # Análisis HR
-        if hr_metrics['satisfaction'] <= 2.0:
-            risk_score += 40
-            factors.append("Baja satisfacción reportada")
-        if hr_metrics['monthly_hours'] > 200:
-            risk_score += 30
-            factors.append("Sobrecarga horaria")
-        
-        # Análisis IT
-        if ticket_count > 2:
-            risk_score += 20
-            factors.append(f"Múltiples incidentes recientes ({ticket_count})")
-
-        # Determinación de Nivel
-        level = "LOW"
-        if risk_score >= 60: level = "CRITICAL"
-        elif risk_score >= 30: level = "MEDIUM"
+        # Tickets de los últimos 7 días, desde los contadores materializados (sin traer documentos).
+        # Si Cosmos falla se puntúa solo con HR y se marca, igual que en get_workforce_risk.
+        ticket_error = None
+        try:
+            ticket_count = ticket_store.count_recent_tickets(user_identifier, days=7)
+        except Exception as e:
+            app_logger.error(f"❌ Tickets recientes no disponibles para {user_identifier}: {e}")
+            ticket_count, ticket_error = None, str(e)
+
+        # 3. Cálculo de Riesgo Algorítmico (mismas reglas que el scoring de toda la plantilla)
+        risk_score, level, factors = score_employee(hr_metrics['satisfaction'], hr_metrics['monthly_hours'], ticket_count or 0)
 
         return {
             "employee_name": hr_metrics['name'],
@@ -142,8 +208,123 @@ class DataAnalyst:
             "risk_level": level,
             "risk_score": risk_score,
             "risk_factors": factors,
-            "active_tickets_count": ticket_count
+            "active_tickets_count": ticket_count,
+            "ticket_data_available": ticket_error is None,
+            "ticket_data_error": ticket_error,
         }
 
-# Instancia Global
-data_analyst = DataAnalyst()
\ No newline at end of file
+    def get_workforce_risk(
+        self,
+        group_by: str = "department",
+        department: Optional[str] = None,
+        manager: Optional[str] = None,
+        top: int = 10,
+        days: int = 7,
+    ) -> dict:
+        """
+        Riesgo de burnout de toda la plantilla (o de un departamento / equipo) en una pasada vectorizada:
+        mismas reglas que get_contextual_risk_profile sobre las columnas del snapshot, con los tickets
+        recientes de todos los usuarios en una sola consulta agregada a Cosmos, y agregado por departamento o manager.
+        """
+        snapshot = self.snapshot
+        if not len(snapshot):
+            return {"error": "HR Database Offline"}
+        if group_by not in RISK_GROUPS:
+            return {"error": f"group_by no soportado: {group_by} (opciones: {', '.join(RISK_GROUPS)})"}
+
+        # Sin datos de tickets se puntúa solo con HR y el informe lo indica (no equivale a "cero tickets")
+        ticket_error = None
+        try:
+            ticket_counts = ticket_store.count_recent_by_user(days=days)
+        except Exception as e:
+            app_logger.error(f"❌ Tickets recientes no disponibles para el scoring de plantilla: {e}")
+            ticket_counts, ticket_error = {}, str(e)
+
+        with time_stage("risk_scoring"):
+            c = snapshot.columns
+            mask = np.ones(len(snapshot), dtype=bool)
+            for column, value in (("Department", department), ("ManagerName", manager)):
+                if value:
+                    codes, names = _folded_categories(c[column])
+                    wanted = [i for i, name in enumerate(names) if name.lower() == value.lower().strip()]
+                    if not wanted:
+                        return {"error": f"{column} no encontrado: {value}"}
+                    mask &= codes == wanted[0]
+            rows = np.flatnonzero(mask)
+
+            satisfaction = c["EmpSatisfaction"][rows]
+            hours = c["Average_Monthly_Hours"][rows]
+            tickets = self._ticket_counts(snapshot, ticket_counts)[rows]
+            scores = score_arrays(satisfaction, hours, tickets)
+            levels = level_codes(scores)
+
+            codes, names = _folded_categories(c[RISK_GROUPS[group_by]])
+            groups = rollup(codes[rows], names, scores, levels, satisfaction, hours, c[RISK_GROUPS[group_by]].default)
+            # Posiciones dentro de la selección; solo empleados con algún factor de riesgo
+            flagged = np.flatnonzero(scores > 0)
+            top_positions = top_at_risk(scores, flagged, top)
+
+        per_level = np.bincount(levels, minlength=len(LEVELS))
+        return {
+            "data_version": self.version,
+            "generated_at": datetime.utcnow().isoformat(),
+            "group_by": group_by,
+            "filters": {"department": department, "manager": manager},
+            "ticket_window_days": days,
+            "ticket_data_available": ticket_error is None,
+            "ticket_data_error": ticket_error,
+            "summary": {
+                "employees": int(len(rows)),
+                "avg_risk_score": round(float(scores.mean()), 1) if len(rows) else 0.0,
+                "critical": int(per_level[2]),
+                "medium": int(per_level[1]),
+                "low": int(per_level[0]),
+            },
+            "groups": groups,
+            "top_at_risk": [
+                {
+                    "name": c["Employee_Name"][rows[p]],
+                    "department": c["Department"][rows[p]],
+                    "manager": c["ManagerName"][rows[p]],
+                    "risk_score": int(scores[p]),
+                    "risk_level": LEVELS[levels[p]],
+                    "satisfaction": float(satisfaction[p]),
+                    "monthly_hours": float(hours[p]),
+                    "recent_tickets": int(tickets[p]),
+                }
+                for p in top_positions
+            ],
+        }
+
+    @staticmethod
+    def _ticket_counts(snapshot: HRSnapshot, counts: Dict[str, int]) -> np.ndarray:
+        """Tickets por fila del snapshot; user_id puede ser Email o EmpID (se suman si ambos apuntan al mismo empleado)."""
+        tickets = np.zeros(len(snapshot), dtype=np.int32)
+        for user_id, n in counts.items():
+            row = snapshot.find(user_id)
+            if row is not None:
+                tickets[row] += n
+        return tickets
+
+def _folded_categories(column):
+    """
+    Códigos de una columna categórica con las categorías unificadas por nombre sin espacios sobrantes
+    (el CSV de HR trae variantes como 'Production       '). Devuelve (códigos por fila, nombres); -1 se conserva.
+    """
+    names, remap = np.unique([name.strip() for name in column.categories], return_inverse=True)
+    if not len(names):
+        return column.codes, []
+    codes = np.where(column.codes >= 0, remap[np.maximum(column.codes, 0)], -1)
+    return codes, [str(name) for name in names]
+
+# Instancia Global (la descarga del CSV ocurre en el warm-up, no al importar)
+data_analyst = services.register("data_analyst", DataAnalyst, ready_check=lambda s: len(s.snapshot) > 0)
+
+def _hr_status(key: str):
+    if not services.is_built("data_analyst"):
+        return -1
+    value = data_analyst.data_status()[key]
+    return -1 if value is None else value
+
+metrics_registry.gauge("neurodesk_hr_data_version", "Versión del dataset HR publicada (swaps desde el arranque)", lambda: _hr_status("version"))
+metrics_registry.gauge("neurodesk_hr_data_age_seconds", "Antigüedad del snapshot HR servido (-1 sin datos)", lambda: _hr_status("age_seconds"))
\ No newline at end of file
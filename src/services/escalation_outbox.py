@@ -0,0 +1,293 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from src.config import settings
+from src.utils.logger import app_logger
+from src.services.http_transport import http_transport
+from src.services.service_registry import services
+from src.services.ticket_store import ticket_store
+from src.utils.metrics import metrics_registry, time_stage
+
+DELIVERIES = metrics_registry.counter(
+    "neurodesk_escalation_deliveries_total",
+    "Entregas del outbox de escalados por resultado (delivered / retry / dead_letter)",
+    ("outcome",)
+)
+
+# Respuestas 4xx que sí tiene sentido reintentar (timeout del servidor / throttling)
+RETRYABLE_4XX = {408, 425, 429}
+
+
+class EscalationOutbox:
+    """
+    Outbox persistente (SQLite) para escalados a humano.
+    escalate_to_human guarda en una sola fila el ticket y la intención de notificar y responde al instante.
+    Un hilo de fondo entrega por lotes: crea el ticket en Cosmos y llama a la Logic App, cada parte con su
+    propio flag para no repetir lo ya hecho. Los fallos se reintentan con backoff exponencial (con jitter);
+    agotados los intentos, o ante un 4xx definitivo, la fila va al fichero de dead-letter.
+    Las filas sobreviven a un reinicio: el worker retoma lo pendiente al arrancar.
+    Varios procesos (workers de uvicorn) pueden compartir el fichero: cada lote se reserva en una transacción
+    BEGIN IMMEDIATE (claimed_by / claimed_until) y solo lo entrega quien lo reservó. Si ese proceso muere,
+    la reserva caduca a los OUTBOX_CLAIM_TTL segundos y otro worker retoma las filas.
+    """
+
+    def __init__(self):
+        self.path = settings.OUTBOX_PATH
+        self.dead_letter_path = settings.OUTBOX_DEAD_LETTER_PATH
+        self.logic_app_url = settings.LOGIC_APP_URL
+        self.batch_size = settings.OUTBOX_BATCH_SIZE
+        self.poll_interval = settings.OUTBOX_POLL_INTERVAL
+        self.max_attempts = settings.OUTBOX_MAX_ATTEMPTS
+        self.max_backoff = settings.OUTBOX_MAX_BACKOFF
+        self.http_timeout = settings.OUTBOX_HTTP_TIMEOUT
+        self.claim_ttl = settings.OUTBOX_CLAIM_TTL
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._cond = threading.Condition()
+        self._dead_letter_lock = threading.Lock()
+        self._stopping = False
+        self._local = threading.local()
+        self.stats = {"enqueued": 0, "delivered": 0, "retries": 0, "dead_lettered": 0}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS escalation_outbox ("
+                " id TEXT PRIMARY KEY, ticket TEXT NOT NULL, notification TEXT,"
+                " ticket_saved INTEGER NOT NULL DEFAULT 0, notified INTEGER NOT NULL DEFAULT 0,"
+                " attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL,"
+                " created_at REAL NOT NULL, last_error TEXT, claimed_by TEXT, claimed_until REAL)"
+            )
+            # Ficheros creados antes de las reservas por worker
+            columns = {r["name"] for r in conn.execute("PRAGMA table_info(escalation_outbox)")}
+            for column, kind in (("claimed_by", "TEXT"), ("claimed_until", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE escalation_outbox ADD COLUMN {column} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_outbox_due ON escalation_outbox (next_attempt_at)")
+
+        if not self.logic_app_url:
+            app_logger.warning("⚠️ Logic App URL no configurada - el outbox solo persistirá tickets")
+
+        self._worker = threading.Thread(target=self._run_worker, name="escalation-outbox", daemon=True)
+        self._worker.start()
+        app_logger.info(f"✅ Outbox de escalados listo: {self.path} ({self.pending()} pendientes)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- API ---
+
+    def enqueue(self, ticket: Dict[str, Any], notification: Optional[Dict[str, Any]]):
+        """Guarda ticket + notificación en una sola transacción. Lanza si SQLite falla (el llamante decide)."""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO escalation_outbox (id, ticket, notification, next_attempt_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    ticket["id"],
+                    json.dumps(ticket, ensure_ascii=False),
+                    json.dumps(notification, ensure_ascii=False) if notification else None,
+                    now,
+                    now,
+                )
+            )
+        self.stats["enqueued"] += 1
+        with self._cond:
+            self._cond.notify()
+
+    def pending(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM escalation_outbox").fetchone()[0]
+
+    def close(self, timeout: float = 10.0):
+        """Detiene el worker. Lo pendiente queda en SQLite y se entrega en el siguiente arranque."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._worker.join(timeout=timeout)
+        app_logger.info(f"📕 Outbox de escalados cerrado ({self.pending()} pendientes). Stats: {self.stats}")
+
+    # --- Worker ---
+
+    def _run_worker(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+            try:
+                batch = self._due_batch()
+                if batch:
+                    self._deliver_batch(batch)
+            except Exception as e:
+                app_logger.error(f"❌ Error en el worker del outbox de escalados: {e}")
+                batch = []
+
+            # Lote lleno: puede haber más vencidas, seguimos sin esperar
+            if len(batch) < self.batch_size:
+                with self._cond:
+                    if not self._stopping:
+                        self._cond.wait(timeout=self.poll_interval)
+
+    def _due_batch(self) -> List[sqlite3.Row]:
+        """Reserva para este worker las filas vencidas y libres (o con reserva caducada) y las devuelve."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")  # bloqueo de escritura: dos workers no pueden reservar las mismas filas
+        try:
+            rows = conn.execute(
+                "SELECT * FROM escalation_outbox WHERE next_attempt_at <= ?"
+                " AND (claimed_until IS NULL OR claimed_until < ?) ORDER BY created_at LIMIT ?",
+                (now, now, self.batch_size)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE escalation_outbox SET claimed_by = ?, claimed_until = ? WHERE id = ?",
+                    [(self.worker_id, now + self.claim_ttl, row["id"]) for row in rows]
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return rows
+
+    def _deliver_batch(self, rows: List[sqlite3.Row]):
+        delivered, retry, dead = [], [], []
+        for row in rows:
+            ticket = json.loads(row["ticket"])
+            notification = json.loads(row["notification"]) if row["notification"] else None
+            ticket_saved, notified = bool(row["ticket_saved"]), bool(row["notified"])
+            error, permanent = None, False
+
+            if notification is None or not self.logic_app_url:
+                notified = True
+            if not notified:
+                notified, error, permanent, response = self._notify(notification)
+                if response is not None:
+                    ticket["logic_app_triggered"] = notified
+                    ticket["logic_app_response"] = response
+                    ticket["notification_status"] = "sent" if notified else "failed"
+                    # El ticket (aunque ya estuviera guardado) debe reflejar el resultado de la notificación
+                    ticket_saved = False
+
+            if not ticket_saved:
+                ticket_saved = self._save_ticket(ticket)
+                if not ticket_saved and error is None:
+                    error = "No se pudo guardar el ticket en Cosmos DB"
+
+            if ticket_saved and notified:
+                delivered.append(row["id"])
+            elif permanent or row["attempts"] + 1 >= self.max_attempts:
+                if not notified and ticket.get("notification_status") != "failed":
+                    # Reintentos agotados sin respuesta de la Logic App: el ticket no puede quedarse en "pending"
+                    ticket["notification_status"] = "failed"
+                    ticket["notification_error"] = error
+                    self._save_ticket(ticket)
+                dead.append((row, ticket, notification, error))
+            else:
+                retry.append((row, ticket, ticket_saved, notified, error))
+
+        self._record_outcomes(delivered, retry, dead)
+
+    def _notify(self, notification: Dict[str, Any]):
+        """Devuelve (entregada, error, error_definitivo, respuesta_para_el_ticket)."""
+        try:
+            with time_stage("logic_app"):
+                response = http_transport.session.post(self.logic_app_url, json=notification, timeout=self.http_timeout)
+        except Exception as e:
+            return False, f"{type(e).__name__}: {e}", False, None
+
+        if response.status_code in (200, 202):
+            app_logger.info(f"✅ Logic App triggered successfully for user {notification.get('user_id')}")
+            return True, None, False, {
+                "status_code": response.status_code,
+                "request_id": response.headers.get("x-ms-request-id", "N/A"),
+                "triggered_at": datetime.utcnow().isoformat(),
+            }
+
+        error = f"HTTP {response.status_code}: {(response.text or '')[:500]}"
+        permanent = 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_4XX
+        app_logger.warning(f"⚠️ Logic App responded with status {response.status_code}")
+        details = {"status_code": response.status_code, "error": (response.text or "Empty response")[:500]}
+        return False, error, permanent, details if permanent else None
+
+    def _save_ticket(self, ticket: Dict[str, Any]) -> bool:
+        try:
+            # upsert con id fijo: idempotente entre reintentos y al anotar la respuesta de la Logic App
+            return ticket_store.upsert_ticket(ticket)
+        except Exception as e:
+            app_logger.warning(f"⚠️ Fallo guardando ticket de escalado {ticket.get('ticket_id')}: {e}")
+            return False
+
+    def _record_outcomes(self, delivered: List[str], retry: list, dead: list):
+        conn = self._conn()
+        now = time.time()
+        with conn:  # una transacción por lote
+            if delivered:
+                conn.executemany("DELETE FROM escalation_outbox WHERE id = ?", [(i,) for i in delivered])
+            for row, ticket, ticket_saved, notified, error in retry:
+                attempts = row["attempts"] + 1
+                backoff = min(self.max_backoff, 2 ** attempts) * random.uniform(0.8, 1.2)
+                conn.execute(
+                    "UPDATE escalation_outbox SET ticket = ?, ticket_saved = ?, notified = ?, attempts = ?,"
+                    " next_attempt_at = ?, last_error = ?, claimed_by = NULL, claimed_until = NULL WHERE id = ?",
+                    (json.dumps(ticket, ensure_ascii=False), int(ticket_saved), int(notified),
+                     attempts, now + backoff, error, row["id"])
+                )
+                app_logger.warning(
+                    f"⚠️ Escalado {ticket.get('ticket_id')}: intento {attempts}/{self.max_attempts} fallido, "
+                    f"reintento en {backoff:.0f}s: {error}"
+                )
+            if dead:
+                self._dead_letter(dead)
+                conn.executemany("DELETE FROM escalation_outbox WHERE id = ?", [(row["id"],) for row, *_ in dead])
+
+        self.stats["delivered"] += len(delivered)
+        self.stats["retries"] += len(retry)
+        self.stats["dead_lettered"] += len(dead)
+        if delivered:
+            DELIVERIES.inc("delivered", amount=len(delivered))
+            app_logger.info(f"📨 {len(delivered)} escalados entregados desde el outbox.")
+        if retry:
+            DELIVERIES.inc("retry", amount=len(retry))
+        if dead:
+            DELIVERIES.inc("dead_letter", amount=len(dead))
+
+    def _dead_letter(self, dead: list):
+        # Se escribe antes de borrar la fila: si esto falla, la transacción no borra nada y se reintenta
+        with self._dead_letter_lock:
+            self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for row, ticket, notification, error in dead:
+                    f.write(json.dumps({
+                        "dead_lettered_at": datetime.utcnow().isoformat(),
+                        "attempts": row["attempts"] + 1,
+                        "last_error": error,
+                        "ticket": ticket,
+                        "notification": notification,
+                    }, ensure_ascii=False) + "\n")
+        app_logger.critical(f"💀 {len(dead)} escalados enviados a dead-letter ({self.dead_letter_path}).")
+
+
+escalation_outbox = services.register(
+    "escalation_outbox", EscalationOutbox, ready_check=lambda s: s._worker.is_alive(), critical=False
+)
+
+metrics_registry.gauge(
+    "neurodesk_escalation_outbox_pending",
+    "Escalados pendientes de entrega en el outbox",
+    lambda: escalation_outbox.pending() if services.is_built("escalation_outbox") else 0
+)
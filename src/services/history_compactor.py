@@ -0,0 +1,243 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Set, Tuple
+from semantic_kernel.connectors.ai.open_ai import AzureChatPromptExecutionSettings
+from semantic_kernel.contents import ChatHistory, ChatMessageContent, AuthorRole, FunctionResultContent
+from src.config import settings
+from src.utils.logger import app_logger
+
+# tiktoken es opcional: sin él estimamos ~4 caracteres por token
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# Overhead por mensaje del formato chat de OpenAI (rol + separadores)
+TOKENS_PER_MESSAGE = 4
+SUMMARY_PREFIX = "RESUMEN DE LA CONVERSACIÓN PREVIA (compactado automáticamente):\n"
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+def _message_text(msg: ChatMessageContent) -> str:
+    parts = []
+    for item in msg.items:
+        payload = getattr(item, "text", None) or getattr(item, "result", None) or getattr(item, "arguments", None)
+        if payload:
+            parts.append(str(payload))
+    return "\n".join(parts)
+
+def count_message_tokens(msg: ChatMessageContent) -> int:
+    return TOKENS_PER_MESSAGE + count_tokens(_message_text(msg))
+
+
+class _Summary:
+    __slots__ = ("text", "covered")
+
+    def __init__(self):
+        self.text = ""
+        self.covered: Set[str] = set()  # huellas de los turnos ya resumidos
+
+
+class HistoryCompactor:
+    """
+    Construye la vista del historial que se envía al LLM respetando un presupuesto de tokens:
+    1. Colapsa resultados de herramientas antiguos (los outputs de runbooks pueden ocupar 4000 chars).
+    2. Sustituye los turnos más antiguos por un resumen incremental cacheado por sesión.
+    El historial almacenado no se modifica: solo la vista del prompt.
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        keep_recent_turns: int,
+        tool_result_max_chars: int,
+        summary_max_tokens: int,
+        max_cached_sessions: int,
+    ):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_result_max_chars = tool_result_max_chars
+        self.summary_max_tokens = summary_max_tokens
+        self.max_cached_sessions = max_cached_sessions
+
+        self._summaries: "OrderedDict[str, _Summary]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"turns_compacted": 0, "tokens_saved_total": 0, "summaries_generated": 0}
+
+    async def compact(self, session_key: str, history: ChatHistory, chat_service) -> Tuple[ChatHistory, Dict[str, Any]]:
+        preamble, turns = self._split_turns(history.messages)
+        tokens_full = sum(count_message_tokens(m) for m in history.messages)
+
+        summary = self._get_summary(session_key)
+        recent_start = max(len(turns) - self.keep_recent_turns, 0)
+
+        # 1. Colapsar outputs de herramientas fuera de la ventana reciente
+        collapsed = 0
+        view_turns: List[List[ChatMessageContent]] = []
+        for i, turn in enumerate(turns):
+            if i < recent_start:
+                turn, n = self._collapse_tool_results(turn)
+                collapsed += n
+            view_turns.append(turn)
+
+        # 2. Los turnos ya resumidos no viajan; si aún excedemos el presupuesto, resumimos más (en orden)
+        fingerprints = [self._fingerprint(turn) for turn in turns]
+        keep = [fp not in summary.covered for fp in fingerprints]
+
+        def view_tokens(summary_tokens: int) -> int:
+            total = sum(count_message_tokens(m) for m in preamble)
+            total += sum(count_message_tokens(m) for t, k in zip(view_turns, keep) if k for m in t)
+            return total + (TOKENS_PER_MESSAGE + summary_tokens if summary_tokens else 0)
+
+        to_summarize = []
+        if view_tokens(count_tokens(SUMMARY_PREFIX + summary.text) if summary.text else 0) > self.token_budget:
+            for i in range(recent_start):
+                if not keep[i]:
+                    continue
+                keep[i] = False
+                to_summarize.append(view_turns[i])
+                # El resumen nuevo ocupará como mucho summary_max_tokens
+                if view_tokens(self.summary_max_tokens) <= self.token_budget:
+                    break
+
+        if to_summarize:
+            summary.text = await self._summarize(summary.text, to_summarize, chat_service)
+            summary.covered.update(fp for fp, k in zip(fingerprints, keep) if not k)
+            self._counters["summaries_generated"] += 1
+
+        # 3. Ensamblar la vista: preámbulo (System Prompt) + resumen + turnos vigentes
+        messages: List[ChatMessageContent] = list(preamble)
+        if summary.text:
+            messages.append(ChatMessageContent(role=AuthorRole.SYSTEM, content=SUMMARY_PREFIX + summary.text))
+        for turn, k in zip(view_turns, keep):
+            if k:
+                messages.extend(turn)
+        view = ChatHistory(messages=messages)
+
+        tokens_sent = sum(count_message_tokens(m) for m in messages)
+        report = {
+            "tokens_full": tokens_full,
+            "tokens_sent": tokens_sent,
+            "tokens_saved": max(tokens_full - tokens_sent, 0),
+            "summarized_turns": keep.count(False),
+            "collapsed_tool_results": collapsed,
+        }
+        if report["tokens_saved"]:
+            self._counters["turns_compacted"] += 1
+            self._counters["tokens_saved_total"] += report["tokens_saved"]
+            app_logger.info(
+                f"✂️ Compactación de historial: {tokens_full} → {tokens_sent} tokens "
+                f"(ahorro {report['tokens_saved']}, turnos resumidos {report['summarized_turns']})"
+            )
+        return view, report
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._counters)
+
+    # --- Internos ---
+
+    def _get_summary(self, session_key: str) -> _Summary:
+        with self._lock:
+            summary = self._summaries.get(session_key)
+            if summary is None:
+                summary = self._summaries[session_key] = _Summary()
+            self._summaries.move_to_end(session_key)
+            while len(self._summaries) > self.max_cached_sessions:
+                self._summaries.popitem(last=False)
+            return summary
+
+    @staticmethod
+    def _split_turns(messages: List[ChatMessageContent]) -> Tuple[List[ChatMessageContent], List[List[ChatMessageContent]]]:
+        """Separa el preámbulo (System Prompt) de los turnos (un mensaje de usuario y todo lo que le sigue)."""
+        preamble, turns = [], []
+        for msg in messages:
+            if msg.role == AuthorRole.USER:
+                turns.append([msg])
+            elif turns:
+                turns[-1].append(msg)
+            else:
+                preamble.append(msg)
+        return preamble, turns
+
+    @staticmethod
+    def _fingerprint(turn: List[ChatMessageContent]) -> str:
+        digest = hashlib.blake2b(digest_size=8)
+        for msg in turn:
+            digest.update(str(msg.role).encode())
+            digest.update(_message_text(msg).encode("utf-8", "ignore"))
+        return digest.hexdigest()
+
+    def _collapse_tool_results(self, turn: List[ChatMessageContent]) -> Tuple[List[ChatMessageContent], int]:
+        collapsed = 0
+        out = []
+        for msg in turn:
+            if msg.role == AuthorRole.TOOL and any(
+                isinstance(item, FunctionResultContent) and len(str(item.result)) > self.tool_result_max_chars
+                for item in msg.items
+            ):
+                items = []
+                for item in msg.items:
+                    if isinstance(item, FunctionResultContent) and len(str(item.result)) > self.tool_result_max_chars:
+                        # Copia truncada: el id de la llamada se conserva para no romper el emparejamiento
+                        item = item.model_copy(update={
+                            "result": str(item.result)[:self.tool_result_max_chars] + "…[compactado]",
+                            "inner_content": None,
+                        })
+                        collapsed += 1
+                    items.append(item)
+                msg = ChatMessageContent(role=msg.role, items=items, name=msg.name)
+            out.append(msg)
+        return out, collapsed
+
+    def _transcript(self, turns: List[List[ChatMessageContent]]) -> str:
+        lines = []
+        for turn in turns:
+            for msg in turn:
+                text = _message_text(msg)
+                if not text:
+                    continue
+                if msg.role == AuthorRole.TOOL:
+                    text = text[:500]
+                lines.append(f"[{msg.role.value}] {text}")
+        return "\n".join(lines)
+
+    async def _summarize(self, previous: str, turns: List[List[ChatMessageContent]], chat_service) -> str:
+        transcript = self._transcript(turns)
+        try:
+            prompt = ChatHistory()
+            prompt.add_system_message(
+                "Resume de forma acumulativa una conversación de soporte IT/RRHH. "
+                "Conserva hechos, identificadores (tickets, jobs, recursos), decisiones y pendientes. "
+                "Responde solo con el resumen, en español y en viñetas breves."
+            )
+            prompt.add_user_message(f"RESUMEN ACTUAL:\n{previous or '(vacío)'}\n\nNUEVOS TURNOS:\n{transcript}")
+            result = await chat_service.get_chat_message_content(
+                chat_history=prompt,
+                settings=AzureChatPromptExecutionSettings(
+                    service_id="chat-gpt", temperature=0.0, max_tokens=self.summary_max_tokens
+                )
+            )
+            return str(result).strip()
+        except Exception as e:
+            # Fallback extractivo: nunca perdemos el contexto aunque el LLM falle
+            app_logger.warning(f"⚠️ Resumen incremental falló, usando fallback extractivo: {e}")
+            merged = f"{previous}\n{transcript}".strip()
+            max_chars = self.summary_max_tokens * 4
+            return merged[-max_chars:]
+
+
+def build_history_compactor() -> HistoryCompactor:
+    return HistoryCompactor(
+        token_budget=settings.HISTORY_TOKEN_BUDGET,
+        keep_recent_turns=settings.HISTORY_KEEP_RECENT_TURNS,
+        tool_result_max_chars=settings.HISTORY_TOOL_RESULT_MAX_CHARS,
+        summary_max_tokens=settings.HISTORY_SUMMARY_MAX_TOKENS,
+        max_cached_sessions=settings.SESSION_MAX_SESSIONS,
+    )
@@ -0,0 +1,388 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+from src.utils.logger import app_logger
+
+# Columna -> valor por defecto. Solo lo que consumen get_employee_metrics y el perfil de riesgo.
+# Baja cardinalidad: se guardan como categóricas (códigos int32 + tabla de categorías).
+CATEGORICAL_COLUMNS = {
+    "Position": "N/A",
+    "Department": "N/A",
+    "ManagerName": "N/A",
+}
+TEXT_COLUMNS = {
+    "Employee_Name": "N/A",
+    "LastPerformanceReview_Date": "N/A",
+}
+FLOAT_COLUMNS = {
+    "EmpSatisfaction": 3.0,
+    "Average_Monthly_Hours": 160.0,
+}
+INT_COLUMNS = {
+    "SpecialProjectsCount": 0,
+    "Absences": 0,
+}
+KEY_COLUMNS = ("Email", "EmpID")
+
+# Columnas a leer del CSV (el resto del fichero de HR ni se parsea)
+USED_COLUMNS = {*CATEGORICAL_COLUMNS, *TEXT_COLUMNS, *FLOAT_COLUMNS, *INT_COLUMNS, *KEY_COLUMNS}
+CSV_DTYPES = {**{name: "category" for name in CATEGORICAL_COLUMNS}, "EmpID": str}
+
+# 2: índices hash persistidos (antes, claves ordenadas con búsqueda binaria)
+SNAPSHOT_FORMAT = 2
+
+
+class EmployeeRecord:
+    __slots__ = (
+        "name", "position", "department", "manager", "satisfaction",
+        "projects", "monthly_hours", "last_review", "absences",
+    )
+
+    def __init__(self, name, position, department, manager, satisfaction, projects, monthly_hours, last_review, absences):
+        self.name = name
+        self.position = position
+        self.department = department
+        self.manager = manager
+        self.satisfaction = satisfaction
+        self.projects = projects
+        self.monthly_hours = monthly_hours
+        self.last_review = last_review
+        self.absences = absences
+
+    def to_metrics(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "position": self.position,
+            "department": self.department,
+            "manager": self.manager,
+            "satisfaction": self.satisfaction,
+            "projects": self.projects,
+            "monthly_hours": self.monthly_hours,
+            "last_review": self.last_review,
+            "absences": self.absences,
+        }
+
+
+# --- Columnas ---
+
+class CategoricalColumn:
+    """Códigos por fila (int32, memmapeables) + categorías. -1 = valor ausente."""
+    __slots__ = ("codes", "categories", "default")
+
+    def __init__(self, codes: np.ndarray, categories: List[str], default: str):
+        self.codes = codes
+        self.categories = categories
+        self.default = default
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, row: int) -> str:
+        code = self.codes[row]
+        return self.categories[code] if code >= 0 else self.default
+
+
+class StringColumn:
+    """Texto UTF-8 concatenado + offsets (n + 1): dos arrays planos, memmapeables, sin objetos Python por fila."""
+    __slots__ = ("data", "offsets")
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_values(cls, values: Sequence[str]) -> "StringColumn":
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+
+class HashKeyIndex:
+    """
+    Índice clave -> fila en arrays planos memmapeables: tabla hash con sondeo lineal, construida al guardar.
+    Una búsqueda hace un hash de la clave y, salvo colisión de los 64 bits, decodifica una sola clave para
+    confirmarla: O(1) sin reconstruir un dict al abrir el snapshot.
+    keys/rows/hashes: una entrada por clave; table: 2^k huecos con la posición de la clave o -1.
+    """
+    __slots__ = ("keys", "rows", "hashes", "table")
+
+    def __init__(self, keys: StringColumn, rows: np.ndarray, hashes: np.ndarray, table: np.ndarray):
+        self.keys = keys
+        self.rows = rows
+        self.hashes = hashes
+        self.table = table
+
+    @classmethod
+    def from_mapping(cls, mapping: Dict[str, int]) -> "HashKeyIndex":
+        keys = list(mapping)
+        hashes = np.array([_key_hash(k) for k in keys], dtype=np.uint64)
+        size = 1 << max(3, (2 * len(keys) - 1).bit_length())  # ocupación <= 50%
+        table = np.full(size, -1, dtype=np.int64)
+        mask = size - 1
+        for pos, h in enumerate(hashes.tolist()):
+            slot = h & mask
+            while table[slot] >= 0:
+                slot = (slot + 1) & mask
+            table[slot] = pos
+        return cls(StringColumn.from_values(keys), np.array(list(mapping.values()), dtype=np.int64), hashes, table)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, key: str) -> Optional[int]:
+        h = _key_hash(key)
+        mask = len(self.table) - 1
+        slot = h & mask
+        while True:
+            pos = int(self.table[slot])
+            if pos < 0:
+                return None
+            if int(self.hashes[pos]) == h and self.keys[pos] == key:
+                return int(self.rows[pos])
+            slot = (slot + 1) & mask
+
+
+class HRSnapshot:
+    """
+    Vista de solo lectura del dataset HR optimizada para consultas por empleado:
+    - Una columna = un array NumPy (float64 / int64), categórica (códigos + categorías) o texto empaquetado,
+      sin filas de DataFrame por consulta.
+    - Índices Email -> fila y EmpID -> fila construidos una vez al cargar (gana la primera aparición,
+      igual que el antiguo filtro + iloc[0]): dict en memoria, o tabla hash memmapeada si viene de disco.
+    Es inmutable: para refrescar datos se construye otra instancia y se sustituye la referencia.
+    save()/load() la persisten en formato columnar (.npy por columna) para arrancar con memmap.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, Any],
+        by_email,
+        by_empid,
+        etag: Optional[str] = None,
+    ):
+        self.columns = columns
+        self.by_email = by_email
+        self.by_empid = by_empid
+        self.size = len(next(iter(columns.values()))) if columns else 0
+        # Versión del blob de origen y momento de construcción (para exponer versión / antigüedad)
+        self.etag = etag
+        self.loaded_at = time.time()
+
+    @classmethod
+    def empty(cls) -> "HRSnapshot":
+        return cls({}, {}, {})
+
+    @classmethod
+    def from_csv(cls, source, etag: Optional[str] = None) -> "HRSnapshot":
+        """Parsea solo las columnas usadas; Department / Position / ManagerName ya como categóricas."""
+        df = pd.read_csv(source, usecols=lambda c: c in USED_COLUMNS, dtype=CSV_DTYPES)
+        return cls.from_dataframe(df, etag=etag)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, etag: Optional[str] = None) -> "HRSnapshot":
+        n = len(df)
+        columns: Dict[str, Any] = {}
+        for name, default in CATEGORICAL_COLUMNS.items():
+            if name in df.columns:
+                categorical = pd.Categorical(df[name])
+                columns[name] = CategoricalColumn(
+                    categorical.codes.astype(np.int32), [str(c) for c in categorical.categories], default
+                )
+            else:
+                columns[name] = CategoricalColumn(np.full(n, -1, dtype=np.int32), [], default)
+        for name, default in TEXT_COLUMNS.items():
+            columns[name] = (
+                df[name].fillna(default).astype(str).to_numpy(dtype=object)
+                if name in df.columns else np.full(n, default, dtype=object)
+            )
+        for name, default in FLOAT_COLUMNS.items():
+            columns[name] = (
+                pd.to_numeric(df[name], errors="coerce").fillna(default).to_numpy(dtype=np.float64)
+                if name in df.columns else np.full(n, default, dtype=np.float64)
+            )
+        for name, default in INT_COLUMNS.items():
+            columns[name] = (
+                pd.to_numeric(df[name], errors="coerce").fillna(default).to_numpy(dtype=np.int64)
+                if name in df.columns else np.full(n, default, dtype=np.int64)
+            )
+
+        return cls(columns, _build_index(df, "Email"), _build_index(df, "EmpID"), etag=etag)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def find(self, user_identifier: str) -> Optional[int]:
+        """Fila del empleado por Email (prioridad) o EmpID; None si no existe."""
+        key = str(user_identifier).lower().strip()
+        row = self.by_email.get(key)
+        if row is None:
+            row = self.by_empid.get(key)
+        return row
+
+    def record(self, row: int) -> EmployeeRecord:
+        c = self.columns
+        return EmployeeRecord(
+            name=c["Employee_Name"][row],
+            position=c["Position"][row],
+            department=c["Department"][row],
+            manager=c["ManagerName"][row],
+            satisfaction=float(c["EmpSatisfaction"][row]),
+            projects=int(c["SpecialProjectsCount"][row]),
+            monthly_hours=float(c["Average_Monthly_Hours"][row]),
+            last_review=c["LastPerformanceReview_Date"][row],
+            absences=int(c["Absences"][row]),
+        )
+
+    # --- Persistencia columnar ---
+
+    def save(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            "format": SNAPSHOT_FORMAT, "etag": self.etag, "rows": self.size,
+            "loaded_at": self.loaded_at, "categories": {},
+        }
+
+        for name in CATEGORICAL_COLUMNS:
+            column = self.columns[name]
+            np.save(directory / f"{name}.codes.npy", np.asarray(column.codes))
+            manifest["categories"][name] = column.categories
+        for name in TEXT_COLUMNS:
+            column = self.columns[name]
+            if not isinstance(column, StringColumn):
+                column = StringColumn.from_values(column)
+            np.save(directory / f"{name}.data.npy", np.asarray(column.data))
+            np.save(directory / f"{name}.offsets.npy", np.asarray(column.offsets))
+        for name in (*FLOAT_COLUMNS, *INT_COLUMNS):
+            np.save(directory / f"{name}.npy", np.asarray(self.columns[name]))
+        for key, index in (("email", self.by_email), ("empid", self.by_empid)):
+            if not isinstance(index, HashKeyIndex):
+                index = HashKeyIndex.from_mapping(index)
+            np.save(directory / f"index.{key}.data.npy", np.asarray(index.keys.data))
+            np.save(directory / f"index.{key}.offsets.npy", np.asarray(index.keys.offsets))
+            np.save(directory / f"index.{key}.rows.npy", np.asarray(index.rows))
+            np.save(directory / f"index.{key}.hashes.npy", np.asarray(index.hashes))
+            np.save(directory / f"index.{key}.table.npy", np.asarray(index.table))
+
+        # El manifiesto va al final: un directorio sin manifiesto es una escritura incompleta
+        (directory / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, directory: Path) -> "HRSnapshot":
+        """Abre el snapshot con memmap: las páginas se leen del disco bajo demanda (page cache compartido)."""
+        manifest = json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"formato de snapshot {manifest.get('format')} no soportado")
+
+        columns: Dict[str, Any] = {}
+        for name, default in CATEGORICAL_COLUMNS.items():
+            columns[name] = CategoricalColumn(_mmap(directory / f"{name}.codes.npy"), manifest["categories"][name], default)
+        for name in TEXT_COLUMNS:
+            columns[name] = StringColumn(_mmap(directory / f"{name}.data.npy"), _mmap(directory / f"{name}.offsets.npy"))
+        for name in (*FLOAT_COLUMNS, *INT_COLUMNS):
+            columns[name] = _mmap(directory / f"{name}.npy")
+
+        indexes = [
+            HashKeyIndex(
+                StringColumn(_mmap(directory / f"index.{key}.data.npy"), _mmap(directory / f"index.{key}.offsets.npy")),
+                _mmap(directory / f"index.{key}.rows.npy"),
+                _mmap(directory / f"index.{key}.hashes.npy"),
+                _mmap(directory / f"index.{key}.table.npy"),
+            )
+            for key in ("email", "empid")
+        ]
+        snapshot = cls(columns, indexes[0], indexes[1], etag=manifest["etag"])
+        if snapshot.size != manifest["rows"]:
+            raise ValueError("snapshot incompleto (filas no coinciden con el manifiesto)")
+        # La antigüedad cuenta desde la descarga original, no desde que se abrió del disco
+        snapshot.loaded_at = manifest.get("loaded_at", snapshot.loaded_at)
+        return snapshot
+
+
+class SnapshotCache:
+    """
+    Caché local de snapshots columnar por ETag del blob: <root>/<etag>/ + fichero CURRENT.
+    Al arrancar se abre el último snapshot con memmap (sin descarga ni CSV) y el ETag sirve
+    para la petición condicional al Blob. Se conservan los `keep` más recientes.
+    """
+
+    def __init__(self, root: Path, keep: int = 2):
+        self.root = root
+        self.keep = keep
+
+    def load_current(self) -> Optional[HRSnapshot]:
+        pointer = self.root / "CURRENT"
+        if not pointer.exists():
+            return None
+        try:
+            return HRSnapshot.load(self.root / pointer.read_text(encoding="utf-8").strip())
+        except Exception as e:
+            app_logger.warning(f"⚠️ Snapshot HR local ilegible, se ignora: {e}")
+            return None
+
+    def store(self, snapshot: HRSnapshot) -> HRSnapshot:
+        """Escribe el snapshot y devuelve su versión memmapeada (menos memoria residente que la recién parseada)."""
+        name = _safe_name(snapshot.etag or f"local-{int(time.time())}")
+        final = self.root / name
+        tmp = self.root / f".{name}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        snapshot.save(tmp)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+
+        pointer_tmp = self.root / f".CURRENT.tmp-{os.getpid()}"
+        pointer_tmp.write_text(name, encoding="utf-8")
+        os.replace(pointer_tmp, self.root / "CURRENT")
+
+        self._prune(keep_name=name)
+        return HRSnapshot.load(final)
+
+    def _prune(self, keep_name: str):
+        # En Linux borrar ficheros memmapeados es seguro: el mapping sigue vivo hasta liberarse
+        entries = sorted(
+            (p for p in self.root.iterdir() if p.is_dir() and not p.name.startswith(".") and p.name != keep_name),
+            key=lambda p: p.stat().st_mtime, reverse=True,
+        )
+        for old in entries[self.keep - 1:]:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def _mmap(path: Path) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # Arrays de tamaño cero no se pueden mapear
+        return np.load(path)
+
+
+def _key_hash(key: str) -> int:
+    """Hash estable entre procesos (hash() de Python cambia con PYTHONHASHSEED): va persistido en disco."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _safe_name(etag: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "", etag) or "snapshot"
+
+
+def _build_index(df: pd.DataFrame, column: str) -> Dict[str, int]:
+    """Clave normalizada (str, minúsculas, sin espacios) -> posición de fila."""
+    if column not in df.columns:
+        return {}
+    values = df[column]
+    rows = np.flatnonzero(values.notna().to_numpy())
+    keys = values.iloc[rows].astype(str).str.lower().str.strip().tolist()
+    # Recorrido inverso: con claves duplicadas se queda la primera fila
+    return dict(zip(reversed(keys), reversed(rows.tolist())))
@@ -0,0 +1,117 @@
+from typing import Any, Dict, Optional
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
+from src.config import settings
+from src.utils.logger import app_logger
+from src.utils.metrics import metrics_registry
+
+
+class HttpTransport:
+    """
+    Capa de transporte HTTP compartida por todos los clientes de Azure y OpenAI.
+    - Azure SDK (Cosmos, Search, Blob, Content Safety, Language, Automation, Document Intelligence):
+      una única requests.Session con pools keep-alive por host, vía RequestsTransport(session_owner=False).
+    - OpenAI (Semantic Kernel y embeddings): clientes httpx compartidos (async / sync) con límites de pool.
+    Un turno de /chat reutiliza conexiones TLS ya abiertas en lugar de negociar una por cliente.
+    """
+
+    def __init__(self, pool_connections: int, pool_maxsize: int, max_keepalive: int, timeout: float):
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        # pool_connections: hosts distintos con pool propio; pool_maxsize: conexiones keep-alive por host.
+        # pool_block=False: en un pico se abren conexiones extra en lugar de bloquear (no se devuelven al pool).
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=False)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        self._limits = httpx.Limits(
+            max_connections=pool_maxsize,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=30.0,
+        )
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._sync_client: Optional[httpx.Client] = None
+
+    # --- Clientes ---
+
+    def azure_transport(self) -> RequestsTransport:
+        """Transporte para un cliente del Azure SDK. Cerrar el cliente no cierra la sesión compartida."""
+        return RequestsTransport(session=self.session, session_owner=False, connection_timeout=self.timeout)
+
+    @property
+    def async_httpx(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(limits=self._limits, timeout=httpx.Timeout(self.timeout, read=120.0))
+        return self._async_client
+
+    @property
+    def sync_httpx(self) -> httpx.Client:
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(limits=self._limits, timeout=httpx.Timeout(self.timeout, read=120.0))
+        return self._sync_client
+
+    # --- Observabilidad ---
+
+    def stats(self) -> Dict[str, Any]:
+        hosts = {}
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue  # expulsado del LRU de pools mientras iterábamos
+            # La cola se pre-llena con None: huecos libres = qsize, conexiones ociosas = no-None
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+            available = pool.pool.qsize() if pool.pool else 0
+            hosts[f"{key.key_scheme}://{key.key_host}"] = {
+                "in_use": max(self.pool_maxsize - available, 0),
+                "idle": idle,
+                "opened": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+
+        return {
+            "requests": {
+                "max_per_host": self.pool_maxsize,
+                "in_use": sum(h["in_use"] for h in hosts.values()),
+                "idle": sum(h["idle"] for h in hosts.values()),
+                "hosts": hosts,
+            },
+            "httpx_async": self._httpx_stats(self._async_client),
+            "httpx_sync": self._httpx_stats(self._sync_client),
+        }
+
+    @staticmethod
+    def _httpx_stats(client) -> Dict[str, int]:
+        if client is None:
+            return {"connections": 0, "idle": 0}
+        try:
+            # httpx no expone su pool: leemos el de httpcore (best effort)
+            connections = list(client._transport._pool.connections)
+        except AttributeError:
+            return {"connections": 0, "idle": 0}
+        return {"connections": len(connections), "idle": sum(1 for c in connections if c.is_idle())}
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        if self._sync_client is not None:
+            self._sync_client.close()
+        self.session.close()
+        app_logger.info("🔌 Transporte HTTP compartido cerrado.")
+
+
+http_transport = HttpTransport(
+    pool_connections=settings.HTTP_POOL_CONNECTIONS,
+    pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+    max_keepalive=settings.HTTP_MAX_KEEPALIVE,
+    timeout=settings.HTTP_TIMEOUT,
+)
+
+metrics_registry.gauge("neurodesk_http_pool_in_use", "Conexiones HTTP (Azure SDK) en uso", lambda: http_transport.stats()["requests"]["in_use"])
+metrics_registry.gauge("neurodesk_http_pool_idle", "Conexiones HTTP (Azure SDK) keep-alive ociosas", lambda: http_transport.stats()["requests"]["idle"])
+metrics_registry.gauge("neurodesk_httpx_connections", "Conexiones abiertas del cliente OpenAI (httpx async)", lambda: http_transport.stats()["httpx_async"]["connections"])
@@ -0,0 +1,75 @@
+import json
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+from src.config import settings
+from src.utils.logger import app_logger
+
+def _build_fold_table() -> Dict[int, str]:
+    """Tabla de traducción para quitar acentos (Latin-1 + Latin Extended-A) sin pasar por NFKD en cada mensaje."""
+    table = {}
+    for code in range(0xC0, 0x180):
+        char = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+        if base and base != char:
+            table[code] = base
+    return table
+
+_FOLD_TABLE = _build_fold_table()
+
+def normalize_text(text: str) -> str:
+    """Minúsculas + sin acentos: 'Caído' y 'caido' producen lo mismo."""
+    return text.lower().translate(_FOLD_TABLE)
+
+
+class IntentEngine:
+    """
+    Motor de intenciones precompilado: una única alternancia con un grupo con nombre por
+    intención, construida una vez al arrancar. Un solo barrido del mensaje devuelve todas
+    las intenciones presentes. La tabla de patrones viene de datos (JSON).
+    """
+
+    def __init__(self, table: Dict[str, List[str]]):
+        self.intents = list(table.keys())
+        groups = []
+        for intent, phrases in table.items():
+            # Frases más largas primero para que la alternancia no corte antes de tiempo
+            alternatives = sorted({normalize_text(p) for p in phrases}, key=len, reverse=True)
+            body = "|".join(re.escape(a).replace(r"\ ", r"\s+") for a in alternatives)
+            groups.append(f"(?P<{intent}>{body})")
+        self._regex = re.compile(r"\b(?:" + "|".join(groups) + r")\b")
+
+    @classmethod
+    def from_file(cls, path: Path) -> "IntentEngine":
+        with open(path, encoding="utf-8") as f:
+            table = json.load(f)
+        engine = cls(table)
+        app_logger.info(f"✅ Intent Engine compilado ({len(table)} intenciones, {sum(map(len, table.values()))} patrones).")
+        return engine
+
+    def scan(self, message: str) -> Set[str]:
+        """Intenciones presentes en el mensaje (un único barrido)."""
+        found: Set[str] = set()
+        for match in self._regex.finditer(normalize_text(message)):
+            found.add(match.lastgroup)
+            if len(found) == len(self.intents):
+                break
+        return found
+
+    def matches_any(self, message: str, intents: Iterable[str]) -> bool:
+        """Atajo para decisiones de ruteo baratas (p.ej. '¿requiere herramientas IT?')."""
+        return not self.scan(message).isdisjoint(intents)
+
+    def detect(self, message: str) -> dict:
+        """Formato histórico de _detect_critical_intent (flags + urgencia)."""
+        found = self.scan(message)
+        return {
+            "needs_restart": "needs_restart" in found,
+            "needs_upload": "needs_upload" in found,
+            "needs_audit": "needs_audit" in found,
+            "needs_human": "needs_human" in found,
+            "urgency": "high" if "urgent" in found else "normal"
+        }
+
+intent_engine = IntentEngine.from_file(settings.INTENT_PATTERNS_PATH)
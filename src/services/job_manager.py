@@ -0,0 +1,354 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from src.config import settings
+from src.utils.logger import app_logger
+from src.utils.metrics import metrics_registry
+
+TERMINAL_STATUSES = {"Completed", "Failed", "Suspended", "Stopped"}
+# Estado propio (no de Azure): se dejó de sondear sin estado terminal; el job puede seguir y acabar bien
+TIMED_OUT = "TimedOut"
+
+JOB_DURATION = metrics_registry.histogram(
+    "neurodesk_runbook_job_duration_seconds",
+    "Duración de jobs de Azure Automation hasta estado terminal",
+    ("runbook", "status"),
+    buckets=(5.0, 10.0, 20.0, 30.0, 60.0, 90.0, 120.0, 180.0, 300.0)
+)
+JOBS_COALESCED = metrics_registry.counter(
+    "neurodesk_runbook_coalesced_total",
+    "Llamadas a runbook que se unieron a un job existente en lugar de lanzar otro",
+    ("runbook",)
+)
+
+
+def flight_key(runbook: str, parameters: Dict[str, Any]) -> str:
+    """Clave de coalescencia: runbook + parámetros normalizados ('Nexo-Emprendedor ' == 'nexo-emprendedor')."""
+    normalized = {
+        str(k).strip().lower(): v.strip().lower() if isinstance(v, str) else v
+        for k, v in parameters.items()
+    }
+    return f"{runbook}:{json.dumps(normalized, sort_keys=True, default=str)}"
+
+
+class RunbookJob:
+    __slots__ = (
+        "job_id", "runbook", "parameters", "user_id", "description", "max_wait_seconds",
+        "status", "azure_status", "attempts", "started_at", "completed_at", "timed_out", "output", "ticket", "ticket_id",
+        "linked_users", "done",
+    )
+
+    def __init__(self, runbook: str, parameters: Dict[str, Any], user_id: str, description: str, max_wait_seconds: int):
+        self.job_id = str(uuid.uuid4())
+        self.runbook = runbook
+        self.parameters = parameters
+        self.user_id = user_id
+        self.description = description
+        self.max_wait_seconds = max_wait_seconds
+        self.status = "New"
+        self.azure_status: Optional[str] = None  # último estado visto en Azure (difiere de status tras un timeout)
+        self.attempts = 0
+        self.started_at = time.time()
+        self.completed_at: Optional[float] = None
+        self.timed_out = False
+        self.output: Optional[str] = None
+        self.ticket: Optional[Dict[str, Any]] = None
+        self.ticket_id: Optional[str] = None
+        # Usuarios que reportaron lo mismo y se unieron a este job (single-flight)
+        self.linked_users: List[str] = []
+        self.done: Optional[asyncio.Future] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.completed_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "runbook": self.runbook,
+            "user_id": self.user_id,
+            "status": self.status,
+            "azure_status": self.azure_status,
+            "finished": self.completed_at is not None,
+            "timed_out": self.timed_out,
+            "attempts": self.attempts,
+            "elapsed_ms": int((end - self.started_at) * 1000),
+            "started_at": datetime.utcfromtimestamp(self.started_at).isoformat(),
+            "completed_at": datetime.utcfromtimestamp(self.completed_at).isoformat() if self.completed_at else None,
+            "ticket_id": self.ticket_id,
+            "linked_users": len(self.linked_users),
+            "output": self.output,
+            "tracked_here": True,
+        }
+
+
+class RunbookJobManager:
+    """
+    Gestor asíncrono de jobs de Azure Automation.
+    submit() crea el job y devuelve el handle enseguida; el sondeo corre en una tarea de fondo
+    con backoff adaptativo (rápido tras un cambio de estado, más espaciado si no hay novedades)
+    y al terminar lee el output, persiste el ticket y notifica a los suscriptores (SSE /jobs/{id}/events).
+    Las llamadas al SDK (síncrono) van al executor: el event loop nunca duerme en time.sleep.
+
+    submit_shared() añade single-flight: llamadas con el mismo (runbook, parámetros normalizados)
+    se unen al job en curso, o al último completado con éxito dentro de la ventana de cooldown,
+    y quedan vinculadas a su ticket en lugar de lanzar N reinicios.
+
+    El backend (ITAgentPlugin) aporta: _create_job, _get_job_status, _find_job_status, _read_job_output,
+    _normalize_output, _persist_ticket y _link_ticket.
+
+    El estado de los jobs y el single-flight viven en la memoria de este proceso. Con varios workers,
+    lookup() resuelve los jobs lanzados por otra instancia consultando su estado en Azure (sin output
+    ni ticket, que gestiona quien lo lanzó), y la coalescencia solo une llamadas que llegan al mismo worker.
+    """
+
+    def __init__(self, min_delay: float, max_delay: float, max_tracked: int, coalesce_cooldown: float):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_tracked = max_tracked
+        self.coalesce_cooldown = coalesce_cooldown
+        self.backend = None
+        self._flights: Dict[str, RunbookJob] = {}
+
+        self._jobs: "OrderedDict[str, RunbookJob]" = OrderedDict()
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def bind(self, backend):
+        self.backend = backend
+
+    # --- API ---
+
+    async def submit(
+        self,
+        runbook: str,
+        parameters: Dict[str, Any],
+        user_id: str,
+        description: str,
+        max_wait_seconds: int = 120,
+    ) -> RunbookJob:
+        job = RunbookJob(runbook, parameters, user_id, description, max_wait_seconds)
+        await self._start(job)
+        return job
+
+    async def submit_shared(
+        self,
+        runbook: str,
+        parameters: Dict[str, Any],
+        user_id: str,
+        description: str,
+        max_wait_seconds: int = 120,
+    ) -> Tuple[RunbookJob, bool]:
+        """Como submit(), pero coalescente. Devuelve (job, se_unió_a_uno_existente)."""
+        key = flight_key(runbook, parameters)
+        job = self._flights.get(key)
+        if job is not None and self._joinable(job):
+            await self._link(job, user_id)
+            return job, True
+
+        job = RunbookJob(runbook, parameters, user_id, description, max_wait_seconds)
+        # Se registra ANTES de crear el job en Azure: quien llegue durante la creación ya se une
+        self._flights[key] = job
+        try:
+            await self._start(job)
+        except Exception:
+            if self._flights.get(key) is job:
+                del self._flights[key]
+            raise
+        return job, False
+
+    async def wait(self, job: RunbookJob, timeout: Optional[float] = None) -> RunbookJob:
+        """Espera (sin bloquear el loop) a que el job termine; el sondeo sigue aunque venza el timeout."""
+        await asyncio.wait_for(asyncio.shield(job.done), timeout=timeout)
+        return job
+
+    def get(self, job_id: str) -> Optional[RunbookJob]:
+        return self._jobs.get(job_id)
+
+    async def lookup(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Estado de un job: el de este proceso si lo lanzó él; si no, el de Azure (otro worker lo lanzó).
+        None si Azure tampoco lo conoce. Lanza si Azure no responde (el llamante devuelve 503, no 404).
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.backend is None:
+            return None
+        status = await asyncio.get_running_loop().run_in_executor(None, self.backend._find_job_status, job_id)
+        if status is None:
+            return None
+        return {
+            "job_id": job_id,
+            "status": status,
+            "azure_status": status,
+            "finished": status in TERMINAL_STATUSES,
+            "output": None,
+            "ticket_id": None,
+            "tracked_here": False,
+            "note": "Job gestionado por otra instancia: solo se conoce su estado en Azure.",
+        }
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(job_id, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self._subscribers.pop(job_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self._jobs), "running": len(self._tasks), "flights": len(self._flights)}
+
+    # --- Internos ---
+
+    async def _start(self, job: RunbookJob):
+        loop = asyncio.get_running_loop()
+        job.done = loop.create_future()
+        self._track(job)
+
+        app_logger.info(f"🚀 [AZURE] Iniciando Job {job.job_id} para Runbook '{job.runbook}'...")
+        try:
+            await loop.run_in_executor(None, self.backend._create_job, job.runbook, job.parameters, job.job_id)
+        except Exception as e:
+            # Quien ya se unió a este job (single-flight) debe ver el fallo, no esperar para siempre
+            job.status = "Failed"
+            job.output = f"Error de sistema al invocar automatización: {str(e)}"
+            job.completed_at = time.time()
+            job.done.set_result(job)
+            self._publish(job, "done")
+            raise
+
+        self._tasks[job.job_id] = asyncio.create_task(self._watch(job))
+
+    def _joinable(self, job: RunbookJob) -> bool:
+        if not job.done.done():
+            return True
+        # Tras terminar, solo un reinicio exitoso reciente evita otro (si falló, se permite reintentar)
+        return (
+            job.status == "Completed"
+            and not job.timed_out
+            and time.time() - job.completed_at < self.coalesce_cooldown
+        )
+
+    async def _link(self, job: RunbookJob, user_id: str):
+        JOBS_COALESCED.inc(job.runbook)
+        if user_id == job.user_id or user_id in job.linked_users:
+            return
+        job.linked_users.append(user_id)
+        app_logger.info(f"🔗 {user_id} vinculado al Job {job.job_id} ({job.runbook}); no se lanza otro")
+        if job.ticket is not None:
+            # El ticket ya existe: lo actualizamos con el nuevo afectado
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.backend._link_ticket, job.ticket, list(job.linked_users)
+            )
+
+    def _track(self, job: RunbookJob):
+        self._jobs[job.job_id] = job
+        # Acotado: expulsamos los jobs terminados más antiguos (los activos nunca)
+        if len(self._jobs) > self.max_tracked:
+            for job_id in [j for j, old in self._jobs.items() if old.completed_at is not None]:
+                del self._jobs[job_id]
+                if len(self._jobs) <= self.max_tracked:
+                    break
+
+    def _publish(self, job: RunbookJob, event: str):
+        payload = job.to_dict()
+        for queue in self._subscribers.get(job.job_id, []):
+            queue.put_nowait((event, payload))
+
+    async def _watch(self, job: RunbookJob):
+        loop = asyncio.get_running_loop()
+        delay = self.min_delay
+        try:
+            while True:
+                try:
+                    status = await loop.run_in_executor(None, self.backend._get_job_status, job.job_id)
+                except Exception as e:
+                    app_logger.warning(f"⚠️ Fallo consultando estado Job {job.job_id}: {e}")
+                    status = "Unknown"
+                job.attempts += 1
+
+                if status != job.status and status != "Unknown":
+                    job.status = job.azure_status = status
+                    self._publish(job, "status")
+                    delay = self.min_delay  # hubo progreso: volvemos a mirar pronto
+                else:
+                    delay = min(delay * 1.6, self.max_delay)
+
+                if status in TERMINAL_STATUSES:
+                    break
+                if time.time() - job.started_at >= job.max_wait_seconds:
+                    job.timed_out = True
+                    job.status = TIMED_OUT
+                    app_logger.error(f"⏱️ Timeout Job {job.job_id}. Último estado en Azure: {job.azure_status}")
+                    break
+                await asyncio.sleep(delay)
+
+            await self._finish(job)
+        except Exception as e:
+            app_logger.error(f"❌ Error crítico Runbook '{job.runbook}' (Job {job.job_id}): {e}")
+            job.output = f"Error de sistema al invocar automatización: {str(e)}"
+            job.completed_at = time.time()
+        finally:
+            self._tasks.pop(job.job_id, None)
+            if not job.done.done():
+                job.done.set_result(job)
+            self._publish(job, "done")
+
+    async def _finish(self, job: RunbookJob):
+        loop = asyncio.get_running_loop()
+        if job.status == "Completed":
+            # El output puede tardar unos segundos en estar disponible: reintento corto y asíncrono
+            output_text = None
+            for pause in (0.0, 1.0, 2.0):
+                if pause:
+                    await asyncio.sleep(pause)
+                output_text = await loop.run_in_executor(None, self.backend._read_job_output, job.job_id)
+                if output_text:
+                    break
+            job.output = self.backend._normalize_output(output_text)
+        elif job.status == TIMED_OUT:
+            job.output = (
+                f"El proceso en la nube no terminó en {job.max_wait_seconds}s (último estado: {job.azure_status}). "
+                "Puede seguir ejecutándose; queda pendiente de verificación."
+            )
+        else:
+            job.output = f"El proceso en la nube finalizó con estado: {job.status}."
+
+        job.completed_at = time.time()
+        JOB_DURATION.observe(job.completed_at - job.started_at, job.runbook, job.status)
+
+        metrics = {
+            "status_final": job.status,
+            "attempts": job.attempts,
+            "duration_ms": int((job.completed_at - job.started_at) * 1000),
+            "started_at": datetime.utcfromtimestamp(job.started_at).isoformat(),
+            "completed_at": datetime.utcfromtimestamp(job.completed_at).isoformat(),
+        }
+        linked = list(job.linked_users)
+        ticket = await loop.run_in_executor(
+            None, self.backend._persist_ticket,
+            job.user_id, job.runbook, job.description, job.job_id, job.status, job.output, metrics, linked
+        )
+        job.ticket = ticket
+        job.ticket_id = ticket.get("ticket_id") if ticket else None
+
+        # Usuarios que se unieron mientras se guardaba el ticket
+        if ticket and len(job.linked_users) > len(linked):
+            await loop.run_in_executor(None, self.backend._link_ticket, ticket, list(job.linked_users))
+
+
+job_manager = RunbookJobManager(
+    min_delay=settings.JOBS_POLL_MIN_DELAY,
+    max_delay=settings.JOBS_POLL_MAX_DELAY,
+    max_tracked=settings.JOBS_MAX_TRACKED,
+    coalesce_cooldown=settings.JOBS_COALESCE_COOLDOWN,
+)
+
+metrics_registry.gauge("neurodesk_runbook_jobs_running", "Jobs de Automation en sondeo", lambda: job_manager.stats()["running"])
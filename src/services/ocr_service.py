@@ -4,6 +4,8 @@ from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeResult
 from src.config import settings
 from src.utils.logger import app_logger
+from src.services.http_transport import http_transport
+from src.services.service_registry import services
 
 
 # Mapeo simple de content-types para mejor precisión; octet-stream funciona como fallback
@@ -29,7 +31,8 @@ class OcrService:
         try:
             self.client = DocumentIntelligenceClient(
                 endpoint=self.endpoint,
-                credential=AzureKeyCredential(self.key)
+                credential=AzureKeyCredential(self.key),
+                transport=http_transport.azure_transport()
             )
             app_logger.info("✅ OCR Service (Document Intelligence) conectado.")
         except Exception as e:
@@ -82,4 +85,4 @@ class OcrService:
 
 
 # Instancia global del servicio
-ocr_service = OcrService()
+ocr_service = services.register("ocr_service", OcrService, ready_check=lambda s: s.client is not None, critical=False)
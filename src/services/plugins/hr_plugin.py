@@ -1,6 +1,7 @@
 from semantic_kernel.functions import kernel_function
-from typing import Annotated
+from typing import Annotated, Optional
 from src.services.data_analyst import data_analyst
+from src.utils.logger import app_logger
 
 class HRAgentPlugin:
     """
@@ -19,7 +20,7 @@ class HRAgentPlugin:
         """
         Consulta el perfil del empleado en tiempo real cruzando datos de Blob Storage.
         """
-        print(f"👥 [HR AGENT] Consultando métricas para: {user_identifier}")
+        app_logger.info(f"👥 [HR AGENT] Consultando métricas para: {user_identifier}")
         
         # Delegación estricta al servicio de datos
         metrics = data_analyst.get_employee_metrics(user_identifier)
@@ -51,4 +52,49 @@ class HRAgentPlugin:
             f"   - Ausencias recientes: {metrics['absences']}\n"
             f"   - Última revisión: {metrics['last_review']}\n"
             "------------------------------------------------"
-        )
\ No newline at end of file
+        )
+
+    @kernel_function(
+        description="Resume el riesgo de burnout de toda la plantilla, de un departamento o del equipo de un manager, agregado por departamento o manager.",
+        name="analyze_team_risk"
+    )
+    def analyze_team_risk(
+        self,
+        group_by: Annotated[str, "Dimensión de agregación: 'department' o 'manager'"] = "department",
+        department: Annotated[Optional[str], "Departamento a analizar (opcional)"] = None,
+        manager: Annotated[Optional[str], "Nombre del manager cuyo equipo se analiza (opcional)"] = None,
+    ) -> str:
+        """
+        Scoring vectorizado de toda la selección en una sola llamada al DataAnalyst (sin un perfil por empleado).
+        """
+        app_logger.info(f"👥 [HR AGENT] Riesgo de equipo: group_by={group_by} department={department} manager={manager}")
+
+        report = data_analyst.get_workforce_risk(group_by=group_by, department=department, manager=manager, top=5)
+
+        if "error" in report:
+            if report["error"] == "HR Database Offline":
+                return "ERROR DE SISTEMA: La base de datos de RRHH no está accesible en Azure Blob Storage."
+            return f"NO ENCONTRADO: {report['error']}."
+
+        summary = report["summary"]
+        lines = [
+            f"--- RIESGO DE BURNOUT ({summary['employees']} empleados, por {group_by}) ---",
+            f"Críticos: {summary['critical']} | Medios: {summary['medium']} | Bajos: {summary['low']} | Riesgo medio: {summary['avg_risk_score']}",
+        ]
+        if not report["ticket_data_available"]:
+            lines.append("⚠️ AVISO: Tickets de IT no disponibles; la puntuación solo refleja datos de RRHH (riesgo infraestimado).")
+        lines.append("📊 Grupos con más riesgo:")
+        for group in report["groups"][:10]:
+            lines.append(
+                f"   - {group['name']}: {group['critical']} críticos / {group['employees']} "
+                f"(riesgo medio {group['avg_risk_score']}, satisfacción {group['avg_satisfaction']}, horas/mes {group['avg_monthly_hours']})"
+            )
+        if report["top_at_risk"]:
+            lines.append("⚠️ Personas con mayor riesgo:")
+            for person in report["top_at_risk"]:
+                lines.append(
+                    f"   - {person['name']} ({person['department']}, manager {person['manager']}): "
+                    f"{person['risk_level']} ({person['risk_score']}), tickets recientes {person['recent_tickets']}"
+                )
+        lines.append("------------------------------------------------")
+        return "\n".join(lines)
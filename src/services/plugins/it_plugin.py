@@ -1,16 +1,26 @@
 from semantic_kernel.functions import kernel_function
 from typing import Annotated, Dict, Any, Optional, List
-import time, uuid, json, random
+import json, random, uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 
-from azure.identity import DefaultAzureCredential
 from azure.mgmt.automation import AutomationClient
 from azure.core.credentials import AccessToken
-import requests
+from azure.core.exceptions import ResourceNotFoundError
 
 from src.config import settings
 from src.utils.logger import app_logger
+from src.services.credentials import azure_credential
+from src.services.escalation_outbox import escalation_outbox
+from src.services.http_transport import http_transport
+from src.services.job_manager import TIMED_OUT, job_manager
+from src.services.result_cache import activity_logs_cache
 from src.services.ticket_store import ticket_store
+from src.services.plugins.tool_result import ToolResult
+
+MANAGEMENT_SCOPE = "https://management.azure.com/.default"
+# Los streams del job devuelven solo la salida de usuario (Output), no Verbose/Progress/Warning
+OUTPUT_STREAM_FILTER = "properties/streamType eq 'Output'"
 
 
 class ITAgentPlugin:
@@ -27,9 +37,18 @@ class ITAgentPlugin:
             self.credential = None
             return
 
+        # Lectura del output: streams y REST compiten en un pool propio (el job manager ya ocupa el executor del loop)
+        self._output_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="job-output")
+
         try:
-            self.credential = DefaultAzureCredential()
-            self.client = AutomationClient(self.credential, self.subscription_id)
+            # Credencial compartida con caché de token: ni el SDK ni el REST repiten el viaje a AAD por job
+            self.credential = azure_credential
+            azure_credential.prefetch(MANAGEMENT_SCOPE)
+            self.client = AutomationClient(
+                self.credential, self.subscription_id, transport=http_transport.azure_transport()
+            )
+            # El gestor de jobs usa este plugin como backend (crear, consultar, leer output, ticket)
+            job_manager.bind(self)
             app_logger.info("✅ Azure Automation Client conectado.")
         except Exception as e:
             app_logger.error(f"❌ Error conectando Automation Client: {e}")
@@ -45,47 +64,25 @@ class ITAgentPlugin:
             parameters={"runbook": {"name": runbook_name}, "parameters": parameters},
         )
 
-    def _poll_job_status(self, job_id: str, max_wait_seconds: int = 120) -> Dict[str, Any]:
-        start_ts = time.time()
-        status = "New"
-        attempts, delay = 0, 2.0
-        terminal = {"Completed", "Failed", "Suspended", "Stopped"}
-
-        while True:
-            try:
-                job_info = self.client.job.get(self.automation_rg, self.automation_account, job_id)
-                status = job_info.status
-            except Exception as e:
-                app_logger.warning(f"⚠️ Fallo consultando estado Job {job_id}: {e}")
-                status = "Unknown"
-
-            attempts += 1
-            if attempts % 3 == 0:
-                app_logger.info(f"    ⏳ Job {job_id} estado: {status} (attempt={attempts})")
+    def _get_job_status(self, job_id: str) -> str:
+        job_info = self.client.job.get(self.automation_rg, self.automation_account, job_id)
+        return job_info.status
 
-            if status in terminal:
-                break
-
-            if (time.time() - start_ts) >= max_wait_seconds:
-                app_logger.error(f"⏱️ Timeout Job {job_id}. Último estado: {status}")
-                break
-
-            time.sleep(delay)
-            delay = min(delay * 1.5, 6.0)
-
-        end_ts = time.time()
-        return {
-            "status_final": status,
-            "attempts": attempts,
-            "duration_ms": int((end_ts - start_ts) * 1000),
-            "started_at": datetime.utcfromtimestamp(start_ts).isoformat(),
-            "completed_at": datetime.utcfromtimestamp(end_ts).isoformat(),
-        }
+    def _find_job_status(self, job_id: str) -> Optional[str]:
+        """Como _get_job_status, pero None si el job no existe (consultas de jobs lanzados por otro worker)."""
+        if not self.client:
+            return None
+        try:
+            return self._get_job_status(job_id)
+        except ResourceNotFoundError:
+            return None
 
     def _read_job_output_streams(self, job_id: str) -> Optional[str]:
         try:
             streams: List[Any] = list(
-                self.client.job_stream.list_by_job(self.automation_rg, self.automation_account, job_id)
+                self.client.job_stream.list_by_job(
+                    self.automation_rg, self.automation_account, job_id, filter=OUTPUT_STREAM_FILTER
+                )
             )
             chunks = [
                 s.stream_text
@@ -100,12 +97,11 @@ class ITAgentPlugin:
             return None
 
     def _get_bearer_token(self) -> str:
-        token: AccessToken = self.credential.get_token("https://management.azure.com/.default")
+        token: AccessToken = self.credential.get_token(MANAGEMENT_SCOPE)
         return token.token
 
     def _read_job_output_rest(self, job_id: str) -> Optional[str]:
         try:
-            time.sleep(2)
             url = (
                 f"https://management.azure.com/subscriptions/{self.subscription_id}"
                 f"/resourceGroups/{self.automation_rg}"
@@ -113,7 +109,7 @@ class ITAgentPlugin:
                 f"/jobs/{job_id}/output?api-version=2023-11-01"
             )
             headers = {"Authorization": f"Bearer {self._get_bearer_token()}"}
-            resp = requests.get(url, headers=headers, timeout=20)
+            resp = http_transport.session.get(url, headers=headers, timeout=20)
             if resp.status_code == 200:
                 text = (resp.text or "").strip()
                 return text or None
@@ -123,6 +119,24 @@ class ITAgentPlugin:
             app_logger.warning(f"⚠️ Fallo REST Get-Output {job_id}: {e}")
             return None
 
+    def _read_job_output(self, job_id: str) -> Optional[str]:
+        """
+        Lanza a la vez la lectura por streams y por REST y se queda con la primera que traiga texto.
+        Si la primera en terminar viene vacía se espera a la otra. La perdedora termina en segundo plano.
+        El job manager reintenta (con pausa asíncrona) si el output aún no está disponible.
+        """
+        pending = {
+            self._output_pool.submit(self._read_job_output_streams, job_id),
+            self._output_pool.submit(self._read_job_output_rest, job_id),
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                text = future.result()  # ambas lecturas capturan sus excepciones y devuelven None
+                if text:
+                    return text
+        return None
+
     def _normalize_output(self, raw_text: Optional[str]) -> str:
         if not raw_text:
             return "El Runbook finalizó con éxito (sin salida de texto)."
@@ -145,6 +159,7 @@ class ITAgentPlugin:
         status_final: str,
         output_text: str,
         metrics: Dict[str, Any],
+        linked_users: Optional[List[str]] = None,
     ) -> Dict[str, Any]:
         record = {
             "ticket_id": f"AUTO-{random.randint(1000, 9999)}",
@@ -153,11 +168,14 @@ class ITAgentPlugin:
             "subject": f"Ejecución de {runbook_name}",
             "description": description,
             "priority": "High",
-            "status": "Resolved" if status_final == "Completed" else "Closed",
+            # Un timeout no es un fallo: el runbook puede terminar bien en Azure, el ticket queda abierto
+            "status": {"Completed": "Resolved", TIMED_OUT: "Pending Verification"}.get(status_final, "Closed"),
             "automation_job_id": job_id,
             "automation_status": status_final,
             "automation_output": (output_text or "")[:2000],
             "metrics": metrics,
+            "linked_users": list(linked_users or []),
+            "affected_users_count": 1 + len(linked_users or []),
             "created_at": datetime.utcnow().isoformat(),
         }
         try:
@@ -167,21 +185,19 @@ class ITAgentPlugin:
             app_logger.warning(f"⚠️ No se pudo persistir el ticket {record['ticket_id']}: {e}")
         return record
 
-    def _persist_escalation_ticket(
-        self,
-        user_id: str,
-        reason: str,
-        urgency: str,
-        logic_app_response: Optional[Dict[str, Any]] = None
-    ) -> Dict[str, Any]:
-        """
-        Persiste tickets de escalado a humano en Cosmos DB
-        """
-        escalation_id = f"ESC-{random.randint(1000, 9999)}"
-        
-        record = {
-            "ticket_id": escalation_id,
-            "user_id": user_id,
+    def _link_ticket(self, record: Dict[str, Any], linked_users: List[str]):
+        """Añade a un ticket de automatización ya guardado los usuarios que se unieron al mismo job."""
+        record["linked_users"] = list(linked_users)
+        record["affected_users_count"] = 1 + len(linked_users)
+        if ticket_store.upsert_ticket(record):
+            app_logger.info(f"🔗 Ticket {record['ticket_id']} actualizado: {record['affected_users_count']} usuarios afectados")
+
+    def _build_escalation_ticket(self, user_id: str, reason: str, urgency: str) -> Dict[str, Any]:
+        return {
+            # id fijo desde el origen: las escrituras del outbox son upserts idempotentes
+            "id": str(uuid.uuid4()),
+            "ticket_id": f"ESC-{random.randint(1000, 9999)}",
+            "user_id": str(user_id),
             "category": "Human Escalation",
             "subject": f"Escalado a Agente Humano - Prioridad {urgency}",
             "description": f"Razón: {reason}",
@@ -189,11 +205,31 @@ class ITAgentPlugin:
             "status": "Open",
             "escalation_reason": reason,
             "escalation_urgency": urgency,
-            "logic_app_triggered": logic_app_response is not None,
-            "logic_app_response": logic_app_response,
+            "logic_app_triggered": False,
+            "logic_app_response": None,
             "created_at": datetime.utcnow().isoformat(),
         }
-        
+
+    def _persist_escalation_ticket(
+        self,
+        user_id: str,
+        reason: str,
+        urgency: str,
+        logic_app_response: Optional[Dict[str, Any]] = None,
+        notification_error: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Persiste tickets de escalado a humano en Cosmos DB.
+        logic_app_response solo si la Logic App llegó a responder; notification_error si no se pudo notificar.
+        """
+        record = self._build_escalation_ticket(user_id, reason, urgency)
+        record["logic_app_triggered"] = logic_app_response is not None
+        record["logic_app_response"] = logic_app_response
+        if notification_error:
+            record["notification_status"] = "failed"
+            record["notification_error"] = notification_error
+        escalation_id = record["ticket_id"]
+
         try:
             ticket_store.create_ticket(record)
             app_logger.info(f"💾 Ticket de escalado guardado: {escalation_id}")
@@ -220,7 +256,7 @@ class ITAgentPlugin:
                 app_logger.critical(f"💥 FALLO CRÍTICO: No se pudo guardar ticket de escalado: {e2}")
                 return None
 
-    def _trigger_runbook(
+    async def _trigger_runbook(
         self,
         runbook_name: str,
         parameters: Dict[str, Any],
@@ -228,57 +264,42 @@ class ITAgentPlugin:
         description: str,
         max_wait_seconds: int = 120,
     ) -> str:
+        """Ejecuta el runbook y espera su output (sin bloquear el event loop)."""
         if not self.client:
             return "Error: Cliente de automatización no disponible."
 
-        job_id = str(uuid.uuid4())
-        app_logger.info(f"🚀 [AZURE] Iniciando Job {job_id} para Runbook '{runbook_name}'...")
-
         try:
-            self._create_job(runbook_name, parameters, job_id)
-            poll = self._poll_job_status(job_id, max_wait_seconds=max_wait_seconds)
-            status_final = poll.get("status_final", "Unknown")
-
-            if status_final != "Completed":
-                output_text = f"El proceso en la nube finalizó con estado: {status_final}."
-                self._persist_ticket(user_id, runbook_name, description, job_id, status_final, output_text, poll)
-                return output_text
-
-            output_text = self._read_job_output_streams(job_id) or self._read_job_output_rest(job_id)
-            final_output = self._normalize_output(output_text)
-
-            self._persist_ticket(user_id, runbook_name, description, job_id, status_final, final_output, poll)
-            return final_output
-
+            job = await job_manager.submit(runbook_name, parameters, user_id, description, max_wait_seconds)
+            await job_manager.wait(job)
+            return job.output
         except Exception as e:
-            app_logger.error(f"❌ Error crítico Runbook '{runbook_name}' (Job {job_id}): {e}")
+            app_logger.error(f"❌ Error crítico Runbook '{runbook_name}': {e}")
             return f"Error de sistema al invocar automatización: {str(e)}"
 
     # --- Funciones expuestas ---
 
     @kernel_function(description="Genera enlace seguro para logs.", name="generate_upload_link")
-    def generate_upload_link(self, user_email: Annotated[str, "Email del usuario"]) -> str:
+    async def generate_upload_link(self, user_email: Annotated[str, "Email del usuario"]) -> ToolResult:
         if not self.storage_account:
-            return "Error: Storage no configurado."
+            return ToolResult(text="Error: Storage no configurado.")
         
         # 1. Ejecutar Runbook
-        raw_output = self._trigger_runbook(
+        raw_output = await self._trigger_runbook(
             "NeuroDesk-Generate-Upload-Link",
             {"UserEmail": user_email, "StorageAccountName": self.storage_account},
             user_id=user_email,
             description="Solicitud de subida de logs.",
         )
 
-        import json
         try:
             data = json.loads(raw_output)
             
-            # 1. 'human_text': NO contiene la URL. Instruye al LLM sobre qué decir.
-            # 2. 'system_data': Contiene la URL para que el Frontend la use en el Widget.
+            # 1. 'text': NO contiene la URL. Instruye al LLM sobre qué decir.
+            # 2. 'system_data': Contiene la URL para que el Frontend la use en el Widget (no viaja al LLM).
             
-            return json.dumps({
-                "human_text": "He activado el protocolo de transferencia segura. Utiliza el panel visual que aparece abajo para seleccionar y cargar tus archivos de evidencia.",
-                "system_data": {
+            return ToolResult(
+                text="He activado el protocolo de transferencia segura. Utiliza el panel visual que aparece abajo para seleccionar y cargar tus archivos de evidencia.",
+                system_data={
                     "type": "upload_widget",
                     "payload": {
                         "upload_url": data.get("Url"), # URL Real corregida por el Runbook
@@ -286,45 +307,102 @@ class ITAgentPlugin:
                         "blob_path": data.get("BlobPath")
                     }
                 }
-            })
+            )
         except Exception:
             app_logger.warning("⚠️ Error parseando respuesta del Runbook.")
-            return "Error técnico generando el control de carga."
+            return ToolResult(text="Error técnico generando el control de carga.")
 
     @kernel_function(description="Consulta logs de actividad.", name="get_activity_logs")
-    def get_activity_logs(self, user_id: str = "system") -> str:
-        return self._trigger_runbook(
-            "NeuroDesk-Get-Activity-Logs",
-            {"Hours": "4"},
-            user_id=user_id,
-            description="Consulta de auditoría.",
-        )
+    async def get_activity_logs(self, user_id: str = "system") -> str:
+        if not self.client:
+            return "Error: Cliente de automatización no disponible."
+
+        async def run_runbook() -> str:
+            job = await job_manager.submit(
+                "NeuroDesk-Get-Activity-Logs",
+                {"Hours": "4"},
+                user_id=user_id,
+                description="Consulta de auditoría.",
+            )
+            await job_manager.wait(job)
+            if job.status != "Completed" or job.timed_out:
+                # Se lanza para que la caché no guarde un fallo como si fuera un resultado
+                raise RuntimeError(job.output)
+            return job.output
+
+        # La ventana es fija (4h) y el resultado igual para todos los auditores: stale-while-revalidate
+        try:
+            output, age = await activity_logs_cache.get("Hours=4", run_runbook)
+        except Exception as e:
+            app_logger.error(f"❌ Error consultando logs de actividad: {e}")
+            return f"Error de sistema al invocar automatización: {str(e)}"
+
+        if age >= 1:
+            return f"[Datos obtenidos hace {int(age)} s]\n{output}"
+        return output
 
     @kernel_function(
         description="Reinicia servicios web o aplicaciones críticas cuando están lentas o bloqueadas.", 
         name="self_heal_restart"
     )
-    def self_heal_restart(
+    async def self_heal_restart(
         self, 
         user_id: Annotated[str, "ID del usuario que reporta"],
         resource_name: Annotated[str, "Nombre del recurso (opcional)"] = "Nexo-Emprendedor" 
-    ) -> str:
+    ) -> ToolResult:
         """
         Ejecuta un reinicio real sobre la infraestructura de Azure (Web App).
         Target: Nexo-Emprendedor (Production).
+        El reinicio tarda minutos: devolvemos el handle del job al instante y el resultado
+        llega al cliente por /jobs/{id} y /jobs/{id}/events.
         """
+        if not self.client:
+            return ToolResult(text="Error: Cliente de automatización no disponible.")
+
         # Si el LLM no especifica nombre, usamos uno por defecto
         target_resource = resource_name if resource_name else "Nexo-Emprendedor"
         
-        return self._trigger_runbook(
-            runbook_name="NeuroDesk-Self-Heal-Restart",
-            parameters={
-                "ResourceName": target_resource, 
-                "ResourceType": "WebApp"
-            },
-            user_id=user_id,
-            description=f"Reinicio de emergencia: {target_resource}",
-            max_wait_seconds=180 # Dar tiempo al reinicio real
+        try:
+            # Single-flight: durante una caída muchos usuarios piden lo mismo; un solo reinicio para todos
+            job, joined = await job_manager.submit_shared(
+                "NeuroDesk-Self-Heal-Restart",
+                {"ResourceName": target_resource, "ResourceType": "WebApp"},
+                user_id=user_id,
+                description=f"Reinicio de emergencia: {target_resource}",
+                max_wait_seconds=180 # Dar tiempo al reinicio real
+            )
+        except Exception as e:
+            app_logger.error(f"❌ Error crítico lanzando reinicio de {target_resource}: {e}")
+            return ToolResult(text=f"Error de sistema al invocar automatización: {str(e)}")
+
+        if joined:
+            text = (
+                f"El reinicio de {target_resource} ya está en curso o acaba de completarse (job {job.job_id}), "
+                "lanzado por otro reporte de la misma incidencia. No se lanzará otro: el usuario queda "
+                "vinculado a la incidencia existente y verá el progreso en vivo en el panel."
+            )
+        else:
+            text = (
+                f"He iniciado el reinicio de {target_resource} en Azure (job {job.job_id}). "
+                "El proceso tarda unos minutos; el usuario verá el progreso en vivo en el panel y "
+                "se registrará un ticket automáticamente al finalizar."
+            )
+
+        return ToolResult(
+            text=text,
+            system_data={
+                "type": "job_tracker",
+                "payload": {
+                    "job_id": job.job_id,
+                    "runbook": job.runbook,
+                    "resource": target_resource,
+                    "status": job.status,
+                    "joined_existing": joined,
+                    "ticket_id": job.ticket_id,
+                    "status_url": f"/jobs/{job.job_id}",
+                    "events_url": f"/jobs/{job.job_id}/events",
+                }
+            }
         )
 
     # --- ESCALADO REAL ---
@@ -339,60 +417,39 @@ class ITAgentPlugin:
         urgency: Annotated[str, "Alta, Media, Baja"]
     ) -> str:
         """
-        Envía una alerta real vía Logic App a los gerentes de soporte y persiste en Cosmos DB.
+        Registra el escalado en el outbox persistente (ticket + alerta a la Logic App en una sola escritura)
+        y responde al instante; el worker del outbox entrega con reintentos sin bloquear al usuario.
         """
         app_logger.info(f"🚨 ESCALANDO TICKET: {user_id} - {reason} - Urgencia: {urgency}")
-        
-        logic_app_response = None
-        
-        # 1. Llamar a Logic App si está configurada
+
+        ticket_record = self._build_escalation_ticket(user_id, reason, urgency)
+        notification = None
         if self.logic_app_url:
-            try:
-                payload = {
-                    "user_id": user_id,
-                    "reason": reason,
-                    "urgency": urgency,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-                # Llamada HTTP a Logic App
-                response = requests.post(self.logic_app_url, json=payload, timeout=10)
-                
-                if response.status_code in [200, 202]:
-                    logic_app_response = {
-                        "status_code": response.status_code,
-                        "request_id": response.headers.get('x-ms-request-id', 'N/A'),
-                        "triggered_at": datetime.utcnow().isoformat()
-                    }
-                    app_logger.info(f"✅ Logic App triggered successfully for user {user_id}")
-                else:
-                    app_logger.warning(f"⚠️ Logic App responded with status {response.status_code}: {response.text}")
-                    logic_app_response = {
-                        "status_code": response.status_code,
-                        "error": response.text[:500] if response.text else "Empty response"
-                    }
-                    
-            except requests.exceptions.Timeout:
-                app_logger.error(f"⏱️ Timeout calling Logic App for user {user_id}")
-                logic_app_response = {"error": "Timeout after 10 seconds"}
-            except Exception as e:
-                app_logger.error(f"❌ Exception calling Logic App for user {user_id}: {e}")
-                logic_app_response = {"error": str(e)}
+            notification = {
+                "user_id": user_id,
+                "reason": reason,
+                "urgency": urgency,
+                "ticket_id": ticket_record["ticket_id"],
+                "timestamp": datetime.utcnow().isoformat()
+            }
+            ticket_record["notification_status"] = "pending"
         else:
             app_logger.warning("⚠️ Logic App URL no configurada - solo persistencia local")
 
-        # 2. PERSISTIR TICKET EN COSMOS DB
-        ticket_record = self._persist_escalation_ticket(user_id, reason, urgency, logic_app_response)
-        
-        if ticket_record is None:
-            app_logger.critical(f"💥 FALLO COMPLETO: No se pudo guardar ticket de escalado para {user_id}")
-            return "❌ Error crítico: No se pudo registrar el escalado en el sistema. Por favor, contacte al administrador directamente."
-
-        # 3. Construir respuesta al usuario
-        ticket_id = ticket_record.get("ticket_id", "N/A")
-        
-        if logic_app_response and logic_app_response.get("status_code") in [200, 202]:
-            return f"✅ TICKET ESCALADO: Se ha enviado una alerta prioritaria al equipo humano. Tu ticket es #{ticket_id}. Un agente se contactará contigo pronto."
-        elif self.logic_app_url:
-            return f"⚠️ TICKET REGISTRADO: Se ha creado el ticket #{ticket_id}, pero hubo un problema con la notificación automática. El equipo será notificado manualmente."
-        else:
-            return f"📝 TICKET CREADO: Se ha registrado tu solicitud con el número #{ticket_id}. El equipo de soporte revisará tu caso pronto."
\ No newline at end of file
+        try:
+            escalation_outbox.enqueue(ticket_record, notification)
+        except Exception as e:
+            # Sin outbox: guardamos el ticket directamente (sin alerta) para no perder el escalado
+            app_logger.error(f"❌ Outbox de escalados no disponible, persistencia directa: {e}")
+            ticket_record = self._persist_escalation_ticket(
+                user_id, reason, urgency, notification_error=f"Outbox no disponible: {e}"
+            )
+            if ticket_record is None:
+                app_logger.critical(f"💥 FALLO COMPLETO: No se pudo guardar ticket de escalado para {user_id}")
+                return "❌ Error crítico: No se pudo registrar el escalado en el sistema. Por favor, contacte al administrador directamente."
+            return f"⚠️ TICKET REGISTRADO: Se ha creado el ticket #{ticket_record['ticket_id']}, pero hubo un problema con la notificación automática. El equipo será notificado manualmente."
+
+        ticket_id = ticket_record["ticket_id"]
+        if notification:
+            return f"✅ TICKET ESCALADO: Tu ticket es #{ticket_id}. La alerta prioritaria al equipo humano está en cola de envío garantizado. Un agente se contactará contigo pronto."
+        return f"📝 TICKET CREADO: Se ha registrado tu solicitud con el número #{ticket_id}. El equipo de soporte revisará tu caso pronto."
\ No newline at end of file
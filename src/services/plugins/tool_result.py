@@ -0,0 +1,17 @@
+from typing import Any, Dict, Optional
+
+class ToolResult:
+    """
+    Resultado de una herramienta con dos audiencias:
+    - text: lo que ve el LLM (y queda en el historial).
+    - system_data: payload estructurado para la UI (widgets). Nunca viaja al LLM.
+    El filtro de invocación del orquestador lo captura para el turno en curso.
+    """
+    __slots__ = ("text", "system_data")
+
+    def __init__(self, text: str, system_data: Optional[Dict[str, Any]] = None):
+        self.text = text
+        self.system_data = system_data
+
+    def __str__(self) -> str:
+        return self.text
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from src.config import settings
+from src.utils.logger import app_logger
+from src.utils.metrics import metrics_registry
+
+CACHE_EVENTS = metrics_registry.counter(
+    "neurodesk_result_cache_total",
+    "Lecturas de la caché de resultados por resultado (hit_fresh / hit_stale / miss / refresh_error)",
+    ("cache", "outcome")
+)
+CACHE_AGE = metrics_registry.histogram(
+    "neurodesk_result_cache_age_seconds",
+    "Antigüedad del resultado servido desde la caché",
+    ("cache",),
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 900.0, 1800.0)
+)
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "refreshing")
+
+    def __init__(self, value: Any, fetched_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.refreshing: Optional[asyncio.Task] = None
+
+
+class StaleWhileRevalidateCache:
+    """
+    Caché de resultados caros (runbooks de decenas de segundos) con stale-while-revalidate:
+    - Edad < fresh_ttl: se sirve tal cual.
+    - fresh_ttl <= edad < max_stale: se sirve al instante y se refresca en segundo plano (una sola tarea por clave).
+    - Sin entrada o edad >= max_stale: se espera al loader; peticiones concurrentes comparten la misma carga.
+    Los errores del loader no se cachean: si falla un refresco se sigue sirviendo el último valor bueno.
+    """
+
+    def __init__(self, name: str, fresh_ttl: float, max_stale: float):
+        self.name = name
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self._entries: Dict[str, _Entry] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Tuple[Any, float]:
+        """Devuelve (valor, antigüedad_en_segundos)."""
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            age = now - entry.fetched_at
+            if age < self.fresh_ttl:
+                CACHE_EVENTS.inc(self.name, "hit_fresh")
+                CACHE_AGE.observe(age, self.name)
+                return entry.value, age
+            if age < self.max_stale:
+                CACHE_EVENTS.inc(self.name, "hit_stale")
+                CACHE_AGE.observe(age, self.name)
+                if entry.refreshing is None:
+                    entry.refreshing = asyncio.create_task(self._refresh(key, entry, loader))
+                return entry.value, age
+
+        CACHE_EVENTS.inc(self.name, "miss")
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = asyncio.create_task(self._load(key, loader))
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        value = await asyncio.shield(task)
+        return value, 0.0
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await loader()
+        self._entries[key] = _Entry(value, time.monotonic())
+        return value
+
+    async def _refresh(self, key: str, entry: _Entry, loader: Callable[[], Awaitable[Any]]):
+        try:
+            await self._load(key, loader)
+            app_logger.info(f"♻️ Caché '{self.name}' refrescada en segundo plano ({key})")
+        except Exception as e:
+            CACHE_EVENTS.inc(self.name, "refresh_error")
+            app_logger.warning(f"⚠️ Fallo refrescando caché '{self.name}' ({key}); se mantiene el valor anterior: {e}")
+        finally:
+            entry.refreshing = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "entries": len(self._entries),
+            "loading": len(self._loading),
+            "ages": {k: round(now - e.fetched_at, 1) for k, e in self._entries.items()},
+        }
+
+
+activity_logs_cache = StaleWhileRevalidateCache(
+    "activity_logs",
+    fresh_ttl=settings.ACTIVITY_LOGS_CACHE_TTL,
+    max_stale=settings.ACTIVITY_LOGS_MAX_STALE,
+)
+
+metrics_registry.gauge(
+    "neurodesk_activity_logs_cache_age_seconds",
+    "Antigüedad de la entrada más reciente de la caché de logs de actividad (-1 si vacía)",
+    lambda: min(activity_logs_cache.stats()["ages"].values(), default=-1)
+)
@@ -0,0 +1,113 @@
+"""
+Reglas de riesgo de burnout (HR + IT) en un solo sitio, en versión escalar (perfil de un empleado)
+y vectorizada (toda la plantilla con NumPy, sin bucles Python por empleado).
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+
+LOW_SATISFACTION = 2.0      # satisfacción <= umbral
+LOW_SATISFACTION_POINTS = 40
+OVERLOAD_HOURS = 200.0      # horas/mes > umbral
+OVERLOAD_POINTS = 30
+RECENT_TICKETS = 2          # tickets recientes > umbral
+RECENT_TICKETS_POINTS = 20
+
+MEDIUM_SCORE = 30
+CRITICAL_SCORE = 60
+LEVELS = ("LOW", "MEDIUM", "CRITICAL")
+
+
+def score_employee(satisfaction: float, monthly_hours: float, ticket_count: int) -> Tuple[int, str, List[str]]:
+    """Devuelve (puntuación, nivel, factores legibles) para un empleado."""
+    risk_score = 0
+    factors = []
+
+    # Análisis HR
+    if satisfaction <= LOW_SATISFACTION:
+        risk_score += LOW_SATISFACTION_POINTS
+        factors.append("Baja satisfacción reportada")
+    if monthly_hours > OVERLOAD_HOURS:
+        risk_score += OVERLOAD_POINTS
+        factors.append("Sobrecarga horaria")
+
+    # Análisis IT
+    if ticket_count > RECENT_TICKETS:
+        risk_score += RECENT_TICKETS_POINTS
+        factors.append(f"Múltiples incidentes recientes ({ticket_count})")
+
+    # Determinación de Nivel
+    level = "LOW"
+    if risk_score >= CRITICAL_SCORE: level = "CRITICAL"
+    elif risk_score >= MEDIUM_SCORE: level = "MEDIUM"
+
+    return risk_score, level, factors
+
+
+def score_arrays(satisfaction: np.ndarray, monthly_hours: np.ndarray, ticket_counts: np.ndarray) -> np.ndarray:
+    """Mismas reglas que score_employee sobre columnas completas (int16 por empleado)."""
+    scores = np.zeros(len(satisfaction), dtype=np.int16)
+    scores += (satisfaction <= LOW_SATISFACTION) * np.int16(LOW_SATISFACTION_POINTS)
+    scores += (monthly_hours > OVERLOAD_HOURS) * np.int16(OVERLOAD_POINTS)
+    scores += (ticket_counts > RECENT_TICKETS) * np.int16(RECENT_TICKETS_POINTS)
+    return scores
+
+
+def level_codes(scores: np.ndarray) -> np.ndarray:
+    """0 = LOW, 1 = MEDIUM, 2 = CRITICAL (índices de LEVELS)."""
+    return (scores >= MEDIUM_SCORE).astype(np.int8) + (scores >= CRITICAL_SCORE).astype(np.int8)
+
+
+def rollup(
+    group_codes: np.ndarray,
+    group_names: Sequence[str],
+    scores: np.ndarray,
+    levels: np.ndarray,
+    satisfaction: np.ndarray,
+    monthly_hours: np.ndarray,
+    missing_label: str = "N/A",
+) -> List[Dict[str, Any]]:
+    """
+    Agregado por grupo (departamento / manager) con np.bincount sobre los códigos categóricos:
+    una pasada por métrica, independiente del número de grupos. Ordenado por críticos y riesgo medio.
+    """
+    # El código -1 (sin valor) se agrupa en una categoría extra al final
+    n_groups = len(group_names) + 1
+    codes = np.where(group_codes < 0, n_groups - 1, group_codes)
+
+    employees = np.bincount(codes, minlength=n_groups)
+    score_sum = np.bincount(codes, weights=scores, minlength=n_groups)
+    sat_sum = np.bincount(codes, weights=satisfaction, minlength=n_groups)
+    hours_sum = np.bincount(codes, weights=monthly_hours, minlength=n_groups)
+    per_level = [np.bincount(codes[levels == k], minlength=n_groups) for k in range(len(LEVELS))]
+
+    names = list(group_names) + [missing_label]
+    groups = []
+    for g in np.flatnonzero(employees):
+        total = int(employees[g])
+        critical = int(per_level[2][g])
+        groups.append({
+            "name": names[g],
+            "employees": total,
+            "avg_risk_score": round(float(score_sum[g]) / total, 1),
+            "critical": critical,
+            "medium": int(per_level[1][g]),
+            "low": int(per_level[0][g]),
+            "critical_share": round(critical / total, 3),
+            "avg_satisfaction": round(float(sat_sum[g]) / total, 2),
+            "avg_monthly_hours": round(float(hours_sum[g]) / total, 1),
+        })
+    groups.sort(key=lambda g: (g["critical"], g["avg_risk_score"]), reverse=True)
+    return groups
+
+
+def top_at_risk(scores: np.ndarray, rows: np.ndarray, limit: int) -> np.ndarray:
+    """Filas (de `rows`) con mayor puntuación, de mayor a menor; argpartition evita ordenar toda la plantilla."""
+    if limit <= 0 or not len(rows):
+        return rows[:0]
+    subset = scores[rows]
+    if len(rows) > limit:
+        keep = np.argpartition(-subset, limit - 1)[:limit]
+    else:
+        keep = np.arange(len(rows))
+    keep = keep[np.argsort(-subset[keep], kind="stable")]
+    return rows[keep]
@@ -2,6 +2,9 @@ from azure.core.credentials import AzureKeyCredential
 from azure.ai.contentsafety import ContentSafetyClient
 from azure.ai.contentsafety.models import AnalyzeTextOptions
 from src.config import settings
+from src.services.http_transport import http_transport
+from src.services.service_registry import services
+from src.utils.metrics import time_stage
 
 class SafetyGuard:
     def __init__(self):
@@ -12,7 +15,8 @@ class SafetyGuard:
             try:
                 self.client = ContentSafetyClient(
                     settings.SAFETY_ENDPOINT, 
-                    AzureKeyCredential(settings.SAFETY_KEY)
+                    AzureKeyCredential(settings.SAFETY_KEY),
+                    transport=http_transport.azure_transport()
                 )
                 print("✅ Content Safety Client conectado.")
             except Exception as e:
@@ -26,7 +30,8 @@ class SafetyGuard:
 
         try:
             request = AnalyzeTextOptions(text=text)
-            response = self.client.analyze_text(request)
+            with time_stage("safety"):
+                response = self.client.analyze_text(request)
 
             violations = []
             
@@ -54,4 +59,7 @@ class SafetyGuard:
             # En caso de duda, dejamos pasar para que OpenAI decida (Fail Open para demo)
             return {"safe": True, "reason": "Analysis Error"}
 
-safety_guard = SafetyGuard()
\ No newline at end of file
+# No crítico: sin Content Safety el guard falla en abierto, no debe dejar /ready en 503
+safety_guard = services.register(
+    "safety_guard", SafetyGuard, ready_check=lambda s: s.client is not None, critical=False
+)
\ No newline at end of file
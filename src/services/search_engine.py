@@ -14,6 +14,9 @@ from azure.search.documents.indexes.models import (
 from azure.search.documents.models import VectorizedQuery
 from src.config import settings
 from src.utils.logger import app_logger
+from src.services.http_transport import http_transport
+from src.services.service_registry import services
+from src.utils.metrics import time_stage
 from openai import AzureOpenAI
 
 class SearchEngine:
@@ -32,17 +35,20 @@ class SearchEngine:
         self.credential = AzureKeyCredential(self.key)
         
         # Cliente Search (Búsquedas)
-        self.search_client = SearchClient(self.endpoint, self.index_name, self.credential)
+        self.search_client = SearchClient(
+            self.endpoint, self.index_name, self.credential, transport=http_transport.azure_transport()
+        )
         
         # Cliente Admin (Crear Índices)
-        self.admin_client = SearchIndexClient(self.endpoint, self.credential)
+        self.admin_client = SearchIndexClient(self.endpoint, self.credential, transport=http_transport.azure_transport())
 
         # Cliente Azure OpenAI para generar vectores (Directo a la fuente)
         try:
             self.openai_client = AzureOpenAI(
                 api_key=settings.AOAI_KEY,
                 api_version="2023-05-15",
-                azure_endpoint=settings.AOAI_ENDPOINT
+                azure_endpoint=settings.AOAI_ENDPOINT,
+                http_client=http_transport.sync_httpx
             )
             app_logger.info("✅ Search Engine: Cliente Azure OpenAI conectado para vectorización.")
         except Exception as e:
@@ -62,10 +68,11 @@ class SearchEngine:
             text = text.replace("\n", " ")
             
             # Llamada a Azure OpenAI Embeddings
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=self.embedding_deployment
-            )
+            with time_stage("embedding"):
+                response = self.openai_client.embeddings.create(
+                    input=text,
+                    model=self.embedding_deployment
+                )
             
             # Extraer el vector (lista de floats)
             return response.data[0].embedding
@@ -146,12 +153,14 @@ class SearchEngine:
             )
 
             # 3. Ejecutar búsqueda híbrida en Azure AI Search
-            results = self.search_client.search(
-                search_text=query,
-                vector_queries=[vector_query],
-                top=top,
-                select=["content", "category", "source"] # No traemos el vector de vuelta
-            )
+            # El iterador de resultados pagina contra el servicio: lo medimos completo
+            with time_stage("search"):
+                results = list(self.search_client.search(
+                    search_text=query,
+                    vector_queries=[vector_query],
+                    top=top,
+                    select=["content", "category", "source"] # No traemos el vector de vuelta
+                ))
             
             context_parts = []
             for res in results:
@@ -173,4 +182,6 @@ class SearchEngine:
             return "Error técnico al recuperar información."
 
 # Instancia global
-search_engine = SearchEngine()
\ No newline at end of file
+search_engine = services.register(
+    "search_engine", SearchEngine, ready_check=lambda s: getattr(s, "search_client", None) is not None
+)
\ No newline at end of file
@@ -1,6 +1,9 @@
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.textanalytics import TextAnalyticsClient
 from src.config import settings
+from src.services.http_transport import http_transport
+from src.services.service_registry import services
+from src.utils.metrics import time_stage
 
 class SentimentAnalyzer:
     def __init__(self):
@@ -11,7 +14,8 @@ class SentimentAnalyzer:
             try:
                 self.client = TextAnalyticsClient(
                     endpoint=settings.LANGUAGE_ENDPOINT, 
-                    credential=AzureKeyCredential(settings.LANGUAGE_KEY)
+                    credential=AzureKeyCredential(settings.LANGUAGE_KEY),
+                    transport=http_transport.azure_transport()
                 )
                 print("✅ Sentiment Analyzer conectado.")
             except Exception as e:
@@ -27,7 +31,8 @@ class SentimentAnalyzer:
 
         try:
             # Analizamos el sentimiento
-            response = self.client.analyze_sentiment(documents=[text])[0]
+            with time_stage("sentiment"):
+                response = self.client.analyze_sentiment(documents=[text])[0]
             
             # Mapeamos al formato que queremos
             # response.sentiment puede ser "positive", "neutral", "negative", "mixed"
@@ -52,4 +57,7 @@ class SentimentAnalyzer:
             print(f"❌ Error analizando sentimiento: {e}")
             return {"sentiment": "Neutral", "confidence": 0.0}
 
-sentiment_analyzer = SentimentAnalyzer()
\ No newline at end of file
+# No crítico: sin Azure Language el sentimiento cae a 'Neutral'
+sentiment_analyzer = services.register(
+    "sentiment_analyzer", SentimentAnalyzer, ready_check=lambda s: s.client is not None, critical=False
+)
\ No newline at end of file
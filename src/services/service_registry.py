@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+from src.config import settings
+from src.utils.logger import app_logger
+
+# Estados de un servicio
+COLD, WARMING, READY, DEGRADED, FAILED = "cold", "warming", "ready", "degraded", "failed"
+
+
+class _Entry:
+    __slots__ = ("name", "factory", "ready_check", "critical", "instance", "state", "error", "duration_ms", "lock")
+
+    def __init__(self, name: str, factory: Callable[[], Any], ready_check: Optional[Callable[[Any], bool]], critical: bool):
+        self.name = name
+        self.factory = factory
+        self.ready_check = ready_check
+        self.critical = critical
+        self.instance = None
+        self.state = COLD
+        self.error: Optional[str] = None
+        self.duration_ms: Optional[float] = None
+        self.lock = threading.Lock()
+
+
+class LazyService:
+    """
+    Proxy del singleton: el módulo exporta el mismo nombre de siempre (p.ej. `ticket_store`),
+    pero el servicio se construye en el primer uso o durante el warm-up de arranque.
+    Acceder a un atributo puede construir el servicio o esperar al warm-up: desde el event loop,
+    usar `await services.aget(nombre)` (o resolver el atributo dentro del executor).
+    """
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: "ServiceRegistry", name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str):
+        return getattr(self._registry.get(self._name), attr)
+
+    def __setattr__(self, attr: str, value):
+        setattr(self._registry.get(self._name), attr, value)
+
+    def __repr__(self) -> str:
+        return f"<LazyService {self._name} ({self._registry.state(self._name)})>"
+
+
+class ServiceRegistry:
+    """
+    Registro de servicios con construcción perezosa.
+    Importar un módulo ya no abre conexiones ni descarga datos: eso ocurre en get()
+    o en warm_up(), que construye todos los servicios en paralelo al arrancar la API.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        ready_check: Optional[Callable[[Any], bool]] = None,
+        critical: bool = True,
+    ) -> LazyService:
+        """
+        ready_check: predicado opcional sobre la instancia; si devuelve False el servicio queda
+        'degraded' (construido pero sin su dependencia, p.ej. cliente None por falta de config).
+        critical: si participa en /ready.
+        """
+        if name not in self._entries:
+            self._entries[name] = _Entry(name, factory, ready_check, critical)
+        return LazyService(self, name)
+
+    def get(self, name: str) -> Any:
+        entry = self._entries[name]
+        instance = entry.instance
+        if instance is not None:
+            return instance
+
+        with entry.lock:
+            if entry.instance is not None:
+                return entry.instance
+            entry.state = WARMING
+            start = time.perf_counter()
+            try:
+                instance = entry.factory()
+            except Exception as e:
+                # No cacheamos el fallo: el siguiente get() reintenta la construcción
+                entry.state = FAILED
+                entry.error = str(e)
+                entry.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+                app_logger.error(f"❌ Servicio '{name}' no pudo inicializarse: {e}")
+                raise
+
+            entry.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            entry.error = None
+            entry.state = READY
+            if entry.ready_check is not None:
+                try:
+                    if not entry.ready_check(instance):
+                        entry.state = DEGRADED
+                except Exception as e:
+                    entry.state = DEGRADED
+                    entry.error = str(e)
+            entry.instance = instance
+            app_logger.info(f"🧩 Servicio '{name}' {entry.state} en {entry.duration_ms} ms")
+            return instance
+
+    async def aget(self, name: str) -> Any:
+        """
+        get() para código async: si el servicio aún no está construido, la construcción (o la espera
+        al lock mientras el warm-up lo construye) ocurre en un hilo del executor, nunca en el event loop.
+        """
+        instance = self._entries[name].instance
+        if instance is not None:
+            return instance
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, name)
+
+    def is_built(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.instance is not None
+
+    def state(self, name: str) -> str:
+        return self._entries[name].state
+
+    def _try_get(self, name: str):
+        try:
+            self.get(name)
+        except Exception:
+            pass  # el estado 'failed' ya quedó registrado
+
+    async def warm_up(self, names: Optional[Iterable[str]] = None, timeout: Optional[float] = None):
+        """
+        Construye los servicios en paralelo (hilos: los constructores hacen I/O bloqueante).
+        Un servicio lento no retrasa a los demás; si vence el timeout, sigue calentándose en su hilo.
+        """
+        names = list(names) if names is not None else list(self._entries)
+        timeout = settings.SERVICE_WARMUP_TIMEOUT if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        pool = ThreadPoolExecutor(max_workers=max(len(names), 1), thread_name_prefix="warmup")
+        start = time.perf_counter()
+
+        futures = [loop.run_in_executor(pool, self._try_get, name) for name in names]
+        done, pending = await asyncio.wait(futures, timeout=timeout)
+        pool.shutdown(wait=False)
+
+        elapsed = time.perf_counter() - start
+        if pending:
+            slow = [n for n in names if self._entries[n].state in (COLD, WARMING)]
+            app_logger.warning(f"⏱️ Warm-up incompleto tras {elapsed:.1f}s. Pendientes: {slow}")
+        else:
+            app_logger.info(f"🔥 Warm-up completado en {elapsed:.1f}s ({len(names)} servicios)")
+
+    def status(self) -> Dict[str, Any]:
+        services = {
+            name: {
+                "state": entry.state,
+                "critical": entry.critical,
+                "duration_ms": entry.duration_ms,
+                "error": entry.error,
+            }
+            for name, entry in self._entries.items()
+        }
+        ready = all(entry.state == READY for entry in self._entries.values() if entry.critical)
+        return {"ready": ready, "services": services}
+
+# Registro global de la aplicación
+services = ServiceRegistry()
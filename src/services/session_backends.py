@@ -0,0 +1,253 @@
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from azure.core import MatchConditions
+from azure.cosmos import CosmosClient, PartitionKey
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
+from semantic_kernel.contents import ChatMessageContent
+from src.config import settings
+from src.utils.logger import app_logger
+from src.utils.metrics import time_stage
+from src.services.http_transport import http_transport
+
+# Clave de metadatos donde cada mensaje recuerda su posición (seq) en el backend
+SEQ_METADATA_KEY = "_session_seq"
+
+
+class SessionConflict(Exception):
+    """Otro worker escribió la sesión desde la última lectura (versión distinta)."""
+
+
+def serialize_message(msg: ChatMessageContent) -> str:
+    # JSON compacto: sin nulos ni inner_content (respuesta cruda del proveedor)
+    return msg.model_dump_json(exclude_none=True)
+
+def deserialize_message(payload: str, seq: int) -> ChatMessageContent:
+    msg = ChatMessageContent.model_validate_json(payload)
+    msg.metadata[SEQ_METADATA_KEY] = seq
+    return msg
+
+
+class SessionBackend(ABC):
+    """
+    Estado de sesión compartido entre workers. Cada sesión es una cabecera con versión
+    más un log de mensajes por seq; cada turno se confirma como un delta
+    (mensajes nuevos + seqs recortados), nunca como reescritura completa.
+    """
+
+    @abstractmethod
+    def head(self, session_key: str) -> Optional[int]:
+        """Versión actual de la sesión, o None si no existe."""
+
+    @abstractmethod
+    def load(self, session_key: str) -> Tuple[Optional[int], List[Tuple[int, str]]]:
+        """(versión, [(seq, payload), ...]) ordenados por seq. Versión None si la sesión no existe."""
+
+    @abstractmethod
+    def commit(
+        self,
+        session_key: str,
+        expected_version: Optional[int],
+        appended: List[Tuple[int, str]],
+        removed: List[int],
+    ) -> int:
+        """Aplica el delta si la versión coincide; devuelve la nueva versión o lanza SessionConflict."""
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Backend embebido (archivo SQLite en modo WAL). Sirve a varios workers uvicorn del mismo nodo.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_heads ("
+                " session_key TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_messages ("
+                " session_key TEXT NOT NULL, seq INTEGER NOT NULL, payload TEXT NOT NULL,"
+                " PRIMARY KEY (session_key, seq))"
+            )
+        app_logger.info(f"✅ Session Backend SQLite listo: {self.path}")
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def head(self, session_key: str) -> Optional[int]:
+        row = self._conn().execute(
+            "SELECT version FROM session_heads WHERE session_key = ?", (session_key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def load(self, session_key: str) -> Tuple[Optional[int], List[Tuple[int, str]]]:
+        conn = self._conn()
+        version = self.head(session_key)
+        if version is None:
+            return None, []
+        rows = conn.execute(
+            "SELECT seq, payload FROM session_messages WHERE session_key = ? ORDER BY seq", (session_key,)
+        ).fetchall()
+        return version, rows
+
+    def commit(self, session_key, expected_version, appended, removed) -> int:
+        conn = self._conn()
+        new_version = (expected_version or 0) + 1
+        with conn:  # transacción
+            conn.execute("BEGIN IMMEDIATE")
+            current = self.head(session_key)
+            if current != expected_version:
+                raise SessionConflict(f"versión {current} != {expected_version}")
+            conn.execute(
+                "INSERT INTO session_heads (session_key, version, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(session_key) DO UPDATE SET version = excluded.version, updated_at = excluded.updated_at",
+                (session_key, new_version, time.time())
+            )
+            if removed:
+                conn.executemany(
+                    "DELETE FROM session_messages WHERE session_key = ? AND seq = ?",
+                    [(session_key, seq) for seq in removed]
+                )
+            if appended:
+                conn.executemany(
+                    "INSERT INTO session_messages (session_key, seq, payload) VALUES (?, ?, ?)",
+                    [(session_key, seq, payload) for seq, payload in appended]
+                )
+        return new_version
+
+
+class CosmosSessionBackend(SessionBackend):
+    """
+    Backend de red sobre Cosmos DB (contenedor de sesiones, partición /session_key).
+    Documentos: una cabecera ("head") con la versión y el mapa seq -> id de documento de los mensajes vivos,
+    más un documento por mensaje con un id único por intento de commit.
+    Un commit escribe primero sus documentos nuevos (invisibles: ninguna cabecera los referencia) y los publica
+    reemplazando la cabecera con If-Match (ETag). Si pierde la carrera, borra lo suyo y lanza SessionConflict:
+    nunca toca documentos que referencia la cabecera ganadora.
+    """
+
+    def __init__(self, container=None):
+        if container is not None:
+            self.container = container
+            return
+        client = CosmosClient.from_connection_string(settings.COSMOS_CONN_STR, transport=http_transport.azure_transport())
+        database = client.create_database_if_not_exists(id=settings.COSMOS_DB_NAME)
+        self.container = database.create_container_if_not_exists(
+            id=settings.COSMOS_CONTAINER_SESSIONS,
+            partition_key=PartitionKey(path="/session_key")
+        )
+        app_logger.info("✅ Session Backend Cosmos DB conectado.")
+
+    def _read_head(self, session_key: str) -> Optional[dict]:
+        try:
+            with time_stage("cosmos_read"):
+                return self.container.read_item(item="head", partition_key=session_key)
+        except CosmosResourceNotFoundError:
+            return None
+
+    def _message_docs(self, session_key: str) -> List[dict]:
+        # Todos los mensajes de la partición (vivos + huérfanos de commits perdidos); se filtran con la cabecera
+        with time_stage("cosmos_query"):
+            return list(self.container.query_items(
+                query="SELECT c.id, c.seq, c.payload FROM c WHERE c.type = 'msg'",
+                partition_key=session_key
+            ))
+
+    def _live_ids(self, session_key: str, head: dict) -> Dict[int, str]:
+        """seq -> id de documento publicados por la cabecera."""
+        if "messages" in head:
+            return {int(seq): doc_id for seq, doc_id in head["messages"]}
+        # Cabeceras anteriores al mapa: ids fijos msg-{seq}
+        return {doc["seq"]: doc["id"] for doc in self._message_docs(session_key)}
+
+    def head(self, session_key: str) -> Optional[int]:
+        doc = self._read_head(session_key)
+        return doc["version"] if doc else None
+
+    def load(self, session_key: str) -> Tuple[Optional[int], List[Tuple[int, str]]]:
+        doc = self._read_head(session_key)
+        if not doc:
+            return None, []
+        live = set(self._live_ids(session_key, doc).values())
+        items = [item for item in self._message_docs(session_key) if item["id"] in live]
+        return doc["version"], sorted((item["seq"], item["payload"]) for item in items)
+
+    def commit(self, session_key, expected_version, appended, removed) -> int:
+        doc = self._read_head(session_key)
+        current = doc["version"] if doc else None
+        if current != expected_version:
+            raise SessionConflict(f"versión {current} != {expected_version}")
+
+        live = self._live_ids(session_key, doc) if doc else {}
+        commit_id = uuid.uuid4().hex[:12]
+        written = []
+        try:
+            for seq, payload in appended:
+                doc_id = f"msg-{seq:08d}-{commit_id}"
+                self.container.create_item(body={
+                    "id": doc_id, "session_key": session_key, "type": "msg", "seq": seq, "payload": payload
+                })
+                written.append(doc_id)
+
+            messages = {seq: doc_id for seq, doc_id in live.items() if seq not in set(removed)}
+            messages.update({seq: f"msg-{seq:08d}-{commit_id}" for seq, _ in appended})
+            new_version = (expected_version or 0) + 1
+            head = {
+                "id": "head", "session_key": session_key, "type": "head", "version": new_version,
+                "messages": sorted([seq, doc_id] for seq, doc_id in messages.items()), "updated_at": time.time()
+            }
+            with time_stage("cosmos_write"):
+                if doc:
+                    self.container.replace_item(
+                        item="head", body=head, etag=doc["_etag"], match_condition=MatchConditions.IfNotModified
+                    )
+                else:
+                    self.container.create_item(body=head)
+        except (CosmosAccessConditionFailedError, CosmosResourceExistsError) as e:
+            self._delete_quietly(session_key, written)
+            raise SessionConflict(str(e))
+        except Exception:
+            self._delete_quietly(session_key, written)
+            raise
+
+        # Ya publicado: los documentos que la nueva cabecera dejó de referenciar son basura
+        self._delete_quietly(session_key, [doc_id for doc_id in live.values() if doc_id not in set(messages.values())])
+        return new_version
+
+    def _delete_quietly(self, session_key: str, doc_ids: List[str]):
+        for doc_id in doc_ids:
+            try:
+                self.container.delete_item(item=doc_id, partition_key=session_key)
+            except Exception:
+                pass  # Huérfano inofensivo: load solo lee lo que referencia la cabecera
+
+
+def build_session_backend() -> Optional[SessionBackend]:
+    backend = settings.SESSION_BACKEND.lower()
+    if backend == "sqlite":
+        return SQLiteSessionBackend(settings.SESSION_SQLITE_PATH)
+    if backend == "cosmos":
+        if not settings.COSMOS_CONN_STR:
+            app_logger.error("❌ SESSION_BACKEND=cosmos sin Cosmos DB configurado. Memoria solo en proceso.")
+            return None
+        return CosmosSessionBackend()
+    return None
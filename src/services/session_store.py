@@ -0,0 +1,380 @@
+import hashlib
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from semantic_kernel.contents import ChatHistory, AuthorRole
+from src.config import settings
+from src.services.session_backends import (
+    SEQ_METADATA_KEY,
+    SessionBackend,
+    SessionConflict,
+    build_session_backend,
+    deserialize_message,
+    serialize_message,
+)
+from src.utils.logger import app_logger
+from src.utils.metrics import metrics_registry
+
+SESSION_COMMIT_FAILURES = metrics_registry.counter(
+    "neurodesk_session_commit_failures_total",
+    "Turnos que no se pudieron confirmar en el backend de sesiones (conflict = conflictos agotados / error)",
+    ("reason",)
+)
+# Intentos de confirmar un turno (el primero + rebases tras conflicto) antes de darlo por perdido
+MAX_COMMIT_ATTEMPTS = 4
+
+# Overhead fijo estimado por mensaje (rol, metadatos, estructura del objeto)
+MESSAGE_OVERHEAD_BYTES = 64
+
+def estimate_message_bytes(msg) -> int:
+    """Tamaño aproximado de un mensaje: texto, resultados de herramientas y argumentos de llamadas."""
+    size = MESSAGE_OVERHEAD_BYTES
+    for item in msg.items:
+        payload = getattr(item, "text", None) or getattr(item, "result", None) or getattr(item, "arguments", None)
+        if payload:
+            size += len(str(payload).encode("utf-8"))
+    return size
+
+def estimate_history_bytes(history: ChatHistory) -> int:
+    return sum(estimate_message_bytes(m) for m in history.messages)
+
+
+class SessionStore(ABC):
+    """
+    Interfaz de almacenamiento de sesiones (ChatHistory por conversación).
+    Las implementaciones deciden dónde viven los historiales y cuándo se descartan.
+    """
+
+    # True si get/put hacen I/O bloqueante (el orquestador los saca del event loop)
+    blocking_io: bool = False
+
+    @abstractmethod
+    def get(self, session_key: str) -> Optional[ChatHistory]:
+        """Historial de la sesión, o None si no existe."""
+
+    @abstractmethod
+    def put(self, session_key: str, history: ChatHistory) -> None:
+        """Guarda (o reemplaza) el historial de la sesión."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Contadores de la implementación (sesiones, bytes, expulsiones...)."""
+
+
+class _Entry:
+    __slots__ = ("history", "last_access", "size_bytes")
+
+    def __init__(self, history: ChatHistory, size_bytes: int):
+        self.history = history
+        self.last_access = time.monotonic()
+        self.size_bytes = size_bytes
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Store en proceso con expulsión LRU + TTL por inactividad y tope por sesión
+    (mensajes y bytes). Opcionalmente notifica expulsiones (on_evict) y rehidrata
+    sesiones desconocidas (loader), p.ej. con DiskSnapshotter.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int,
+        idle_ttl_seconds: float,
+        max_messages: int,
+        max_bytes: int,
+        on_evict: Optional[Callable[[str, ChatHistory], None]] = None,
+        loader: Optional[Callable[[str], Optional[ChatHistory]]] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.loader = loader
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._counters = {
+            "hits": 0, "misses": 0, "rehydrated": 0,
+            "evicted_lru": 0, "evicted_ttl": 0, "trimmed_messages": 0,
+        }
+
+    def get(self, session_key: str) -> Optional[ChatHistory]:
+        with self._lock:
+            expired = self._pop_expired()
+            entry = self._entries.get(session_key)
+            if entry:
+                entry.last_access = time.monotonic()
+                self._entries.move_to_end(session_key)
+                self._counters["hits"] += 1
+            else:
+                self._counters["misses"] += 1
+        self._notify_evicted(expired)
+
+        if entry:
+            return entry.history
+
+        # Rehidratación (p.ej. snapshot en disco de una sesión expulsada)
+        if self.loader:
+            try:
+                history = self.loader(session_key)
+            except Exception as e:
+                app_logger.warning(f"⚠️ No se pudo rehidratar la sesión {session_key}: {e}")
+                history = None
+            if history is not None:
+                with self._lock:
+                    self._counters["rehydrated"] += 1
+                self.put(session_key, history)
+                return history
+        return None
+
+    def put(self, session_key: str, history: ChatHistory) -> None:
+        trimmed = self._enforce_caps(history)
+        size = estimate_history_bytes(history)
+
+        with self._lock:
+            self._counters["trimmed_messages"] += trimmed
+            previous = self._entries.pop(session_key, None)
+            if previous:
+                self._total_bytes -= previous.size_bytes
+            self._entries[session_key] = _Entry(history, size)
+            self._total_bytes += size
+
+            evicted = self._pop_expired()
+            while len(self._entries) > self.max_sessions:
+                key, entry = self._entries.popitem(last=False)
+                self._total_bytes -= entry.size_bytes
+                self._counters["evicted_lru"] += 1
+                evicted.append((key, entry.history))
+        self._notify_evicted(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "bytes": self._total_bytes,
+                "messages": sum(len(e.history.messages) for e in self._entries.values()),
+                **self._counters,
+            }
+
+    # --- Internos ---
+
+    def _pop_expired(self) -> List[Tuple[str, ChatHistory]]:
+        """Las entradas están en orden de acceso: las expiradas siempre están al frente. (Requiere lock)"""
+        expired = []
+        deadline = time.monotonic() - self.idle_ttl_seconds
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.last_access > deadline:
+                break
+            self._entries.popitem(last=False)
+            self._total_bytes -= entry.size_bytes
+            self._counters["evicted_ttl"] += 1
+            expired.append((key, entry.history))
+        return expired
+
+    def _notify_evicted(self, evicted: List[Tuple[str, ChatHistory]]):
+        # Fuera del lock: el hook puede hacer I/O (snapshot a disco)
+        if not self.on_evict: return
+        for key, history in evicted:
+            try:
+                self.on_evict(key, history)
+            except Exception as e:
+                app_logger.warning(f"⚠️ Hook de expulsión falló para {key}: {e}")
+
+    def _enforce_caps(self, history: ChatHistory) -> int:
+        """
+        Recorta turnos completos (desde un mensaje de usuario hasta el siguiente) empezando
+        por los más antiguos, conservando el System Prompt y el último turno. Cortar por turnos
+        evita dejar resultados de herramientas huérfanos de su llamada.
+        """
+        messages = history.messages
+        removed = 0
+        while len(messages) > self.max_messages or estimate_history_bytes(history) > self.max_bytes:
+            user_idx = [i for i, m in enumerate(messages) if m.role == AuthorRole.USER]
+            if len(user_idx) < 2:
+                break
+            start = next(i for i, m in enumerate(messages) if m.role != AuthorRole.SYSTEM)
+            end = user_idx[1]
+            del messages[start:end]
+            removed += end - start
+        return removed
+
+
+class _Cursor:
+    __slots__ = ("version", "seqs", "next_seq")
+
+    def __init__(self, version: Optional[int], seqs: Set[int], next_seq: int):
+        self.version = version
+        self.seqs = seqs
+        self.next_seq = next_seq
+
+
+class BackendSessionStore(SessionStore):
+    """
+    Sesiones compartidas entre workers/nodos: el SessionBackend es la fuente de verdad
+    y un InMemorySessionStore actúa como caché local. En cada get se compara la versión
+    remota (lectura barata de la cabecera) y solo se recarga si otro worker escribió.
+    Cada put confirma únicamente el delta del turno (mensajes nuevos + recortados).
+    """
+
+    blocking_io = True
+
+    def __init__(self, backend: SessionBackend, cache: InMemorySessionStore):
+        self.backend = backend
+        self.cache = cache
+        self.cache.on_evict = self._forget
+        self._cursors: Dict[str, _Cursor] = {}
+        self._lock = threading.Lock()
+        self._counters = {"remote_loads": 0, "commits": 0, "conflicts": 0, "appended_messages": 0, "lost_turns": 0}
+
+    def get(self, session_key: str) -> Optional[ChatHistory]:
+        history = self.cache.get(session_key)
+        with self._lock:
+            cursor = self._cursors.get(session_key)
+
+        remote_version = self.backend.head(session_key)
+        if remote_version is None:
+            return None
+        if history is not None and cursor and cursor.version == remote_version:
+            return history
+        return self._reload(session_key)
+
+    def put(self, session_key: str, history: ChatHistory) -> None:
+        # La caché aplica los topes (puede recortar turnos antiguos) antes de calcular el delta
+        self.cache.put(session_key, history)
+        try:
+            self._commit(session_key, history)
+        except Exception as e:
+            reason = "conflict" if isinstance(e, SessionConflict) else "error"
+            SESSION_COMMIT_FAILURES.inc(reason)
+            with self._lock:
+                self._counters["lost_turns"] += 1
+            app_logger.error(f"❌ Turno no persistido en la sesión {session_key} ({reason}): {e}")
+            self._forget(session_key)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.cache.stats(), **self._counters}
+
+    # --- Internos ---
+
+    def _reload(self, session_key: str) -> ChatHistory:
+        version, rows = self.backend.load(session_key)
+        history = ChatHistory(messages=[deserialize_message(payload, seq) for seq, payload in rows])
+        seqs = {seq for seq, _ in rows}
+        with self._lock:
+            self._cursors[session_key] = _Cursor(version, seqs, max(seqs, default=-1) + 1)
+            self._counters["remote_loads"] += 1
+        self.cache.put(session_key, history)
+        return history
+
+    def _commit(self, session_key: str, history: ChatHistory):
+        """
+        Confirma el turno; ante conflicto (otro worker avanzó la sesión) recarga y reaplica solo lo nuevo,
+        hasta MAX_COMMIT_ATTEMPTS veces. Si se agotan, lanza SessionConflict.
+        """
+        new_messages = [msg for msg in history.messages if msg.metadata.get(SEQ_METADATA_KEY) is None]
+        for attempt in range(1, MAX_COMMIT_ATTEMPTS + 1):
+            try:
+                self._commit_once(session_key, history)
+                return
+            except SessionConflict as e:
+                with self._lock:
+                    self._counters["conflicts"] += 1
+                if attempt == MAX_COMMIT_ATTEMPTS:
+                    raise
+                app_logger.warning(
+                    f"⚠️ Conflicto de sesión {session_key} ({e}). Reaplicando turno sobre la versión remota "
+                    f"(intento {attempt + 1}/{MAX_COMMIT_ATTEMPTS})."
+                )
+                history = self._reload(session_key)
+                for msg in new_messages:
+                    history.add_message(msg)
+
+    def _commit_once(self, session_key: str, history: ChatHistory):
+        with self._lock:
+            cursor = self._cursors.get(session_key) or _Cursor(None, set(), 0)
+
+        present: Set[int] = set()
+        new_messages = []
+        for msg in history.messages:
+            seq = msg.metadata.get(SEQ_METADATA_KEY)
+            if seq is None:
+                new_messages.append(msg)
+            else:
+                present.add(seq)
+
+        appended = [(cursor.next_seq + i, serialize_message(msg)) for i, msg in enumerate(new_messages)]
+        removed = sorted(cursor.seqs - present)
+        if not appended and not removed:
+            return
+
+        version = self.backend.commit(session_key, cursor.version, appended, removed)
+
+        for (seq, _), msg in zip(appended, new_messages):
+            msg.metadata[SEQ_METADATA_KEY] = seq
+        with self._lock:
+            self._cursors[session_key] = _Cursor(
+                version,
+                (cursor.seqs & present) | {seq for seq, _ in appended},
+                cursor.next_seq + len(appended)
+            )
+            self._counters["commits"] += 1
+            self._counters["appended_messages"] += len(appended)
+
+    def _forget(self, session_key: str, history: Optional[ChatHistory] = None):
+        with self._lock:
+            self._cursors.pop(session_key, None)
+
+
+class DiskSnapshotter:
+    """
+    Hook de expulsión: guarda la sesión en disco al expulsarla y la rehidrata cuando el usuario vuelve.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, session_key: str) -> Path:
+        digest = hashlib.sha256(session_key.encode("utf-8")).hexdigest()
+        return self.directory / f"{digest}.json"
+
+    def save(self, session_key: str, history: ChatHistory) -> None:
+        self._path(session_key).write_text(history.serialize(), encoding="utf-8")
+
+    def load(self, session_key: str) -> Optional[ChatHistory]:
+        path = self._path(session_key)
+        if not path.exists():
+            return None
+        history = ChatHistory.restore_chat_history(path.read_text(encoding="utf-8"))
+        path.unlink(missing_ok=True)
+        app_logger.info(f"♻️ Sesión rehidratada desde disco ({len(history.messages)} mensajes).")
+        return history
+
+
+def build_session_store() -> SessionStore:
+    backend = build_session_backend()
+    if backend:
+        # Con backend compartido la caché local no necesita snapshots: la sesión ya está persistida
+        return BackendSessionStore(backend, InMemorySessionStore(
+            max_sessions=settings.SESSION_MAX_SESSIONS,
+            idle_ttl_seconds=settings.SESSION_IDLE_TTL,
+            max_messages=settings.SESSION_MAX_MESSAGES,
+            max_bytes=settings.SESSION_MAX_BYTES,
+        ))
+
+    snapshotter = DiskSnapshotter(settings.SESSION_SNAPSHOT_DIR) if settings.SESSION_SNAPSHOT_DIR else None
+    return InMemorySessionStore(
+        max_sessions=settings.SESSION_MAX_SESSIONS,
+        idle_ttl_seconds=settings.SESSION_IDLE_TTL,
+        max_messages=settings.SESSION_MAX_MESSAGES,
+        max_bytes=settings.SESSION_MAX_BYTES,
+        on_evict=snapshotter.save if snapshotter else None,
+        loader=snapshotter.load if snapshotter else None,
+    )
@@ -0,0 +1,121 @@
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, Optional
+from src.utils.metrics import metrics_registry
+
+COUNTER_UPDATES = metrics_registry.counter(
+    "neurodesk_ticket_counter_updates_total",
+    "Tickets vistos por los contadores por día (counted / duplicate / expired / invalid)",
+    ("outcome",)
+)
+
+
+def user_key(user_id: Any) -> str:
+    """
+    Clave de usuario = partition key de Cosmos (str exacto, como lo guarda TicketStore), para que contadores
+    y consultas cuenten lo mismo. La normalización de emails la hace el cruce con HR (HRSnapshot.find).
+    """
+    return str(user_id)
+
+
+def window_start(days: int) -> datetime:
+    """Inicio (00:00 UTC) de la ventana de `days` días naturales, hoy incluido: la misma que suman los contadores."""
+    first_day = datetime.utcnow().date() - timedelta(days=days - 1)
+    return datetime.combine(first_day, time.min)
+
+
+class TicketCounters:
+    """
+    Contadores materializados de tickets por usuario y día (UTC), para el perfil de riesgo sin consultar Cosmos.
+    - record(): lo llama TicketStore al escribir un ticket y la sincronización con el change feed.
+      Idempotente por id de documento: un upsert del mismo ticket o su reaparición en el change feed no cuentan dos veces.
+    - count(): suma de como mucho `days` buckets -> O(1) para la ventana fija del perfil (7 días).
+    Solo se conservan `retention_days` días; lo anterior se descarta al cambiar de día.
+    """
+
+    def __init__(self, retention_days: int = 30):
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Dict[int, int]] = {}   # usuario -> {día ordinal -> tickets}
+        self._seen: Dict[str, int] = {}                  # id de documento -> día ordinal (deduplicación)
+        self._pruned_day = 0
+        self.ready = False  # True tras la primera reconstrucción completa desde el change feed
+
+    def record(self, ticket: Dict[str, Any]) -> bool:
+        """Cuenta un ticket (dict de Cosmos). Devuelve True si se contabilizó ahora."""
+        doc_id, user_id = ticket.get("id"), ticket.get("user_id")
+        day = _day(ticket.get("created_at"))
+        if doc_id is None or user_id is None or day is None:
+            COUNTER_UPDATES.inc("invalid")
+            return False
+
+        today = datetime.utcnow().date().toordinal()
+        with self._lock:
+            self._maybe_prune(today)
+            if day <= today - self.retention_days:
+                COUNTER_UPDATES.inc("expired")
+                return False
+            if doc_id in self._seen:
+                COUNTER_UPDATES.inc("duplicate")
+                return False
+            self._seen[doc_id] = day
+            buckets = self._buckets.setdefault(user_key(user_id), {})
+            buckets[day] = buckets.get(day, 0) + 1
+        COUNTER_UPDATES.inc("counted")
+        return True
+
+    def rebuild(self, tickets: Iterable[Dict[str, Any]]) -> int:
+        """Carga un recorrido completo (change feed desde el principio). Devuelve los tickets contabilizados."""
+        counted = sum(1 for ticket in tickets if self.record(ticket))
+        self.ready = True
+        return counted
+
+    def count(self, user_id: Any, days: int = 7) -> int:
+        """Tickets del usuario en los últimos `days` días naturales (UTC), hoy incluido."""
+        today = datetime.utcnow().date().toordinal()
+        with self._lock:
+            buckets = self._buckets.get(user_key(user_id))
+            if not buckets:
+                return 0
+            return sum(buckets.get(today - offset, 0) for offset in range(min(days, self.retention_days)))
+
+    def counts_by_user(self, days: int = 7) -> Dict[str, int]:
+        """Conteo de la ventana para todos los usuarios con algún ticket en ella (scoring de plantilla)."""
+        today = datetime.utcnow().date().toordinal()
+        first = today - min(days, self.retention_days) + 1
+        with self._lock:
+            counts = {user: sum(n for day, n in buckets.items() if day >= first) for user, buckets in self._buckets.items()}
+        return {user: n for user, n in counts.items() if n}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "users": len(self._buckets),
+                "tickets": len(self._seen),
+                "retention_days": self.retention_days,
+            }
+
+    def _maybe_prune(self, today: int):
+        """Una vez por día: descarta buckets e ids fuera de la retención (con el lock tomado)."""
+        if today == self._pruned_day:
+            return
+        self._pruned_day = today
+        oldest = today - self.retention_days
+        self._seen = {doc_id: day for doc_id, day in self._seen.items() if day > oldest}
+        for user in list(self._buckets):
+            kept = {day: n for day, n in self._buckets[user].items() if day > oldest}
+            if kept:
+                self._buckets[user] = kept
+            else:
+                del self._buckets[user]
+
+
+def _day(created_at: Optional[str]) -> Optional[int]:
+    """Día ordinal de un created_at ISO (el que escribe TicketStore: datetime.utcnow().isoformat())."""
+    if not created_at:
+        return None
+    try:
+        return date.fromisoformat(str(created_at)[:10]).toordinal()
+    except ValueError:
+        return None
@@ -1,19 +1,48 @@
+import re
+import threading
+import time
 import uuid
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
 from azure.cosmos import CosmosClient, PartitionKey
 from src.config import settings
 from src.utils.logger import app_logger
+from src.services.http_transport import http_transport
+from src.services.service_registry import services
+from src.services.ticket_counters import TicketCounters, user_key, window_start
+from src.utils.metrics import metrics_registry, time_stage
+
+COUNT_READS = metrics_registry.counter(
+    "neurodesk_ticket_count_reads_total",
+    "Conteos de tickets recientes por origen (counters = memoria, cosmos = consulta)",
+    ("source",)
+)
+
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# Fallos seguidos de sincronización tras los que los contadores dejan de responder (se vuelve a contar en Cosmos)
+MAX_SYNC_FAILURES = 3
 
 class TicketStore:
     def __init__(self):
+        # Contadores por usuario/día alimentados por las escrituras de este proceso y por el change feed
+        # (tickets escritos por otras instancias o scripts). Hasta la primera reconstrucción, se cuenta en Cosmos.
+        self.counters = TicketCounters(retention_days=settings.TICKET_COUNTERS_RETENTION_DAYS)
+        self.sync_interval = settings.TICKET_COUNTERS_SYNC_INTERVAL
+        self.last_sync_at: Optional[float] = None
+        self._feed_continuation: Optional[str] = None
+        self._sync_failures = 0
+        self._stop = threading.Event()
+
         if not settings.COSMOS_CONN_STR:
             app_logger.error("❌ Cosmos DB no configurado. TicketStore inactivo.")
             self.container = None
             return
 
         try:
-            client = CosmosClient.from_connection_string(settings.COSMOS_CONN_STR)
+            client = CosmosClient.from_connection_string(
+                settings.COSMOS_CONN_STR, transport=http_transport.azure_transport()
+            )
             database = client.create_database_if_not_exists(id=settings.COSMOS_DB_NAME)
             
             self.container = database.create_container_if_not_exists(
@@ -24,6 +53,10 @@ class TicketStore:
         except Exception as e:
             app_logger.error(f"❌ Error conectando TicketStore: {e}")
             self.container = None
+            return
+
+        self._syncer = threading.Thread(target=self._run_counter_sync, name="ticket-counters", daemon=True)
+        self._syncer.start()
 
     def create_ticket(self, ticket_data: Dict[str, Any]) -> bool:
         """Crea un nuevo ticket en la base de datos"""
@@ -45,57 +78,278 @@ class TicketStore:
             ticket_data["user_id"] = str(ticket_data["user_id"])
 
         try:
-            self.container.create_item(body=ticket_data)
+            with time_stage("cosmos_write"):
+                self.container.create_item(body=ticket_data)
+            self.counters.record(ticket_data)
             app_logger.info(f"💾 Ticket guardado en nube: {ticket_data.get('ticket_id', 'N/A')}")
             return True
         except Exception as e:
             # Si ya existe (idempotencia), no es un error crítico para el script de init
             if "409" in str(e):
                 app_logger.info(f"ℹ️ El ticket {ticket_data.get('ticket_id')} ya existe.")
+                self.counters.record(ticket_data)
                 return True
             app_logger.error(f"❌ Fallo al guardar ticket en Cosmos: {e}")
             return False
 
-    def get_tickets_by_user(self, user_id: str) -> List[Dict[str, Any]]:
-        """Obtiene el historial de un usuario"""
+    def upsert_ticket(self, ticket_data: Dict[str, Any]) -> bool:
+        """Reemplaza (o crea) un ticket ya existente; requiere 'id' y 'user_id' (partition key)."""
+        if not self.container: return False
+
+        try:
+            with time_stage("cosmos_write"):
+                self.container.upsert_item(body=ticket_data)
+            # Los escalados del outbox se crean por upsert; un ticket ya contado no suma otra vez (dedup por id)
+            self.counters.record(ticket_data)
+            return True
+        except Exception as e:
+            app_logger.error(f"❌ Fallo al actualizar ticket {ticket_data.get('ticket_id')} en Cosmos: {e}")
+            return False
+
+    def get_tickets_by_user(self, user_id: str, fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Obtiene el historial de un usuario (más reciente primero). `fields` limita las propiedades devueltas."""
         if not self.container: return []
 
-        query = "SELECT * FROM c WHERE c.user_id = @user_id ORDER BY c.created_at DESC"
-        parameters = [{"name": "@user_id", "value": str(user_id)}]
+        query, parameters = _user_query(user_id, fields=fields, order=True)
 
         try:
-            items = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=False
-            ))
+            with time_stage("cosmos_query"):
+                items = list(self.container.query_items(
+                    query=query,
+                    parameters=parameters,
+                    partition_key=str(user_id)
+                ))
             return items
         except Exception as e:
             app_logger.error(f"❌ Error leyendo tickets: {e}")
             return []
 
-    def get_recent_tickets(self, user_identifier: str, days: int = 7) -> List[Dict[str, Any]]:
-        """Alias para get_tickets_by_user filtrando por fecha (lógica simplificada)"""
-        # Para simplificar en serverless, traemos todos y filtramos en Python si son pocos,
-        # o usamos query con fecha. Usaremos query con fecha.
+    def get_recent_tickets(self, user_identifier: str, days: int = 7, fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Alias para get_tickets_by_user filtrando por fecha (query con fecha). Para contar, usar count_tickets."""
         if not self.container: return []
-        
-        date_limit = (datetime.utcnow() - timedelta(days=days)).isoformat()
-        query = "SELECT * FROM c WHERE c.user_id = @user_id AND c.created_at > @date_limit"
-        parameters = [
-            {"name": "@user_id", "value": str(user_identifier)},
-            {"name": "@date_limit", "value": date_limit}
-        ]
-        
+
+        query, parameters = _user_query(user_identifier, fields=fields, days=days)
+
         try:
-            items = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=False
-            ))
+            with time_stage("cosmos_query"):
+                items = list(self.container.query_items(
+                    query=query,
+                    parameters=parameters,
+                    partition_key=str(user_identifier)
+                ))
             return items
         except Exception as e:
             app_logger.error(f"❌ Error consultando recientes: {e}")
             return []
 
-ticket_store = TicketStore()
\ No newline at end of file
+    def count_tickets(self, user_id: str, days: Optional[int] = None) -> int:
+        """
+        COUNT en el servidor (sin traer documentos): tickets del usuario, opcionalmente de los últimos `days` días.
+        Lanza si no se puede consultar: un 0 significaría "sin tickets" y rebajaría el riesgo calculado.
+        """
+        if not self.container:
+            raise RuntimeError("Cosmos DB no configurado")
+
+        query, parameters = _user_query(user_id, days=days, count=True)
+
+        try:
+            with time_stage("cosmos_query"):
+                result = list(self.container.query_items(
+                    query=query,
+                    parameters=parameters,
+                    partition_key=str(user_id)
+                ))
+            return int(result[0]) if result else 0
+        except Exception as e:
+            app_logger.error(f"❌ Error contando tickets: {e}")
+            raise
+
+    def get_tickets_page(
+        self,
+        user_id: str,
+        fields: Optional[Sequence[str]] = None,
+        days: Optional[int] = None,
+        max_item_count: int = 50,
+        continuation: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Una página del historial (más reciente primero): (items, token de continuación).
+        El token (None en la última página) se pasa tal cual en la siguiente llamada para seguir leyendo.
+        Los errores se propagan: ([], None) se confundiría con "no hay más tickets".
+        """
+        if not self.container:
+            raise RuntimeError("Cosmos DB no configurado")
+
+        query, parameters = _user_query(user_id, fields=fields, days=days, order=True)
+
+        try:
+            pages = self.container.query_items(
+                query=query,
+                parameters=parameters,
+                partition_key=str(user_id),
+                max_item_count=max_item_count
+            ).by_page(continuation)
+            with time_stage("cosmos_query"):
+                items = list(next(pages, []))
+            return items, pages.continuation_token
+        except Exception as e:
+            app_logger.error(f"❌ Error leyendo página de tickets: {e}")
+            raise
+
+    def iter_tickets(
+        self,
+        user_id: str,
+        fields: Optional[Sequence[str]] = None,
+        days: Optional[int] = None,
+        page_size: int = 100,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre el historial página a página sin materializarlo: en memoria solo hay una página
+        y se deja de leer (y de pagar RUs) en cuanto el consumidor para.
+        Un fallo a mitad del recorrido se lanza desde el iterador en vez de cortar el historial sin avisar.
+        """
+        continuation = None
+        while True:
+            items, continuation = self.get_tickets_page(
+                user_id, fields=fields, days=days, max_item_count=page_size, continuation=continuation
+            )
+            yield from items
+            if not continuation:
+                return
+
+    def count_recent_by_user(self, days: int = 7) -> Dict[str, int]:
+        """
+        Tickets recientes por usuario (scoring de toda la plantilla): desde los contadores si ya están sincronizados,
+        si no con una consulta proyectada (solo user_id) agregada en cliente; el SDK no soporta GROUP BY
+        entre particiones. Lanza si no se puede consultar: un {} vacío significaría "nadie tiene tickets".
+        """
+        if self.counters.ready and days <= self.counters.retention_days:
+            COUNT_READS.inc("counters")
+            return self.counters.counts_by_user(days=days)
+        if not self.container:
+            raise RuntimeError("Cosmos DB no configurado")
+        COUNT_READS.inc("cosmos")
+
+        query = "SELECT c.user_id FROM c WHERE c.created_at >= @date_limit"
+        parameters = [{"name": "@date_limit", "value": window_start(days).isoformat()}]
+
+        counts: Counter = Counter()
+        with time_stage("cosmos_query"):
+            for item in self.container.query_items(
+                query=query,
+                parameters=parameters,
+                enable_cross_partition_query=True
+            ):
+                if item.get("user_id") is not None:
+                    counts[user_key(item["user_id"])] += 1
+        return dict(counts)
+
+    def count_recent_tickets(self, user_identifier: str, days: int = 7) -> int:
+        """
+        Número de tickets recientes del usuario (perfil de riesgo).
+        O(1) en memoria con los contadores por día; antes de su primera sincronización, COUNT en Cosmos
+        (sin traer documentos). Lanza si Cosmos no responde, como count_tickets.
+        """
+        if self.counters.ready and days <= self.counters.retention_days:
+            COUNT_READS.inc("counters")
+            return self.counters.count(user_identifier, days=days)
+        COUNT_READS.inc("cosmos")
+        return self.count_tickets(user_identifier, days=days)
+
+    # --- Contadores materializados (change feed) ---
+
+    def sync_counters(self) -> int:
+        """
+        Aplica a los contadores los cambios del change feed desde la última continuación
+        (la primera vez, desde el principio: reconstrucción completa). Devuelve los tickets nuevos contabilizados.
+        """
+        rebuilding = self._feed_continuation is None
+        etags: List[str] = []
+
+        def capture_etag(headers, _result):
+            # El ETag de cada página del feed es su continuación. Se toma de las respuestas de esta llamada:
+            # last_response_headers del cliente es compartido y lo pisa cualquier otra petición concurrente.
+            if headers and headers.get("etag"):
+                etags.append(headers["etag"])
+
+        with time_stage("cosmos_change_feed"):
+            feed = self.container.query_items_change_feed(
+                is_start_from_beginning=rebuilding, continuation=self._feed_continuation, response_hook=capture_etag
+            )
+            counted = self.counters.rebuild(feed) if rebuilding else sum(1 for item in feed if self.counters.record(item))
+        if etags:
+            self._feed_continuation = etags[-1]
+        self.last_sync_at = time.time()
+        if rebuilding:
+            stats = self.counters.stats()
+            app_logger.info(f"🔢 Contadores de tickets reconstruidos desde el change feed ({stats['tickets']} tickets, {stats['users']} usuarios).")
+        return counted
+
+    def _run_counter_sync(self):
+        delay = 0.0
+        while not self._stop.wait(delay):
+            try:
+                self.sync_counters()
+                self._sync_failures = 0
+                delay = self.sync_interval
+            except Exception as e:
+                self._sync_failures += 1
+                app_logger.warning(f"⚠️ Sincronización de contadores de tickets fallida ({self._sync_failures}): {e}")
+                if self._sync_failures >= MAX_SYNC_FAILURES and self.counters.ready:
+                    self._invalidate_counters()
+                delay = min(self.sync_interval, 30.0) if self.sync_interval > 0 else 30.0
+            if self.sync_interval <= 0 and self.counters.ready:
+                return  # Solo reconstrucción inicial: el resto lo alimentan las escrituras de este proceso
+
+    def _invalidate_counters(self):
+        """
+        Sin change feed los contadores solo ven las escrituras de este proceso: dejan de responder (las lecturas
+        vuelven a Cosmos) y la próxima sincronización que funcione los reconstruye desde el principio.
+        """
+        self.counters.ready = False
+        self._feed_continuation = None
+        app_logger.error(f"❌ Contadores de tickets desactivados tras {self._sync_failures} sincronizaciones fallidas; se cuenta en Cosmos.")
+
+    def close(self):
+        self._stop.set()
+
+def _user_query(
+    user_id: str,
+    fields: Optional[Sequence[str]] = None,
+    days: Optional[int] = None,
+    count: bool = False,
+    order: bool = False,
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Consulta parametrizada sobre la partición de un usuario.
+    fields -> SELECT c.a, c.b (nombres validados: se interpolan en el SQL); count -> SELECT VALUE COUNT(1).
+    """
+    if count:
+        select = "SELECT VALUE COUNT(1)"
+    elif fields:
+        invalid = [f for f in fields if not _FIELD_NAME.match(f)]
+        if invalid:
+            raise ValueError(f"Campos de proyección no válidos: {invalid}")
+        select = "SELECT " + ", ".join(f"c.{f}" for f in dict.fromkeys(fields))
+    else:
+        select = "SELECT *"
+
+    conditions = ["c.user_id = @user_id"]
+    parameters = [{"name": "@user_id", "value": str(user_id)}]
+    if days is not None:
+        # Días naturales UTC (hoy incluido), la misma ventana que los contadores
+        conditions.append("c.created_at >= @date_limit")
+        parameters.append({"name": "@date_limit", "value": window_start(days).isoformat()})
+
+    query = f"{select} FROM c WHERE {' AND '.join(conditions)}"
+    if order and not count:
+        query += " ORDER BY c.created_at DESC"
+    return query, parameters
+
+ticket_store = services.register("ticket_store", TicketStore, ready_check=lambda s: s.container is not None)
+
+metrics_registry.gauge(
+    "neurodesk_ticket_counters_users",
+    "Usuarios con tickets en los contadores materializados (-1 sin sincronizar)",
+    lambda: ticket_store.counters.stats()["users"] if services.is_built("ticket_store") and ticket_store.counters.ready else -1
+)
\ No newline at end of file
@@ -0,0 +1,25 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+class TurnContext:
+    """
+    Estado de un único turno de conversación.
+    Viaja por ContextVar para que los filtros de Semantic Kernel (que no reciben
+    el request) puedan publicar eventos del turno en curso.
+    """
+
+    def __init__(self, events: Optional[asyncio.Queue] = None):
+        # Cola de eventos para streaming (SSE). None en modo no-streaming.
+        self.events = events
+        # Payload de UI capturado de las herramientas de ESTE turno (ToolResult.system_data)
+        self.ui_component: Optional[Dict[str, Any]] = None
+        # Registro de invocaciones de herramientas de ESTE turno (filtro de telemetría)
+        self.tool_calls: List[Dict[str, Any]] = []
+
+    def emit(self, event: str, data: Dict[str, Any]):
+        if self.events is not None:
+            self.events.put_nowait((event, data))
+
+# Turno activo en la tarea actual (None fuera de process_message)
+current_turn: ContextVar[Optional[TurnContext]] = ContextVar("neurodesk_current_turn", default=None)
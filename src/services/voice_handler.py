@@ -6,6 +6,8 @@ import tempfile
 import asyncio
 import re
 from src.utils.logger import app_logger
+from src.services.service_registry import services
+from src.utils.metrics import time_stage
 
 class VoiceHandler:
     def __init__(self):
@@ -87,7 +89,8 @@ class VoiceHandler:
             )
 
             app_logger.info("🎙️ Transcribiendo audio desde archivo...")
-            result = speech_recognizer.recognize_once_async().get()
+            with time_stage("stt"):
+                result = speech_recognizer.recognize_once_async().get()
             
             if result.reason == speechsdk.ResultReason.RecognizedSpeech:
                 text = result.text.strip()
@@ -128,7 +131,8 @@ class VoiceHandler:
             )
 
             app_logger.info(f"🔊 Sintetizando audio (limpio): {clean_text[:50]}...")
-            result = synthesizer.speak_text_async(clean_text).get()
+            with time_stage("tts"):
+                result = synthesizer.speak_text_async(clean_text).get()
 
             if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
                 audio_base64 = base64.b64encode(result.audio_data).decode('utf-8')
@@ -146,4 +150,6 @@ class VoiceHandler:
             app_logger.error(f"💥 Error en TTS: {e}")
             return ""
 
-voice_handler = VoiceHandler()
\ No newline at end of file
+voice_handler = services.register(
+    "voice_handler", VoiceHandler, ready_check=lambda s: s.speech_config is not None, critical=False
+)
\ No newline at end of file
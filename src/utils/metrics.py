@@ -0,0 +1,207 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Buckets por defecto (segundos) pensados para latencias de red / LLM
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _ShardedMetric:
+    """
+    Registro "lock-light": cada hilo escribe en su propio shard sin tomar locks.
+    El lock solo se usa una vez por hilo (alta del shard) y al leer (scrape), que suma los shards.
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], list]] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[Tuple[str, ...], list]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _merged(self, width: int) -> Dict[Tuple[str, ...], list]:
+        merged: Dict[Tuple[str, ...], list] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for labels, series in list(shard.items()):
+                acc = merged.setdefault(labels, [0] * width)
+                for i, v in enumerate(series):
+                    acc[i] += v
+        return merged
+
+
+class Counter(_ShardedMetric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            series = shard[labels] = [0]
+        series[0] += amount
+
+    def value(self, *labels: str) -> float:
+        return self._merged(1).get(labels, [0])[0]
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(series[0])}"
+            for labels, series in sorted(self._merged(1).items())
+        ]
+
+
+class Histogram(_ShardedMetric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Layout de cada serie: [conteo por bucket..., +Inf, suma, total]
+        self._width = len(self.buckets) + 3
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            series = shard[labels] = [0] * self._width
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def snapshot(self, *labels: str) -> Dict[str, float]:
+        series = self._merged(self._width).get(labels)
+        if not series:
+            return {"count": 0, "sum": 0.0}
+        return {"count": series[-1], "sum": series[-2]}
+
+    def render(self) -> List[str]:
+        lines = []
+        bounds = list(self.buckets) + [float("inf")]
+        for labels, series in sorted(self._merged(self._width).items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_number(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Gauge por callback: el valor se lee en el scrape (sin coste en el hot path)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            # Un gauge roto no debe tumbar el endpoint completo
+            return []
+        return [f"{self.name} {_format_number(value)}"]
+
+
+class MetricsRegistry:
+    """Registro de métricas del proceso con exposición en formato texto de Prometheus."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _ShardedMetric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], float]) -> Gauge:
+        # Re-registrar un gauge sustituye el callback (p.ej. si se recrea el servicio)
+        with self._lock:
+            metric = self._metrics[name] = Gauge(name, help_text, fn)
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Registro global de la aplicación
+metrics_registry = MetricsRegistry()
+
+# Latencia por etapa del pipeline (safety, sentiment, intent, llm, audit_write, stt, tts, cosmos_*, search...)
+STAGE_LATENCY = metrics_registry.histogram(
+    "neurodesk_stage_duration_seconds",
+    "Latencia por etapa del pipeline",
+    ("stage",)
+)
+
+
+class time_stage:
+    """
+    Cronómetro de etapa: `with time_stage("safety"): ...`
+    Clase con __slots__ en lugar de @contextmanager para no crear un generador por llamada.
+    """
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_LATENCY.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_LATENCY.observe(seconds, stage)
@@ -0,0 +1,98 @@
+"""
+Fixtures comunes. Los tests corren sin Azure: Cosmos se sustituye por un contenedor en memoria.
+Uso: python -m pytest -q
+"""
+import copy
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from azure.cosmos.exceptions import (  # noqa: E402
+    CosmosAccessConditionFailedError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
+
+
+class FakeCosmosContainer:
+    """
+    Contenedor Cosmos mínimo en memoria: CRUD por (partición, id) con ETag.
+    query_items no interpreta SQL: devuelve los documentos de la partición (o todos) y cada test
+    filtra con `query_filter` si lo necesita. `before_replace` permite intercalar otro escritor.
+    El change feed es el registro de escrituras; su ETag (continuación) es la posición en ese registro.
+    """
+
+    def __init__(self, partition_field: str):
+        self.partition_field = partition_field
+        self.docs = {}
+        self.before_replace = None
+        self.query_filter = None
+        self.feed = []
+        self.feed_error = None
+
+    def _key(self, body):
+        return (str(body[self.partition_field]), body["id"])
+
+    def _store(self, body):
+        doc = copy.deepcopy(body)
+        doc["_etag"] = uuid.uuid4().hex
+        self.docs[self._key(doc)] = doc
+        self.feed.append(doc)
+        return copy.deepcopy(doc)
+
+    def read_item(self, item, partition_key):
+        try:
+            return copy.deepcopy(self.docs[(str(partition_key), item)])
+        except KeyError:
+            raise CosmosResourceNotFoundError(status_code=404, message="not found")
+
+    def create_item(self, body, **kwargs):
+        if self._key(body) in self.docs:
+            raise CosmosResourceExistsError(status_code=409, message="conflict")
+        return self._store(body)
+
+    def upsert_item(self, body, **kwargs):
+        return self._store(body)
+
+    def replace_item(self, item, body, etag=None, match_condition=None, **kwargs):
+        if self.before_replace:
+            hook, self.before_replace = self.before_replace, None
+            hook()
+        current = self.docs.get(self._key(body))
+        if current is None:
+            raise CosmosResourceNotFoundError(status_code=404, message="not found")
+        if etag is not None and current["_etag"] != etag:
+            raise CosmosAccessConditionFailedError(status_code=412, message="precondition failed")
+        return self._store(body)
+
+    def delete_item(self, item, partition_key, **kwargs):
+        if self.docs.pop((str(partition_key), item), None) is None:
+            raise CosmosResourceNotFoundError(status_code=404, message="not found")
+
+    def query_items(self, query, parameters=None, partition_key=None, **kwargs):
+        docs = [
+            copy.deepcopy(d) for (pk, _), d in self.docs.items()
+            if partition_key is None or pk == str(partition_key)
+        ]
+        if self.query_filter:
+            docs = self.query_filter(query, parameters or [], docs)
+        return docs
+
+
+    def query_items_change_feed(self, is_start_from_beginning=False, continuation=None, response_hook=None, **kwargs):
+        if self.feed_error:
+            raise self.feed_error
+        start = 0 if is_start_from_beginning else int(continuation or len(self.feed))
+        changes = [copy.deepcopy(d) for d in self.feed[start:]]
+        if response_hook:
+            response_hook({"etag": str(len(self.feed))}, changes)
+        return iter(changes)
+
+
+@pytest.fixture
+def make_container():
+    return FakeCosmosContainer
@@ -0,0 +1,91 @@
+import json
+import time
+
+import pytest
+
+from src.config import settings
+from src.services.audit_ledger import AuditLedger
+
+
+class FakeLogContainer:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.items = {}
+        self.attempts = 0
+
+    def upsert_item(self, body):
+        self.attempts += 1
+        if self.fail:
+            raise ConnectionError("Cosmos 503")
+        self.items[body["id"]] = body
+
+
+@pytest.fixture
+def make_ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "COSMOS_CONN_STR", None)  # sin cliente real: el contenedor lo pone el test
+    monkeypatch.setattr(settings, "AUDIT_SPILL_PATH", tmp_path / "audit_spill.jsonl")
+    monkeypatch.setattr(settings, "AUDIT_BATCH_SIZE", 10)
+    monkeypatch.setattr(settings, "AUDIT_FLUSH_INTERVAL", 0.3)
+    monkeypatch.setattr(settings, "AUDIT_MAX_RETRIES", 4)
+    created = []
+
+    def factory(container: FakeLogContainer) -> AuditLedger:
+        ledger = AuditLedger()
+        ledger.container = container
+        ledger._start_worker()
+        created.append(ledger)
+        return ledger
+
+    yield factory
+    for ledger in created:
+        ledger.close(timeout=2)
+
+
+def wait_until(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def spilled(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()] if path.exists() else []
+
+
+def test_partial_batch_is_flushed_within_one_interval(make_ledger):
+    container = FakeLogContainer()
+    ledger = make_ledger(container)
+    time.sleep(0.05)  # el worker ya está esperando
+
+    start = time.monotonic()
+    ledger.log_transaction("u1", "hola", "respuesta")
+    assert wait_until(lambda: container.items, timeout=2)
+    assert time.monotonic() - start < ledger.flush_interval * 1.5
+
+
+def test_close_interrupts_retries_and_spills_in_flight_batch(make_ledger):
+    container = FakeLogContainer(fail=True)
+    ledger = make_ledger(container)
+    ledger.log_transaction("u1", "hola", "respuesta")
+    assert wait_until(lambda: container.attempts >= 1)
+
+    start = time.monotonic()
+    ledger.close(timeout=2)  # el worker está en la espera de 0.5s antes del reintento
+    assert time.monotonic() - start < 1.0
+    assert not ledger._worker.is_alive()
+    [record] = spilled(settings.AUDIT_SPILL_PATH)
+    assert (record["spill_reason"], record["user_id"]) == ("shutdown", "u1")
+
+
+def test_spill_file_is_replayed_on_startup(make_ledger):
+    settings.AUDIT_SPILL_PATH.write_text(
+        "".join(json.dumps({"spill_reason": "shutdown", "id": f"r{i}", "user_id": "u1"}) + "\n" for i in range(3)),
+        encoding="utf-8",
+    )
+    container = FakeLogContainer()
+    ledger = make_ledger(container)
+
+    assert wait_until(lambda: len(container.items) == 3)
+    assert ledger.stats["replayed"] == 3
+    assert "spill_reason" not in container.items["r0"]
+    assert list(settings.AUDIT_SPILL_PATH.parent.iterdir()) == []  # spill consumido, sin ficheros de replay
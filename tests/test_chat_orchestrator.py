@@ -0,0 +1,40 @@
+import asyncio
+
+from semantic_kernel.contents import ChatHistory
+
+from src.services.chat_orchestrator import (
+    COMPACTION_EVENTS,
+    COMPACTION_TOKENS_SAVED,
+    PROMPT_HISTORY_TOKENS,
+    ChatOrchestrator,
+)
+
+
+class FakeCompactor:
+    def __init__(self, report):
+        self.report = report
+
+    async def compact(self, session_key, history, chat_service):
+        return ChatHistory(), self.report
+
+
+def test_prompt_view_records_compaction_report():
+    report = {"tokens_full": 5000, "tokens_sent": 1200, "tokens_saved": 3800, "summarized_turns": 3, "collapsed_tool_results": 2}
+    orchestrator = object.__new__(ChatOrchestrator)
+    orchestrator._compactor = FakeCompactor(report)
+    before = (
+        PROMPT_HISTORY_TOKENS.snapshot("full"),
+        PROMPT_HISTORY_TOKENS.snapshot("sent"),
+        COMPACTION_TOKENS_SAVED.snapshot(),
+        COMPACTION_EVENTS.value("summary_used"),
+        COMPACTION_EVENTS.value("collapsed_tool_results"),
+    )
+
+    asyncio.run(orchestrator._prompt_view("s1", ChatHistory(), chat_service=None))
+
+    assert PROMPT_HISTORY_TOKENS.snapshot("full")["sum"] - before[0]["sum"] == 5000
+    assert PROMPT_HISTORY_TOKENS.snapshot("sent")["sum"] - before[1]["sum"] == 1200
+    assert COMPACTION_TOKENS_SAVED.snapshot()["count"] - before[2]["count"] == 1
+    assert COMPACTION_TOKENS_SAVED.snapshot()["sum"] - before[2]["sum"] == 3800
+    assert COMPACTION_EVENTS.value("summary_used") - before[3] == 1
+    assert COMPACTION_EVENTS.value("collapsed_tool_results") - before[4] == 2
@@ -0,0 +1,224 @@
+import json
+import time
+
+import pytest
+
+import src.services.escalation_outbox as outbox_module
+from src.config import settings
+from src.services.escalation_outbox import EscalationOutbox
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, text: str = ""):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {"x-ms-request-id": "req-1"}
+
+
+class FakeLogicApp:
+    """Sustituye a http_transport: cada POST consume la siguiente respuesta (o excepción) del guion."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.posts = []
+        self.session = self
+
+    def post(self, url, json=None, timeout=None):
+        self.posts.append(json)
+        outcome = self.script.pop(0) if self.script else FakeResponse(202)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class FakeTicketStore:
+    def __init__(self, fail_times: int = 0):
+        self.fail_times = fail_times
+        self.saved = {}
+
+    def upsert_ticket(self, ticket):
+        if self.fail_times:
+            self.fail_times -= 1
+            return False
+        self.saved[ticket["id"]] = dict(ticket)
+        return True
+
+
+@pytest.fixture
+def make_outbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_PATH", tmp_path / "outbox.db")
+    monkeypatch.setattr(settings, "OUTBOX_DEAD_LETTER_PATH", tmp_path / "dead.jsonl")
+    monkeypatch.setattr(settings, "LOGIC_APP_URL", "http://logic-app.local/escalate")
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "OUTBOX_MAX_BACKOFF", 0)  # reintentos vencidos al instante
+    created = []
+
+    def factory(logic_app: FakeLogicApp, store: FakeTicketStore, worker: bool = False) -> EscalationOutbox:
+        monkeypatch.setattr(outbox_module, "http_transport", logic_app)
+        monkeypatch.setattr(outbox_module, "ticket_store", store)
+        outbox = EscalationOutbox()
+        if not worker:
+            outbox.close()  # sin worker de fondo: los lotes se procesan a mano en el test
+        created.append(outbox)
+        return outbox
+
+    yield factory
+    for outbox in created:
+        outbox.close(timeout=2)
+
+
+def ticket(n: int = 1) -> dict:
+    return {"id": f"id-{n}", "ticket_id": f"ESC-{n}", "user_id": "u1", "notification_status": "pending"}
+
+
+def drain(outbox: EscalationOutbox, rounds: int = 5):
+    for _ in range(rounds):
+        batch = outbox._due_batch()
+        if not batch:
+            return
+        outbox._deliver_batch(batch)
+
+
+def dead_letters(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()] if path.exists() else []
+
+
+def test_delivers_ticket_and_notification(make_outbox):
+    logic_app, store = FakeLogicApp(FakeResponse(202)), FakeTicketStore()
+    outbox = make_outbox(logic_app, store)
+    outbox.enqueue(ticket(), {"ticket_id": "ESC-1"})
+    drain(outbox)
+
+    assert outbox.pending() == 0
+    assert store.saved["id-1"]["notification_status"] == "sent"
+    assert store.saved["id-1"]["logic_app_triggered"] is True
+    assert len(logic_app.posts) == 1
+
+
+def test_transient_failures_retry_without_renotifying(make_outbox):
+    logic_app = FakeLogicApp(FakeResponse(503), ConnectionError("reset"), FakeResponse(202))
+    store = FakeTicketStore(fail_times=1)
+    outbox = make_outbox(logic_app, store)
+    outbox.enqueue(ticket(), {"ticket_id": "ESC-1"})
+    drain(outbox)
+
+    assert outbox.pending() == 0
+    assert outbox.stats["retries"] == 2
+    assert store.saved["id-1"]["notification_status"] == "sent"
+    assert len(logic_app.posts) == 3
+
+
+def test_exhausted_retries_dead_letter_and_mark_ticket_failed(make_outbox):
+    logic_app = FakeLogicApp(FakeResponse(503), FakeResponse(503), FakeResponse(503))
+    store = FakeTicketStore()
+    outbox = make_outbox(logic_app, store)
+    outbox.enqueue(ticket(), {"ticket_id": "ESC-1"})
+    drain(outbox)
+
+    assert outbox.pending() == 0
+    [entry] = dead_letters(settings.OUTBOX_DEAD_LETTER_PATH)
+    assert entry["attempts"] == 3
+    assert entry["last_error"].startswith("HTTP 503")
+    assert store.saved["id-1"]["notification_status"] == "failed"
+    assert store.saved["id-1"]["notification_error"].startswith("HTTP 503")
+
+
+def test_permanent_4xx_dead_letters_immediately(make_outbox):
+    logic_app, store = FakeLogicApp(FakeResponse(400, "bad payload")), FakeTicketStore()
+    outbox = make_outbox(logic_app, store)
+    outbox.enqueue(ticket(), {"ticket_id": "ESC-1"})
+    drain(outbox)
+
+    assert len(logic_app.posts) == 1
+    assert len(dead_letters(settings.OUTBOX_DEAD_LETTER_PATH)) == 1
+    saved = store.saved["id-1"]
+    assert saved["notification_status"] == "failed"
+    assert saved["logic_app_triggered"] is False
+    assert saved["logic_app_response"]["status_code"] == 400
+
+
+def test_pending_rows_survive_restart(make_outbox):
+    outbox = make_outbox(FakeLogicApp(), FakeTicketStore())
+    outbox.enqueue(ticket(1), {"ticket_id": "ESC-1"})
+    outbox.enqueue(ticket(2), None)
+    assert outbox.pending() == 2
+
+    # Un proceso nuevo sobre el mismo SQLite: su worker retoma lo pendiente al arrancar
+    store = FakeTicketStore()
+    restarted = make_outbox(FakeLogicApp(), store, worker=True)
+    deadline = time.monotonic() + 5
+    while restarted.pending() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert restarted.pending() == 0
+    assert set(store.saved) == {"id-1", "id-2"}
+
+
+def test_workers_sharing_the_file_notify_each_row_once(make_outbox):
+    logic_app, store = FakeLogicApp(), FakeTicketStore()
+    first = make_outbox(logic_app, store)
+    second = make_outbox(logic_app, store)  # otro worker de uvicorn sobre el mismo OUTBOX_PATH
+    first.enqueue(ticket(1), {"ticket_id": "ESC-1"})
+
+    claimed = first._due_batch()
+    assert [row["id"] for row in claimed] == ["id-1"]
+    assert second._due_batch() == []  # reservada por el primero
+    first._deliver_batch(claimed)
+    drain(second)
+
+    assert len(logic_app.posts) == 1
+    assert first.pending() == 0
+
+
+def test_concurrent_workers_deliver_once(make_outbox):
+    logic_app, store = FakeLogicApp(), FakeTicketStore()
+    first = make_outbox(logic_app, store)
+    for n in range(10):
+        first.enqueue(ticket(n), {"ticket_id": f"ESC-{n}"})
+    workers = [make_outbox(logic_app, store, worker=True) for _ in range(3)]
+
+    deadline = time.monotonic() + 5
+    while first.pending() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert first.pending() == 0
+    assert sorted(p["ticket_id"] for p in logic_app.posts) == sorted(f"ESC-{n}" for n in range(10))
+    assert sum(w.stats["delivered"] for w in workers) == 10
+
+
+def test_expired_claim_is_taken_over(make_outbox):
+    logic_app, store = FakeLogicApp(), FakeTicketStore()
+    crashed = make_outbox(logic_app, store)
+    crashed.claim_ttl = -1  # reserva ya caducada: el proceso murió a mitad de lote
+    crashed.enqueue(ticket(1), {"ticket_id": "ESC-1"})
+    assert crashed._due_batch()
+
+    survivor = make_outbox(logic_app, store)
+    drain(survivor)
+    assert survivor.pending() == 0 and len(logic_app.posts) == 1
+
+
+def test_plugin_fallback_does_not_claim_logic_app_was_triggered(monkeypatch):
+    import src.services.plugins.it_plugin as it_plugin
+
+    class BrokenOutbox:
+        def enqueue(self, ticket, notification):
+            raise OSError("disco lleno")
+
+    created = []
+
+    class RecordingStore:
+        def create_ticket(self, record):
+            created.append(dict(record))
+            return True
+
+    monkeypatch.setattr(settings, "LOGIC_APP_URL", "http://logic-app.local/escalate")
+    monkeypatch.setattr(it_plugin, "escalation_outbox", BrokenOutbox())
+    monkeypatch.setattr(it_plugin, "ticket_store", RecordingStore())
+
+    reply = it_plugin.ITAgentPlugin().escalate_to_human("u1", "sin acceso", "Alta")
+
+    assert "TICKET REGISTRADO" in reply
+    [record] = created
+    assert record["logic_app_triggered"] is False
+    assert record["logic_app_response"] is None
+    assert record["notification_status"] == "failed"
+    assert "disco lleno" in record["notification_error"]
@@ -0,0 +1,85 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.services.hr_snapshot import HRSnapshot, HashKeyIndex, SnapshotCache
+
+CSV = """Employee_Name,EmpID,Position,Department,ManagerName,EmpSatisfaction,SpecialProjectsCount,LastPerformanceReview_Date,Absences,Email,Average_Monthly_Hours,Salary
+"Pérez, Ana",10001,Database Admin,IT/IS,Simon Roup,2,6,1/17/2019,3, Ana.Perez@Empresa.com ,230.5,90000
+"Gómez, Luis",10002,Production Technician I,Production       ,Kissy Sullivan,4,0,2/1/2019,12,luis.gomez@empresa.com,160,50000
+"Duplicado, Ana",10003,Area Sales Manager,Sales,,,,,,ana.perez@empresa.com,,70000
+"""
+
+
+@pytest.fixture
+def snapshot():
+    return HRSnapshot.from_csv(io.StringIO(CSV), etag='"0x8DC"')
+
+
+def metrics_for(snapshot, identifier):
+    row = snapshot.find(identifier)
+    return None if row is None else snapshot.record(row).to_metrics()
+
+
+def test_lookup_by_email_and_empid(snapshot):
+    assert len(snapshot) == 3
+    ana = metrics_for(snapshot, "  ANA.PEREZ@empresa.com")
+    assert ana["name"] == "Pérez, Ana"  # clave duplicada: gana la primera fila
+    assert ana["satisfaction"] == 2.0 and ana["monthly_hours"] == 230.5
+    assert metrics_for(snapshot, "10002")["department"] == "Production       "
+    assert metrics_for(snapshot, "nadie@empresa.com") is None
+
+
+def test_missing_values_use_defaults(snapshot):
+    row = snapshot.by_empid.get("10003")
+    record = snapshot.record(row)
+    assert (record.manager, record.satisfaction, record.monthly_hours, record.absences) == ("N/A", 3.0, 160.0, 0)
+
+
+def test_save_load_round_trip(snapshot, tmp_path):
+    snapshot.save(tmp_path / "snap")
+    loaded = HRSnapshot.load(tmp_path / "snap")
+
+    assert isinstance(loaded.by_email, HashKeyIndex)
+    assert isinstance(loaded.columns["EmpSatisfaction"], np.memmap)
+    assert (loaded.etag, len(loaded), loaded.loaded_at) == (snapshot.etag, len(snapshot), snapshot.loaded_at)
+    for identifier in ("ana.perez@empresa.com", "10001", "10002", "10003", "luis.gomez@empresa.com", "x"):
+        assert metrics_for(loaded, identifier) == metrics_for(snapshot, identifier)
+
+
+def test_hash_index_finds_every_key_and_rejects_missing():
+    mapping = {f"user{i}@empresa.com": i for i in range(500)}
+    index = HashKeyIndex.from_mapping(mapping)
+    assert len(index.table) >= 2 * len(mapping)
+    assert all(index.get(key) == row for key, row in mapping.items())
+    assert index.get("nadie@empresa.com") is None
+    assert HashKeyIndex.from_mapping({}).get("x") is None
+
+
+def test_load_rejects_incomplete_directory(snapshot, tmp_path):
+    snapshot.save(tmp_path / "snap")
+    (tmp_path / "snap" / "manifest.json").unlink()
+    with pytest.raises(FileNotFoundError):
+        HRSnapshot.load(tmp_path / "snap")
+
+
+def test_snapshot_cache_stores_points_and_prunes(tmp_path):
+    cache = SnapshotCache(tmp_path, keep=2)
+    assert cache.load_current() is None
+
+    frame = pd.read_csv(io.StringIO(CSV), dtype={"EmpID": str})
+    for etag in ('"v1"', '"v2"', '"v3"'):
+        stored = cache.store(HRSnapshot.from_dataframe(frame, etag=etag))
+        assert stored.etag == etag
+
+    current = cache.load_current()
+    assert current.etag == '"v3"'
+    assert metrics_for(current, "10001")["name"] == "Pérez, Ana"
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == ["v2", "v3"]
+
+
+def test_unreadable_current_is_ignored(tmp_path):
+    (tmp_path / "CURRENT").write_text("no-existe", encoding="utf-8")
+    assert SnapshotCache(tmp_path).load_current() is None
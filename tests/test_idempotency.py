@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+from src.api.idempotency import IdempotencyCache, IdempotencyConflict
+from src.models.messages import ChatResponse
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_replays_completed_response():
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=10)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return ChatResponse(response="ok", is_safe=True)
+
+    async def scenario():
+        first = await cache.run("u:k", "fp", work)
+        second = await cache.run("u:k", "fp", work)
+        return first, second
+
+    (first, replayed_first), (second, replayed_second) = run(scenario())
+    assert len(calls) == 1
+    assert (replayed_first, replayed_second) == (False, True)
+    assert second is first
+
+
+def test_concurrent_duplicates_share_one_execution():
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=10)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "respuesta"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.run("u:k", "fp", work) for _ in range(5)))
+
+    results = run(scenario())
+    assert len(calls) == 1
+    assert [r for r, _ in results] == ["respuesta"] * 5
+    assert sum(replayed for _, replayed in results) == 4
+
+
+def test_same_key_different_body_conflicts():
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=10)
+
+    async def work():
+        return "ok"
+
+    async def scenario():
+        await cache.run("u:k", "fp-1", work)
+        await cache.run("u:k", "fp-2", work)
+
+    with pytest.raises(IdempotencyConflict):
+        run(scenario())
+
+
+def test_failures_and_error_responses_are_not_cached():
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=10)
+    outcomes = [RuntimeError("caído"), ChatResponse(response="Error temporal", is_safe=True, is_error=True), "ok"]
+    calls = []
+
+    async def work():
+        outcome = outcomes[len(calls)]
+        calls.append(1)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await cache.run("u:k", "fp", work)
+        error, replayed_error = await cache.run("u:k", "fp", work)
+        ok, replayed_ok = await cache.run("u:k", "fp", work)
+        return error, replayed_error, ok, replayed_ok
+
+    error, replayed_error, ok, replayed_ok = run(scenario())
+    assert error.is_error and not replayed_error
+    assert ok == "ok" and not replayed_ok
+    assert len(calls) == 3
+    assert cache.stats() == {"in_flight": 0, "cached": 1}
+
+
+def test_entries_expire_and_are_bounded():
+    cache = IdempotencyCache(ttl_seconds=0.05, max_entries=2)
+
+    async def work():
+        return "ok"
+
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await cache.run(key, "fp", work)
+        assert cache.stats()["cached"] == 2
+        time.sleep(0.06)
+        _, replayed = await cache.run("c", "fp", work)
+        return replayed
+
+    assert run(scenario()) is False
@@ -0,0 +1,11 @@
+from src.config import settings
+from src.scripts.check_import_budget import run_probe
+
+
+def test_import_is_lazy_and_within_budget():
+    run_probe()  # calienta la caché de bytecode, como el script
+    result = run_probe()
+
+    assert result["built"] == []  # ningún servicio se construye al importar src.api.main
+    assert result["elapsed"] <= settings.IMPORT_BUDGET_SECONDS
+
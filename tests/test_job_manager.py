@@ -0,0 +1,106 @@
+import asyncio
+
+import src.services.plugins.it_plugin as it_plugin
+from src.services.job_manager import TIMED_OUT, RunbookJobManager
+
+
+class FakeBackend:
+    """Backend del job manager: Azure responde con el guion de estados (el último se repite)."""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.created, self.tickets = [], []
+        self.remote = {}  # jobs lanzados por otro worker, solo conocidos en Azure
+
+    def _create_job(self, runbook, parameters, job_id):
+        self.created.append(job_id)
+
+    def _get_job_status(self, job_id):
+        return self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+
+    def _find_job_status(self, job_id):
+        return self.remote.get(job_id)
+
+    def _read_job_output(self, job_id):
+        return "reiniciado"
+
+    def _normalize_output(self, raw_text):
+        return raw_text
+
+    def _persist_ticket(self, user_id, runbook, description, job_id, status, output, metrics, linked):
+        ticket = {"ticket_id": f"AUTO-{len(self.tickets)}", "automation_status": status, "output": output}
+        self.tickets.append(ticket)
+        return ticket
+
+    def _link_ticket(self, ticket, linked_users):
+        ticket["linked_users"] = list(linked_users)
+
+
+def make_manager(backend):
+    manager = RunbookJobManager(min_delay=0.01, max_delay=0.02, max_tracked=10, coalesce_cooldown=60)
+    manager.bind(backend)
+    return manager
+
+
+def test_completed_job_persists_output():
+    backend = FakeBackend("Running", "Completed")
+    manager = make_manager(backend)
+
+    async def scenario():
+        job = await manager.submit("NeuroDesk-Restart", {"Name": "app"}, "u1", "reinicio", max_wait_seconds=5)
+        return await manager.wait(job, timeout=5)
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.output, job.timed_out) == ("Completed", "reiniciado", False)
+    assert backend.tickets[0]["automation_status"] == "Completed"
+
+
+def test_timeout_is_an_explicit_terminal_state():
+    backend = FakeBackend("Running")
+    manager = make_manager(backend)
+
+    async def scenario():
+        job = await manager.submit("NeuroDesk-Restart", {"Name": "app"}, "u1", "reinicio", max_wait_seconds=0)
+        return await manager.wait(job, timeout=5)
+
+    job = asyncio.run(scenario())
+    assert job.timed_out and job.status == TIMED_OUT
+    assert job.to_dict()["azure_status"] == "Running"
+    assert "pendiente de verificación" in job.output
+    assert backend.tickets[0]["automation_status"] == TIMED_OUT
+
+
+def test_lookup_falls_back_to_azure_for_jobs_of_other_workers():
+    backend = FakeBackend("Completed")
+    backend.remote["job-de-otro-worker"] = "Running"
+    manager = make_manager(backend)
+
+    async def scenario():
+        job = await manager.submit("NeuroDesk-Restart", {"Name": "app"}, "u1", "reinicio", max_wait_seconds=5)
+        await manager.wait(job, timeout=5)
+        return (
+            await manager.lookup(job.job_id),
+            await manager.lookup("job-de-otro-worker"),
+            await manager.lookup("no-existe"),
+        )
+
+    local, remote, missing = asyncio.run(scenario())
+    assert local["tracked_here"] and local["status"] == "Completed"
+    assert remote["tracked_here"] is False
+    assert (remote["status"], remote["finished"]) == ("Running", False)
+    assert missing is None
+
+
+def test_timed_out_ticket_stays_open(monkeypatch):
+    saved = []
+
+    class RecordingStore:
+        def create_ticket(self, record):
+            saved.append(record)
+            return True
+
+    monkeypatch.setattr(it_plugin, "ticket_store", RecordingStore())
+    plugin = object.__new__(it_plugin.ITAgentPlugin)
+    for status, expected in ((TIMED_OUT, "Pending Verification"), ("Completed", "Resolved"), ("Failed", "Closed")):
+        plugin._persist_ticket("u1", "NeuroDesk-Restart", "reinicio", "job-1", status, "salida", {})
+        assert saved[-1]["status"] == expected
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from src.services.result_cache import StaleWhileRevalidateCache
+
+
+class Loader:
+    """Loader async que cuenta llamadas; cada llamada devuelve el siguiente valor (o lanza si es excepción)."""
+
+    def __init__(self, *outcomes, delay: float = 0.0):
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def test_concurrent_misses_share_one_load():
+    cache = StaleWhileRevalidateCache("test", fresh_ttl=60, max_stale=120)
+    loader = Loader("v1", delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get("k", loader) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert loader.calls == 1
+    assert [value for value, _ in results] == ["v1"] * 5
+
+
+def test_fresh_hit_does_not_call_loader():
+    cache = StaleWhileRevalidateCache("test", fresh_ttl=60, max_stale=120)
+    loader = Loader("v1", "v2")
+
+    async def scenario():
+        await cache.get("k", loader)
+        return await cache.get("k", loader)
+
+    value, age = asyncio.run(scenario())
+    assert (value, loader.calls) == ("v1", 1)
+    assert age < 60
+
+
+def test_stale_value_served_while_refreshing_in_background():
+    cache = StaleWhileRevalidateCache("test", fresh_ttl=0.01, max_stale=60)
+    loader = Loader("v1", "v2", delay=0.02)
+
+    async def scenario():
+        await cache.get("k", loader)
+        await asyncio.sleep(0.02)
+        stale = await asyncio.gather(cache.get("k", loader), cache.get("k", loader))
+        await asyncio.sleep(0.05)  # termina el refresco de fondo
+        refreshes = loader.calls - 1
+        fresh = await cache.get("k", loader)
+        return stale, fresh, refreshes
+
+    stale, (fresh, _), refreshes = asyncio.run(scenario())
+    assert [value for value, _ in stale] == ["v1", "v1"]
+    assert all(age > 0 for _, age in stale)
+    assert refreshes == 1  # un solo refresco para los dos lectores obsoletos
+    assert fresh == "v2"
+
+
+def test_failed_refresh_keeps_last_good_value():
+    cache = StaleWhileRevalidateCache("test", fresh_ttl=0.01, max_stale=60)
+    loader = Loader("v1", RuntimeError("runbook caído"), "v3")
+
+    async def scenario():
+        await cache.get("k", loader)
+        await asyncio.sleep(0.02)
+        stale, _ = await cache.get("k", loader)
+        await asyncio.sleep(0.01)
+        again, _ = await cache.get("k", loader)
+        return stale, again
+
+    stale, again = asyncio.run(scenario())
+    assert (stale, again) == ("v1", "v1")  # el fallo no reemplazó la entrada
+
+
+def test_too_old_entry_blocks_on_loader_and_errors_propagate():
+    cache = StaleWhileRevalidateCache("test", fresh_ttl=0.01, max_stale=0.02)
+    loader = Loader("v1", RuntimeError("caído"), "v3")
+
+    async def scenario():
+        await cache.get("k", loader)
+        await asyncio.sleep(0.03)
+        with pytest.raises(RuntimeError):
+            await cache.get("k", loader)
+        return await cache.get("k", loader)
+
+    value, age = asyncio.run(scenario())
+    assert (value, age) == ("v3", 0.0)
@@ -0,0 +1,123 @@
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import src.services.data_analyst as data_analyst_module
+from src.services.data_analyst import DataAnalyst
+from src.services.hr_snapshot import HRSnapshot
+from src.services.risk_scoring import LEVELS, level_codes, score_arrays, score_employee
+from src.services.ticket_counters import TicketCounters
+from src.services.ticket_store import TicketStore
+
+CSV = """Employee_Name,EmpID,Department,ManagerName,EmpSatisfaction,Average_Monthly_Hours,Email
+Quemado,1,IT/IS,Simon Roup,1,250,quemado@empresa.com
+Cansado,2,IT/IS,Simon Roup,4,210,cansado@empresa.com
+Tranquilo,3,Sales  ,Lynn Daneault,5,150,tranquilo@empresa.com
+Incidencias,4,Sales,Lynn Daneault,2,150,incidencias@empresa.com
+"""
+
+
+def test_vectorized_rules_match_scalar_rules():
+    rng = np.random.default_rng(0)
+    satisfaction = rng.integers(1, 6, 500).astype(float)
+    hours = rng.normal(190, 30, 500)
+    tickets = rng.poisson(2, 500)
+
+    scores = score_arrays(satisfaction, hours, tickets)
+    levels = level_codes(scores)
+    for i in range(500):
+        score, level, _ = score_employee(satisfaction[i], hours[i], int(tickets[i]))
+        assert (int(scores[i]), LEVELS[levels[i]]) == (score, level)
+
+
+class FakeTicketStore:
+    def __init__(self, counts=None, error=None):
+        self.counts, self.error = counts or {}, error
+
+    def count_recent_by_user(self, days=7):
+        if self.error:
+            raise self.error
+        return self.counts
+
+    def count_recent_tickets(self, user_identifier, days=7):
+        if self.error:
+            raise self.error
+        return self.counts.get(user_identifier, 0)
+
+
+@pytest.fixture
+def analyst():
+    analyst = object.__new__(DataAnalyst)
+    analyst.version = 1
+    analyst.snapshot = HRSnapshot.from_csv(io.StringIO(CSV))
+    return analyst
+
+
+def test_workforce_risk_rollup_by_department(analyst, monkeypatch):
+    monkeypatch.setattr(data_analyst_module, "ticket_store", FakeTicketStore({"INCIDENCIAS@empresa.com": 2, "4": 1}))
+    report = analyst.get_workforce_risk(group_by="department", top=2)
+
+    assert report["ticket_data_available"] is True
+    assert report["summary"] == {"employees": 4, "avg_risk_score": 40.0, "critical": 2, "medium": 1, "low": 1}
+    groups = {g["name"]: g for g in report["groups"]}
+    assert set(groups) == {"IT/IS", "Sales"}  # "Sales  " se une a "Sales"
+    assert (groups["IT/IS"]["critical"], groups["Sales"]["critical"]) == (1, 1)
+    assert [p["name"] for p in report["top_at_risk"]] == ["Quemado", "Incidencias"]
+    assert report["top_at_risk"][1]["recent_tickets"] == 3  # email y EmpID del mismo empleado se suman
+
+
+def test_workforce_risk_filters_team(analyst, monkeypatch):
+    monkeypatch.setattr(data_analyst_module, "ticket_store", FakeTicketStore())
+    report = analyst.get_workforce_risk(group_by="manager", manager=" simon roup")
+    assert report["summary"]["employees"] == 2
+    assert [g["name"] for g in report["groups"]] == ["Simon Roup"]
+    assert "error" in analyst.get_workforce_risk(manager="Nadie")
+    assert "error" in analyst.get_workforce_risk(group_by="planta")
+
+
+def test_workforce_risk_flags_missing_ticket_data(analyst, monkeypatch):
+    monkeypatch.setattr(data_analyst_module, "ticket_store", FakeTicketStore(error=RuntimeError("Cosmos caído")))
+    report = analyst.get_workforce_risk()
+    assert report["ticket_data_available"] is False
+    assert "Cosmos caído" in report["ticket_data_error"]
+    assert report["summary"]["employees"] == 4
+
+
+def test_profile_flags_missing_ticket_data(analyst, monkeypatch):
+    monkeypatch.setattr(data_analyst_module, "ticket_store", FakeTicketStore({"incidencias@empresa.com": 3}))
+    profile = analyst.get_contextual_risk_profile("incidencias@empresa.com")
+    assert (profile["active_tickets_count"], profile["ticket_data_available"]) == (3, True)
+
+    monkeypatch.setattr(data_analyst_module, "ticket_store", FakeTicketStore(error=RuntimeError("Cosmos caído")))
+    profile = analyst.get_contextual_risk_profile("incidencias@empresa.com")
+    assert profile["ticket_data_available"] is False
+    assert profile["active_tickets_count"] is None  # desconocido, no "cero tickets"
+    assert "Cosmos caído" in profile["ticket_data_error"]
+
+
+def test_count_recent_by_user_aggregates_projected_rows_client_side(make_container):
+    now = datetime.utcnow()
+    container = make_container("user_id")
+    for i, (user, days_ago) in enumerate([("Ana@x.com", 1), ("ana@x.com", 2), ("10026", 0), ("10026", 30)]):
+        container.create_item({"id": f"t{i}", "user_id": user, "created_at": (now - timedelta(days=days_ago)).isoformat()})
+    queries = []
+
+    def by_date(query, parameters, docs):
+        queries.append(query)
+        limit = next(p["value"] for p in parameters if p["name"] == "@date_limit")
+        return [{"user_id": d["user_id"]} for d in docs if d["created_at"] >= limit]
+
+    container.query_filter = by_date
+    store = object.__new__(TicketStore)
+    store.container = container
+    store.counters = TicketCounters()  # sin sincronizar: responde Cosmos
+
+    # Claves exactas (partition key); el cruce con HR normaliza el email
+    assert store.count_recent_by_user(days=7) == {"Ana@x.com": 1, "ana@x.com": 1, "10026": 1}
+    assert "GROUP BY" not in queries[0] and queries[0].startswith("SELECT c.user_id FROM c")
+
+    store.container = None
+    with pytest.raises(RuntimeError):
+        store.count_recent_by_user(days=7)
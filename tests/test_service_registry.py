@@ -0,0 +1,49 @@
+import asyncio
+import threading
+import time
+
+from src.services.service_registry import DEGRADED, READY, ServiceRegistry
+
+
+def test_aget_builds_off_the_event_loop():
+    registry = ServiceRegistry()
+    built_on = []
+
+    def slow_factory():
+        built_on.append(threading.current_thread())
+        time.sleep(0.3)
+        return object()
+
+    registry.register("lento", slow_factory)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        instance = await registry.aget("lento")
+        task.cancel()
+        return instance, ticks
+
+    instance, ticks = asyncio.run(scenario())
+    assert instance is registry.get("lento")
+    assert built_on[0] is not threading.main_thread()
+    assert ticks >= 10  # el loop siguió atendiendo mientras se construía
+
+
+def test_non_critical_degraded_service_keeps_ready():
+    registry = ServiceRegistry()
+    registry.register("critico", lambda: object())
+    registry.register("opcional", lambda: object(), ready_check=lambda s: False, critical=False)
+    registry.get("critico")
+    registry.get("opcional")
+
+    status = registry.status()
+    assert status["services"]["critico"]["state"] == READY
+    assert status["services"]["opcional"]["state"] == DEGRADED
+    assert status["ready"] is True
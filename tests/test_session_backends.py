@@ -0,0 +1,158 @@
+import pytest
+from semantic_kernel.contents import AuthorRole, ChatHistory
+
+from src.services.session_backends import (
+    CosmosSessionBackend,
+    SessionBackend,
+    SessionConflict,
+    SQLiteSessionBackend,
+)
+from src.services.session_store import (
+    MAX_COMMIT_ATTEMPTS,
+    SESSION_COMMIT_FAILURES,
+    BackendSessionStore,
+    InMemorySessionStore,
+)
+
+
+def only_messages(query, parameters, docs):
+    return [d for d in docs if d.get("type") == "msg"]
+
+
+@pytest.fixture(params=["sqlite", "cosmos"])
+def backend(request, tmp_path, make_container):
+    if request.param == "sqlite":
+        return SQLiteSessionBackend(tmp_path / "sessions.db")
+    container = make_container("session_key")
+    container.query_filter = only_messages
+    return CosmosSessionBackend(container=container)
+
+
+def make_store(backend) -> BackendSessionStore:
+    return BackendSessionStore(backend, InMemorySessionStore(
+        max_sessions=10, idle_ttl_seconds=3600, max_messages=100, max_bytes=1_000_000,
+    ))
+
+
+def texts(history: ChatHistory):
+    return [m.content for m in history.messages]
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        SessionBackend()
+
+
+def test_commit_and_load_delta(backend):
+    v1 = backend.commit("s", None, [(0, '{"role":"user","items":[]}'), (1, '{"role":"assistant","items":[]}')], [])
+    assert v1 == 1
+    v2 = backend.commit("s", v1, [(2, '{"role":"user","items":[]}')], [0])
+    assert backend.head("s") == v2 == 2
+    version, rows = backend.load("s")
+    assert version == 2
+    assert [seq for seq, _ in rows] == [1, 2]
+
+
+def test_stale_version_conflicts(backend):
+    backend.commit("s", None, [(0, "a")], [])
+    with pytest.raises(SessionConflict):
+        backend.commit("s", None, [(0, "b")], [])
+    assert backend.load("s") == (1, [(0, "a")])
+
+
+def test_cosmos_losing_writer_never_touches_winner(make_container):
+    container = make_container("session_key")
+    container.query_filter = only_messages
+    winner, loser = CosmosSessionBackend(container=container), CosmosSessionBackend(container=container)
+    winner.commit("s", None, [(0, "system")], [])
+
+    # El perdedor lee la cabecera v1 y, antes de publicar la suya, el ganador confirma v2 con los mismos seqs
+    container.before_replace = lambda: winner.commit("s", 1, [(1, "ganador")], [])
+    with pytest.raises(SessionConflict):
+        loser.commit("s", 1, [(1, "perdedor")], [])
+
+    assert winner.load("s") == (2, [(0, "system"), (1, "ganador")])
+    payloads = {d.get("payload") for d in container.docs.values()}
+    assert "perdedor" not in payloads  # el perdedor limpió sus documentos
+
+
+def test_cosmos_reads_legacy_heads(make_container):
+    container = make_container("session_key")
+    container.query_filter = only_messages
+    container.create_item({"id": "head", "session_key": "s", "type": "head", "version": 1})
+    container.create_item({"id": "msg-00000000", "session_key": "s", "type": "msg", "seq": 0, "payload": "a"})
+    backend = CosmosSessionBackend(container=container)
+
+    backend.commit("s", 1, [(1, "b")], [0])
+    assert backend.load("s") == (2, [(1, "b")])
+    assert ("s", "msg-00000000") not in container.docs
+
+
+def test_store_rebases_on_conflict(backend):
+    first, second = make_store(backend), make_store(backend)
+    history = ChatHistory()
+    history.add_system_message("sistema")
+    history.add_user_message("hola")
+    first.put("s", history)
+
+    a, b = second.get("s"), first.get("s")
+    a.add_assistant_message("respuesta de worker 2")
+    second.put("s", a)
+    b.add_assistant_message("respuesta de worker 1")
+    first.put("s", b)  # versión obsoleta -> conflicto -> recarga y reaplica solo lo nuevo
+
+    assert first.stats()["conflicts"] == 1
+    final = make_store(backend).get("s")
+    assert texts(final) == ["sistema", "hola", "respuesta de worker 2", "respuesta de worker 1"]
+    assert [m.role for m in final.messages][:2] == [AuthorRole.SYSTEM, AuthorRole.USER]
+
+
+class RacingBackend(SessionBackend):
+    """Delegado que, antes de cada commit, deja que otro worker escriba primero (`races` veces)."""
+
+    def __init__(self, inner, rival, races):
+        self.inner, self.rival, self.races = inner, rival, races
+
+    def head(self, session_key):
+        return self.inner.head(session_key)
+
+    def load(self, session_key):
+        return self.inner.load(session_key)
+
+    def commit(self, session_key, expected_version, appended, removed):
+        if self.races:
+            self.races -= 1
+            history = self.rival.get(session_key)
+            history.add_assistant_message(f"rival {self.races}")
+            self.rival.put(session_key, history)
+        return self.inner.commit(session_key, expected_version, appended, removed)
+
+
+def racing_store(backend, races):
+    seed = make_store(backend)
+    history = ChatHistory()
+    history.add_user_message("hola")
+    seed.put("s", history)
+    store = make_store(RacingBackend(backend, make_store(backend), races))
+    return store, store.get("s")
+
+
+def test_store_retries_repeated_conflicts(backend):
+    store, history = racing_store(backend, races=2)
+    history.add_assistant_message("mi respuesta")
+    store.put("s", history)
+
+    assert (store.stats()["conflicts"], store.stats()["lost_turns"]) == (2, 0)
+    assert texts(make_store(backend).get("s")) == ["hola", "rival 1", "rival 0", "mi respuesta"]
+
+
+def test_store_reports_turn_lost_after_exhausting_retries(backend):
+    store, history = racing_store(backend, races=MAX_COMMIT_ATTEMPTS)
+    failures = SESSION_COMMIT_FAILURES.value("conflict")
+    history.add_assistant_message("mi respuesta")
+    store.put("s", history)
+
+    assert store.stats()["conflicts"] == MAX_COMMIT_ATTEMPTS
+    assert store.stats()["lost_turns"] == 1
+    assert SESSION_COMMIT_FAILURES.value("conflict") - failures == 1
+    assert "mi respuesta" not in texts(make_store(backend).get("s"))
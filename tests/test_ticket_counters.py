@@ -0,0 +1,111 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.services.ticket_counters import TicketCounters, window_start
+from src.services.ticket_store import MAX_SYNC_FAILURES, TicketStore, _user_query
+
+
+def ticket(doc_id, user_id="ana@x.com", created_at=None):
+    return {"id": doc_id, "user_id": user_id, "created_at": (created_at or datetime.utcnow()).isoformat()}
+
+
+def test_record_dedups_and_counts_calendar_window():
+    counters = TicketCounters(retention_days=30)
+    start = window_start(7)
+
+    assert counters.record(ticket("a", created_at=start))
+    assert counters.record(ticket("b"))
+    assert not counters.record(ticket("b"))  # mismo documento (upsert / change feed): no suma
+    assert counters.record(ticket("c", created_at=start - timedelta(seconds=1)))  # fuera de la ventana de 7 días
+    assert not counters.record({"id": "d", "user_id": "ana@x.com"})  # sin created_at
+    assert not counters.record(ticket("e", created_at=datetime.utcnow() - timedelta(days=40)))  # fuera de retención
+
+    assert counters.count("ana@x.com", days=7) == 2
+    assert counters.count("ana@x.com", days=8) == 3
+    assert counters.count("ANA@x.com", days=7) == 0  # misma clave exacta que la partition key de Cosmos
+    assert counters.counts_by_user(days=7) == {"ana@x.com": 2}
+
+
+def test_prune_drops_days_outside_retention():
+    counters = TicketCounters(retention_days=3)
+    counters.record(ticket("a"))
+    today = datetime.utcnow().date().toordinal()
+
+    counters._maybe_prune(today + 3)
+    assert counters.stats()["users"] == 0 and counters.stats()["tickets"] == 0
+
+
+def test_cosmos_queries_use_the_counters_window():
+    _, parameters = _user_query("ana@x.com", days=7, count=True)
+    assert parameters[-1] == {"name": "@date_limit", "value": window_start(7).isoformat()}
+    assert window_start(1).date() == datetime.utcnow().date()
+
+
+@pytest.fixture
+def make_store(make_container):
+    created = []
+
+    def factory(sync_interval=60):
+        store = object.__new__(TicketStore)
+        store.container = make_container("user_id")
+        store.counters = TicketCounters(retention_days=30)
+        store.sync_interval = sync_interval
+        store.last_sync_at = None
+        store._feed_continuation = None
+        store._sync_failures = 0
+        store._stop = threading.Event()
+        created.append(store)
+        return store
+
+    yield factory
+    for store in created:
+        store.close()
+
+
+def test_sync_rebuilds_then_applies_changes_from_feed_etag(make_store):
+    store = make_store()
+    store.container.create_item(ticket("a"))
+    store.container.create_item(ticket("b", user_id="10026"))
+
+    assert store.sync_counters() == 2
+    assert store.counters.ready
+    assert store._feed_continuation == "2"
+
+    store.container.create_item(ticket("c"))  # escrito por otra instancia
+    store.container.upsert_item(ticket("a"))  # reaparece en el feed: no cuenta dos veces
+    assert store.sync_counters() == 1
+    assert store._feed_continuation == "4"
+    assert store.count_recent_tickets("ana@x.com") == 2
+    assert store.count_recent_by_user() == {"ana@x.com": 2, "10026": 1}
+
+
+def test_repeated_sync_failures_fall_back_to_cosmos_until_rebuilt(make_store):
+    store = make_store(sync_interval=0.01)
+    store.container.create_item(ticket("a"))
+    store.sync_counters()
+    store.container.feed_error = RuntimeError("feed caído")
+    store.container.query_filter = lambda query, parameters, docs: [len(docs)] if "COUNT" in query else docs
+
+    syncer = threading.Thread(target=store._run_counter_sync, daemon=True)
+    syncer.start()
+    deadline = time.monotonic() + 5
+    while store.counters.ready and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert not store.counters.ready
+    assert store._sync_failures >= MAX_SYNC_FAILURES
+    assert store._feed_continuation is None
+    store.container.create_item(ticket("b"))  # invisible para los contadores, visible para Cosmos
+    assert store.count_recent_tickets("ana@x.com") == 2
+
+    store.container.feed_error = None
+    while not store.counters.ready and time.monotonic() < deadline:
+        time.sleep(0.01)
+    store.close()
+    syncer.join(timeout=2)
+
+    assert store.counters.ready and store._sync_failures == 0
+    assert store.counters.count("ana@x.com") == 2
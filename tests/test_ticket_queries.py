@@ -0,0 +1,94 @@
+import pytest
+
+from src.services.ticket_store import TicketStore, _user_query
+
+
+def test_user_query_projection_count_and_order():
+    query, parameters = _user_query("10026", fields=["id", "status", "id"], order=True)
+    assert query == "SELECT c.id, c.status FROM c WHERE c.user_id = @user_id ORDER BY c.created_at DESC"
+    assert parameters == [{"name": "@user_id", "value": "10026"}]
+
+    query, parameters = _user_query(10026, days=7, count=True, order=True)
+    assert query == "SELECT VALUE COUNT(1) FROM c WHERE c.user_id = @user_id AND c.created_at >= @date_limit"
+    assert parameters[0]["value"] == "10026"
+
+    with pytest.raises(ValueError):
+        _user_query("10026", fields=["id", "status) FROM c --"])
+
+
+class FakePager:
+    """Imita el ItemPaged.by_page del SDK: una página por next(); continuation_token apunta a la siguiente."""
+
+    def __init__(self, pages, start, fail_at):
+        self.pages, self.index, self.fail_at = pages, int(start or 0), fail_at
+        self.continuation_token = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.index >= len(self.pages):
+            raise StopIteration
+        if self.index == self.fail_at:
+            raise ConnectionError("Cosmos 503")
+        page = self.pages[self.index]
+        self.index += 1
+        self.continuation_token = str(self.index) if self.index < len(self.pages) else None
+        return iter(page)
+
+
+class PagedContainer:
+    def __init__(self, pages, fail_at=None):
+        self.pages, self.fail_at = pages, fail_at
+        self.requests = []
+
+    def query_items(self, query, parameters, partition_key, max_item_count):
+        self.requests.append((partition_key, max_item_count))
+        container = self
+
+        class Query:
+            def by_page(self, continuation=None):
+                return FakePager(container.pages, continuation, container.fail_at)
+
+        return Query()
+
+
+def store_with(container):
+    store = object.__new__(TicketStore)
+    store.container = container
+    return store
+
+
+def test_iter_tickets_follows_continuations_lazily():
+    container = PagedContainer([[{"id": "1"}, {"id": "2"}], [{"id": "3"}], [{"id": "4"}]])
+    store = store_with(container)
+
+    assert [t["id"] for t in store.iter_tickets("u1", page_size=2)] == ["1", "2", "3", "4"]
+    assert container.requests == [("u1", 2)] * 3
+
+    container.requests.clear()
+    first = next(store.iter_tickets("u1"))
+    assert first["id"] == "1" and len(container.requests) == 1  # solo se pidió la primera página
+
+
+def test_iter_tickets_raises_instead_of_truncating():
+    store = store_with(PagedContainer([[{"id": "1"}], [{"id": "2"}], [{"id": "3"}]], fail_at=1))
+    seen = []
+    with pytest.raises(ConnectionError):
+        for item in store.iter_tickets("u1"):
+            seen.append(item["id"])
+    assert seen == ["1"]
+
+    with pytest.raises(RuntimeError):
+        store_with(None).get_tickets_page("u1")
+
+
+def test_count_tickets_raises_instead_of_returning_zero():
+    class FailingContainer:
+        def query_items(self, **kwargs):
+            raise ConnectionError("Cosmos 503")
+
+    with pytest.raises(ConnectionError):
+        store_with(FailingContainer()).count_tickets("u1", days=7)
+    with pytest.raises(RuntimeError):
+        store_with(None).count_tickets("u1")